@@ -1,10 +1,75 @@
 from typing import Dict, List, Optional, Set  # Used for static typing to reduce errors
 
+import argparse
 import os
 import pandas as pd
-from abs_time import (
-    abs_time,
-)  # Function that converts time and date into a minutes time scale that i can compare
+from absolute_time import (
+    add_absolute_times,
+    add_calendar_times,
+)  # Functions that convert time and date columns into minute scales that i can compare
+from ingest import (
+    find_export,
+    read_subscriptions,
+    read_transactions,
+)  # Functions that read the UTF-16 exports into filtered data frames
+from detection import (
+    EVIDENCE_COLUMNS,
+    attach_evidence,
+    sweep_sorted,
+)  # Counts violations for several grace periods and finds each violation's anchor
+from registry import (
+    active_subscriptions,
+    backfill_user_ids,
+    key_subscribers,
+    plate_owners,
+    plate_tiers,
+    registration_dates,
+    subscription_intervals,
+)  # Vectorized registry helpers (User Id back-fill, subscription tiers and intervals)
+from api import (
+    SPOOL_DIR_NAME,
+    pull_subscriptions,
+    pull_transactions,
+)  # Pulls both tables from the operator's paginated API instead of the exports
+from checkpoint import (
+    CHECKPOINT_DIR_NAME,
+    STAGES,
+    Checkpoints,
+)  # Saves the state after each stage so a failed run can resume
+from dataset import (
+    DATASET_DIR_NAME,
+    LOOKBACK_DAYS,
+    TransactionDataset,
+    in_window,
+)  # Month-partitioned dataset of the cleaned transactions, read by date range
+from validation import (
+    validate_transactions,
+)  # Checks every transaction in bulk and sets the malformed ones aside
+from identity import (
+    account_keys,
+    resolve_identities,
+)  # Links the accounts of one person through their phone number and User Id
+from sessions import (
+    sessionize,
+)  # Merges split visits of the same plate into one parking session
+from ledger import (
+    LEDGER_NAME,
+    ViolationLedger,
+)  # Remembers the violations reported by earlier runs
+from leaderboard import (
+    LEADERBOARD_NAME,
+    RANKINGS,
+    TOP_K,
+    Leaderboard,
+)  # Keeps the worst repeat offenders in a bounded heap while detection runs
+from heatmap import (
+    HEATMAP_NAME,
+    violation_heatmap,
+)  # Counts the violations per hour of the week, per site and tier
+from summary import (
+    daily_summary,
+    write_summary,
+)  # Aggregates the flagged transactions by (user, day, site)
 from User import User  # Class to encapsulate users and all thier transactions
 
 
@@ -40,271 +105,472 @@ class AnsiColors:
 # to be parked concurrently, the second transaction is marked as "delinquent."
 
 
+# ==================================================================================
+#  OPTIONS: Configure the run from the command line
+# ==================================================================================
+
+parser = argparse.ArgumentParser(
+    description="Flag parking transactions that violate the one-vehicle rule."
+)
+# Gate timestamps drift by a few minutes, so short overlaps can be tolerated
+parser.add_argument(
+    "--grace",
+    type=int,
+    default=0,
+    help="minutes two stays may overlap before it counts as a violation (default: 0)",
+)
+# What-if mode: compare several grace periods without rerunning the pipeline
+parser.add_argument(
+    "--what-if",
+    type=lambda text: [int(minutes) for minutes in text.split(",")],
+    default=None,
+    metavar="MINUTES",
+    help="comma separated grace periods to compare, e.g. 0,5,15,30,60",
+)
+# Merge split visits of the same plate into one session before detection
+parser.add_argument(
+    "--session-gap",
+    type=int,
+    default=None,
+    metavar="MINUTES",
+    help="merge each plate's visits separated by less than this many minutes",
+)
+# Group the transactions of accounts that belong to the same person (identity.py)
+parser.add_argument(
+    "--resolve-identities",
+    action="store_true",
+    help="treat accounts linked by a phone number or User Id as one user",
+)
+# Size and metric of the repeat-offender leaderboard
+parser.add_argument(
+    "--top",
+    type=int,
+    default=TOP_K,
+    metavar="K",
+    help=f"number of users in the leaderboard (default: {TOP_K})",
+)
+parser.add_argument(
+    "--rank-by",
+    choices=RANKINGS,
+    default="Violations",
+    help="metric the leaderboard ranks users by (default: Violations)",
+)
+# Pull the data from the operator API instead of the UTF-16 exports in data/
+parser.add_argument(
+    "--api",
+    default=None,
+    metavar="URL",
+    help="base URL of the operator API to pull transactions and subscriptions from",
+)
+parser.add_argument(
+    "--api-offsets",
+    action="store_true",
+    help="the API accepts the offset parameter, so pages are fetched in parallel",
+)
+# Only process the transactions whose visit started in a date range
+parser.add_argument(
+    "--from",
+    dest="date_from",
+    type=pd.Timestamp,
+    default=None,
+    metavar="DATE",
+    help="first visit start date to process, e.g. 3/1/2025",
+)
+parser.add_argument(
+    "--to",
+    dest="date_to",
+    type=pd.Timestamp,
+    default=None,
+    metavar="DATE",
+    help="last visit start date to process, e.g. 3/31/2025",
+)
+parser.add_argument(
+    "--lookback",
+    type=int,
+    default=LOOKBACK_DAYS,
+    metavar="DAYS",
+    help=f"days read before --from as anchors for stays crossing it (default: {LOOKBACK_DAYS})",
+)
+# Ignore the checkpoints of earlier runs and run every stage again
+parser.add_argument(
+    "--fresh",
+    action="store_true",
+    help="do not resume from the checkpoints of an earlier run",
+)
+options = parser.parse_args()
+
+
 # ==================================================================================
 #  SECTION 1: Convert the CSV data to Data Frames that are processable
 # ==================================================================================
 
-# Select only the necessary columns from the transaction data to improve performance.
+# The exports are UTF-16 encoded. `ingest` transcodes each plain file once into a cached
+# UTF-8 copy (memoized by the file's fingerprint) so that the fastest available
+# CSV engine can be used; compressed exports are parsed straight from the decompressed
+# stream. Then it keeps only the sites and enterprises we analyze.
 path = os.getcwd()
 path_of_read: str = path + "/data/"
-transaction_data: pd.DataFrame = pd.read_csv(
-    (path_of_read + "transaction_data.csv"),
-    usecols=[
-        "Site Internal Name",
-        "Visit Start Date (local)",
-        "Visit Start Time (local)",
-        "Visit End Date (local)",
-        "Visit End Time (local)",
-        "Visit Duration (minutes)",
-        "Vehicle License Plate",
-        "License Plate State",
-        "User Id",
-        "User Registered Date",
-        "Subscription Status",
-    ],
-    encoding="UTF-16",
-    low_memory=False,
-)
-
-# Read the enterprise subscription data
-enterprise_subscription_data: pd.DataFrame = pd.read_csv(
-    path_of_read + "enterprise_subscription_detail.csv",
-    encoding="UTF-16",
-)
 
+# Define the output directory for the final reports (and the checkpoints).
+path_of_write: str = path + "/output/"
 
-# Filter out the columns names to   the sites we are interested in
-# Only 1st Vehicle and Additional Vehicle is considered in the analysis
-# TODO: Remove Additional Veshicle
-enterprise_subscription_data = enterprise_subscription_data[
-    (
-        enterprise_subscription_data["Enterprise Name"]
-        == "Kellogg Square Residents - 1 st Vehicle"
+# With `--api` both tables are pulled first (an interrupted pull resumes from its last
+# cursor). The pages are spooled to disk, and the spool files stand in for the exports.
+input_paths: List[str] = [
+    find_export(path_of_read, "transaction_data.csv"),
+    find_export(path_of_read, "enterprise_subscription_detail.csv"),
+]
+if options.api:
+    pulled_transactions: pd.DataFrame = pull_transactions(
+        options.api, path_of_read, options.api_offsets
     )
-    | (
-        enterprise_subscription_data["Enterprise Name"]
-        == "Kellogg Square Residents -Additional Vehicle"
+    pulled_subscriptions: pd.DataFrame = pull_subscriptions(
+        options.api, path_of_read, options.api_offsets
     )
-]
+    input_paths = [
+        path_of_read + SPOOL_DIR_NAME + "/transactions.jsonl",
+        path_of_read + SPOOL_DIR_NAME + "/subscriptions.jsonl",
+    ]
+
+# The state after each stage is checkpointed, keyed by the fingerprints of both
+# inputs and by the options each stage depends on.
+checkpoints = Checkpoints(
+    path_of_write + CHECKPOINT_DIR_NAME,
+    input_paths,
+    {
+        "ingest": {
+            "session_gap": options.session_gap,
+            "from": options.date_from,
+            "to": options.date_to,
+            "lookback": options.lookback,
+        },
+        "grouping": {"resolve_identities": options.resolve_identities},
+        "detection": {
+            "grace": options.grace,
+            "what_if": options.what_if,
+            "top": options.top,
+            "rank_by": options.rank_by,
+        },
+    },
+)
 
-# Reset the index so that we can use index based looping across the data frame
-enterprise_subscription_data = enterprise_subscription_data.reset_index(drop=True)
+# Resume from the last stage saved by an earlier run, unless `--fresh` is given.
+# The variables saved by that run are restored as they were.
+stages_done, resumed_state = (0, {}) if options.fresh else checkpoints.resume()
+globals().update(resumed_state)
 
+# Names of the variables saved in the checkpoints. Every stage adds the variables it
+# builds, so the checkpoint of a stage holds everything the later stages need.
+checkpointed_names: List[str] = list(resumed_state)
 
-# Transient transactions are short parking stays the user already paid for
-transaction_data = transaction_data[
-    (
-        transaction_data["Subscription Status"] != "Transient"
-    )  # Remove transient transactions
-    & (
-        (
-            transaction_data[
-                "Site Internal Name"
-            ]  # Filter the parking sites we are interested in
-            == "Kellogg Square Reserved Nest (Minneapolis"
-        )
-        | (
-            transaction_data["Site Internal Name"]
-            == "Kellogg Square Garage (Minneapolis"
-        )
-    )
-]
 
-# Reset the index so that we can use index based looping across the data frame
-transaction_data = transaction_data.reset_index(drop=True)
+def save_checkpoint(stage: str, names: List[str]) -> None:
+    """Adds `names` to the checkpointed variables and saves them after `stage`."""
+    checkpointed_names.extend(name for name in names if name not in checkpointed_names)
+    checkpoints.save(stage, {name: globals()[name] for name in checkpointed_names})
 
 
-# Assert that both transaction_data and enterprise_subscription_data are instances of a data frame before continuing
-# Although filtering a data frame returns a data frame, this code is just to be safe
-assert isinstance(transaction_data, pd.DataFrame), (
-    "Filtering did not return a DataFrame!"
-)
-assert isinstance(enterprise_subscription_data, pd.DataFrame), (
-    "Filtering did not return a DataFrame!"
+if stages_done > 0:
+    print(f"Resuming after the {STAGES[stages_done - 1]} stage")
+
+# The validated transactions are kept in a month-partitioned dataset, rebuilt when the
+# export changes. With `--from`/`--to` and a current dataset only the partitions of the
+# range (and of the lookback before it) are read instead of the whole export.
+date_range: bool = options.date_from is not None or options.date_to is not None
+read_from = (
+    None
+    if options.date_from is None
+    else options.date_from - pd.Timedelta(days=options.lookback)
 )
+dataset = TransactionDataset(path_of_read + DATASET_DIR_NAME, input_paths[0])
+if stages_done < 1:
+    from_dataset: bool = date_range and dataset.is_current()
+
+if stages_done < 1 and from_dataset:
+    transaction_data: pd.DataFrame = dataset.read(read_from, options.date_to)
+    enterprise_subscription_data: pd.DataFrame = (
+        pulled_subscriptions if options.api else read_subscriptions(path_of_read)
+    )
+
+elif stages_done < 1 and options.api:
+    # The pulled pages were already filtered like the exports are below
+    transaction_data: pd.DataFrame = pulled_transactions
+    enterprise_subscription_data: pd.DataFrame = pulled_subscriptions
+
+elif stages_done < 1:
+    # Only the necessary columns are read from the transaction data to improve performance.
+    # Transient transactions and transactions at other sites are filtered out.
+    transaction_data: pd.DataFrame = read_transactions(path_of_read)
+
+    # Read the enterprise subscription data
+    # Only 1st Vehicle and Additional Vehicle is considered in the analysis
+    enterprise_subscription_data: pd.DataFrame = read_subscriptions(path_of_read)
+
+if stages_done < 1:
+    # Assert that both transaction_data and enterprise_subscription_data are instances of a data frame before continuing
+    # Although filtering a data frame returns a data frame, this code is just to be safe
+    assert isinstance(transaction_data, pd.DataFrame), (
+        "Filtering did not return a DataFrame!"
+    )
+    assert isinstance(enterprise_subscription_data, pd.DataFrame), (
+        "Filtering did not return a DataFrame!"
+    )
 
+    # Number of transactions read, before validation and merging split visits into sessions
+    transactions_read: int = len(transaction_data)
+
+    # A single malformed time used to abort the whole run inside `abs_time`. Every row is
+    # now checked up front; the malformed ones (bad or missing times, a visit ending before
+    # it starts, a duration that does not match the times) are quarantined with a reason
+    # code and written to "Quarantine.csv" at the end, and the run continues without them.
+    transaction_data, quarantined_transactions = validate_transactions(transaction_data)
+
+    # A new export rebuilds the dataset, then the date range is selected in memory
+    if not from_dataset:
+        if not dataset.is_current():
+            dataset.build(transaction_data)
+        if date_range:
+            transaction_data = transaction_data[
+                in_window(
+                    transaction_data["Visit Start Date (local)"],
+                    read_from,
+                    options.date_to,
+                )
+            ].reset_index(drop=True)
+
+    # The LPR system often logs one real stay as two transactions (an exit and a re-entry
+    # a few minutes apart, or a move between the two Kellogg sites). With `--session-gap`
+    # each plate's transactions separated by less than the gap are merged into one session
+    # before grouping, so each real stay is a single anchor in Section 4.
+    if options.session_gap is not None:
+        transaction_data = sessionize(
+            add_calendar_times(add_absolute_times(transaction_data)),
+            options.session_gap,
+        )
+
+    save_checkpoint(
+        "ingest",
+        [
+            "transaction_data",
+            "enterprise_subscription_data",
+            "quarantined_transactions",
+            "transactions_read",
+            "from_dataset",
+        ],
+    )
 
 # ===================================================================================
 # SECTION 2: Organize the Data and transactions made by the subscribed users
 # ===================================================================================
 
-# ------------- List of Collections to organize users and their transactions ----------------
+# Stage "registry" (skipped when resuming from its checkpoint)
+if stages_done < 2:
+    # ------------- List of Collections to organize users and their transactions ----------------
 
-# A dictionary mapping user emails (str) to their corresponding User object.
-# This registry is populated by the `add_user` function.
-users_by_email: Dict[str, User] = {}
+    # A dictionary mapping user emails (str) to their corresponding User object.
+    # This registry is populated by the `add_user` function.
+    users_by_email: Dict[str, User] = {}
 
-# A dictionary mapping each license plate to a set of user emails associated with it.
-# This is primarily used to detect if a single license plate is improperly registered
-# to more than one user account.
-plate_to_emails: Dict[str, Set[str]] = {}
+    # A dictionary mapping each license plate to a set of user emails associated with it.
+    # This is primarily used to detect if a single license plate is improperly registered
+    # to more than one user account.
+    plate_to_emails: Dict[str, Set[str]] = {}
 
-# A counter to keep track of the number of users without an email
-no_email_users: int = 0
+    # A counter to keep track of the number of users without an email
+    no_email_users: int = 0
 
-# A fallback registry for users who don't have an associated email.
-# - Key: License plate (str)
-# - Value: The User object instance.
-unidentified_users: Dict[str, User] = {}
+    # A fallback registry for users who don't have an associated email.
+    # - Key: License plate (str)
+    # - Value: The User object instance.
+    unidentified_users: Dict[str, User] = {}
 
+    def add_user(user: User, plate: str) -> None:
+        """
+        Registers a user and their license plate in either users_by_email or unidentified_users.
 
-def add_user(user: User, plate: str) -> None:
-    """
-    Registers a user and their license plate in either users_by_email or unidentified_users.
+        The function's behavior is determined by the user's email attribute
 
-    The function's behavior is determined by the user's email attribute
+        - If email exists: The user is added/updated in `users_by_email` dictionary
+        - If no email exists: The user is added to `unidentified_users` using the license plate as a key
 
-    - If email exists: The user is added/updated in `users_by_email` dictionary
-    - If no email exists: The user is added to `unidentified_users` using the license plate as a key
+        Args:
+            user (User): The user object to process.
+            plate (str): The license plate to associate with the user.
 
-    Args:
-        user (User): The user object to process.
-        plate (str): The license plate to associate with the user.
+        Returns:
+            None
 
-    Returns:
-        None
+        Side Effects:
+            - `users_by_email`: Adds a new user or updates an existing one.
+            - `plate_to_emails`: Adds the plate-to-email link for duplicate checks.
+            - `unidentified_users`: Adds the user if they have no email.
+            - `no_email_users`: Incremented if the user has no email.
+        """
 
-    Side Effects:
-        - `users_by_email`: Adds a new user or updates an existing one.
-        - `plate_to_emails`: Adds the plate-to-email link for duplicate checks.
-        - `unidentified_users`: Adds the user if they have no email.
-        - `no_email_users`: Incremented if the user has no email.
-    """
+        if user.email is not None:
+            # --- Handle users identified by an email address ---
 
-    if user.email is not None:
-        # --- Handle users identified by an email address ---
+            # If the user is new, add them to the main registry.
+            # Otherwise, add the new license plate to the existing user's record.
+            if user.email not in users_by_email:
+                users_by_email[user.email] = user
+            else:
+                users_by_email[user.email].add_license(plate)
 
-        # If the user is new, add them to the main registry.
-        # Otherwise, add the new license plate to the existing user's record.
-        if user.email not in users_by_email:
-            users_by_email[user.email] = user
-        else:
-            users_by_email[user.email].add_license(plate)
+            # Now, update the reverse-lookup table to track which emails use this plate.
+            # This is how we detect if one plate is improperly used by multiple accounts.
+            if plate in plate_to_emails:
+                plate_to_emails[plate].add(user.email)
+            else:
+                plate_to_emails[plate] = {user.email}
 
-        # Now, update the reverse-lookup table to track which emails use this plate.
-        # This is how we detect if one plate is improperly used by multiple accounts.
-        if plate in plate_to_emails:
-            plate_to_emails[plate].add(user.email)
         else:
-            plate_to_emails[plate] = {user.email}
-
-    else:
-        # --- Handle users without an email (identified by license plate) ---
-
-        # Add the user to the fallback dictionary keyed by their license plate.
-        unidentified_users[plate] = user
-
-
-# Process enterprise data to group all vehicles under their respective users.
-# After initial grouping, this also aggregates unidentified users by license plate
-# to validate that each plate is associated with only one user.
-for label, row in enterprise_subscription_data.iterrows():
-    # Extract and clean the license plate.
-    current_plate = str(row["Vehicle License Plate Text"]).strip()
-
-    # Check if the user email is missing in this record.
-    if pd.isna(row["User Email"]):  # type: # pyright: ignore
-        # If email is missing, create a placeholder User object.
-        # This user is identified only by their license plate for now.
-        current_user = User(
-            first=None,
-            last=None,
-            email=None,
-            number=None,
-            license=current_plate,
-            id_num=None,
-        )
-    else:
-        # If email exists, create a complete User object with all details.
-        current_user = User(
-            first=str(row["User First Name"]),
-            last=str(row["User Last Name"]),
-            email=str(row["User Email"]),
-            number=int(row["User Phone Number"]),
-            license=current_plate,
-        )
-
-    # Pass the user and plate to our main function to populate the global registries
-    # (users_by_email, plate_to_emails, unidentified_users)
-    add_user(current_user, current_plate)
-
-
-# If there are unidentified users that made a transaction then we can
-# get their User Id from the transaction data
+            # --- Handle users without an email (identified by license plate) ---
+
+            # Add the user to the fallback dictionary keyed by their license plate.
+            unidentified_users[plate] = user
+
+    # Process enterprise data to group all vehicles under their respective users.
+    # After initial grouping, this also aggregates unidentified users by license plate
+    # to validate that each plate is associated with only one user.
+    for label, row in enterprise_subscription_data.iterrows():
+        # Extract and clean the license plate.
+        current_plate = str(row["Vehicle License Plate Text"]).strip()
+
+        # Check if the user email is missing in this record.
+        if pd.isna(row["User Email"]):  # type: # pyright: ignore
+            # If email is missing, create a placeholder User object.
+            # This user is identified only by their license plate for now.
+            current_user = User(
+                first=None,
+                last=None,
+                email=None,
+                number=None,
+                license=current_plate,
+                id_num=None,
+            )
+        else:
+            # If email exists, create a complete User object with all details.
+            current_user = User(
+                first=str(row["User First Name"]),
+                last=str(row["User Last Name"]),
+                email=str(row["User Email"]),
+                number=int(row["User Phone Number"]),
+                license=current_plate,
+            )
+
+        # Pass the user and plate to our main function to populate the global registries
+        # (users_by_email, plate_to_emails, unidentified_users)
+        add_user(current_user, current_plate)
+
+    # The plate each transaction is grouped under.
+    # NOTE: A plate registered to several emails goes to the first one in the export
+    # (`plate_owners`), not to an arbitrary email of the set, so every run (and
+    # pipeline.py) groups it under the same user.
+    plate_to_key: Dict[str, str] = plate_owners(enterprise_subscription_data).to_dict()
+
+    # User Id for some reason isn't available in enterprise data and only available in transaction data.
+    # Each user's User Id is taken from the first transaction made with any of their plates,
+    # found for all users at once with a single drop_duplicates over the transactions.
+    # The same pass reports plates that were seen with more than one User Id.
+    user_ids, user_id_conflicts = backfill_user_ids(
+        transaction_data, pd.Series(plate_to_key, dtype="object")
+    )
 
-# This counter variable keeps count of the found users
-found_users: int = 0
+    # This counter variable keeps count of the unidentified users found in the transaction data
+    found_users: int = 0
 
+    for user_key, user_id in user_ids.items():
+        if user_key in users_by_email:
+            users_by_email[user_key].id = int(user_id)
+        else:
+            unidentified_users[user_key].id = int(user_id)
+            found_users += 1
 
-# Loop through the transaction data and group all the transactions by users
-# Also look for the user-name, email, and number for id-users
-for label, row in transaction_data.iterrows():
-    current_plate: str = str(row["Vehicle License Plate"])
-    current_user: Optional[User] = None
+    # A plate only belongs to a user while the subscription is valid: from the day the
+    # user registered, and for a removed subscription until the plate's next one starts.
+    # Between subscriptions starting the same day, the plate's key above wins.
+    subscription_windows: pd.DataFrame = subscription_intervals(
+        enterprise_subscription_data,
+        registration_dates(transaction_data, user_ids),
+        pd.Series(plate_to_key, dtype="object"),
+    )
 
-    # --------------Part 2---------------
-    # Check if the transaction was made by a user who is subscribed to the enterprise
+    save_checkpoint(
+        "registry",
+        [
+            "users_by_email",
+            "plate_to_emails",
+            "no_email_users",
+            "unidentified_users",
+            "plate_to_key",
+            "user_id_conflicts",
+            "found_users",
+            "subscription_windows",
+        ],
+    )
 
-    # First check if the current plate is associated with an email in our enterprise
-    if current_plate in plate_to_emails:
-        # Retrieve the user object via their email.
-        # NOTE: We take the first email from the set, assuming one plate maps to one primary user.
-        # If there are multiple emails associated with this license get a random email from the set
-        associated_email: str = next(iter(plate_to_emails[current_plate]))
-        current_user = users_by_email[associated_email]
 
-        # If this is the first time we saw the user
-        # get their User Id from transaction data
-        if current_user.id is None:
-            current_user.id = int(row["User Id"])
+# Stage "grouping" (skipped when resuming from its checkpoint)
+if stages_done < 3:
+    # The key of the user whose subscription covered each transaction's plate on its
+    # visit day (NaN if none did), matched for all transactions with one as-of join
+    subscriber_keys: pd.Series = active_subscriptions(
+        transaction_data, subscription_windows
+    )
 
-    # Then check if the transaction was made by an unidentified_users in our enterprise
-    elif current_plate in unidentified_users:
-        # Since we can get the User Id from the transaction data
-        # We can identify the user by their User Id
-        # NOTE: User Id for some reason isn't available in enterprise data and only available in transaction data
-        current_user = unidentified_users[current_plate]
+    # With `--resolve-identities` the accounts of one person (linked by a phone number
+    # that is not shared by many accounts, or by a User Id) are one user: each
+    # transaction goes to the user key that represents its resolved account.
+    merged_users: int = 0
+    if options.resolve_identities:
+        merged_keys: pd.Series = account_keys(
+            subscription_windows.set_index("Vehicle License Plate")["User Key"],
+            resolve_identities(enterprise_subscription_data, transaction_data)[0],
+        )
+        merged_users = int((merged_keys.index != merged_keys.to_numpy()).sum())
+        subscriber_keys = subscriber_keys.map(merged_keys).where(
+            subscriber_keys.notna()
+        )
 
-        # If this is the first time we've seen a transaction for this user,
-        # we can finally get their ID and count them as "found".
-        if current_user.id is None:
-            current_user.id = int(row["User Id"])
-            found_users += 1
+    # Transactions of a registered plate made while no subscription of it was valid
+    transactions_outside_subscription: int = int(
+        (
+            transaction_data["Vehicle License Plate"].astype(str).isin(plate_to_key)
+            & subscriber_keys.isna()
+        ).sum()
+    )
 
-    # ----------------Part 2-----------------------------
-    # If the transaction was made by a user in our enterprise
-    # group each transaction under each user object so that it gets easier
-    # when searching for delinquent transactions later
-    if current_user is not None:
-        # Create a DataFrame for the current transaction row.
-        current_transaction_series = transaction_data.loc[label].copy()
-
-        # Get the start/end time and date for the transaction
-        visit_time = str(row["Visit Start Time (local)"])
-        visit_date = str(row["Visit Start Date (local)"])
-        end_time = str(row["Visit End Time (local)"])
-        end_date = str(row["Visit End Date (local)"])
-
-        # Calculate the absolute start and end times in minutes for the transaction.
-        # abs_time is defined in abs_time.py as a helper function
-        transaction_times: List[int] = abs_time(
-            visit_time, visit_date, end_time, end_date
-        )
+    # The transactions covered by a subscription, with their subscriber's key and both
+    # minute scales computed for all rows at once. The calendar times include the
+    # year, so they order and compare the stays of a multi-year history; the absolute
+    # times give the hour of the week (heatmap.py).
+    timed_transactions: pd.DataFrame = key_subscribers(
+        transaction_data, subscriber_keys
+    )
 
-        # Add the calculated absolute times in minute as a column to the current_transaction
-        current_transaction_series["Absolute Visit Time"] = transaction_times[0]
-        current_transaction_series["Absolute Leave Time"] = transaction_times[1]
+    # Group all the transactions by users with a single groupby on the subscriber key,
+    # so that it gets easier when searching for delinquent transactions later.
+    # NOTE: The transactions used to be appended to each user one row at a time with
+    # pd.concat, which copies the user's frame every time (quadratic in its size).
+    # The groups keep the order of the transaction data.
+    for subscriber_key, user_transactions in timed_transactions.groupby(
+        "User Key", sort=False
+    ):
+        # First check if the subscription belongs to a user with an email in our
+        # enterprise, then if it belongs to one of the unidentified_users
+        if subscriber_key in users_by_email:
+            current_user: Optional[User] = users_by_email[subscriber_key]
+        elif subscriber_key in unidentified_users:
+            current_user = unidentified_users[subscriber_key]
+        else:
+            continue
 
         # If users park two or more vehicles at the same time
         # all the transactions other than the first is marked as a violation
-        current_transaction_series["Violation"] = ""  # To be populated later
-
-        # Add the transaction data to the data frame in each user
-        current_user.transactions = pd.concat(
-            # NOTE: Before concatinating a series to frame we must first transpose it
-            [current_user.transactions, current_transaction_series.to_frame().T],
-            ignore_index=True,
-        )
+        current_user.transactions = user_transactions.assign(
+            Violation=""  # To be populated later
+        ).reset_index(drop=True)
 
 
 # ===================================================================================
@@ -313,113 +579,122 @@ for label, row in transaction_data.iterrows():
 
 # A list to store emails from accounts that share a license plate with another account.
 # This indicates a data mismatch where one plate is registered to multiple users.
-emails_with_plate_mismatch: Set[str] = set()
+# Stage "grouping" (skipped when resuming from its checkpoint)
+if stages_done < 3:
+    emails_with_plate_mismatch: Set[str] = set()
 
+    # NOTE: Previous version of code built the data frame row by row
+    # A more efficient approach would be to Populate a list of dictionary and make the data frame at the end
 
-# This Data Frame will hold transactions made by each user and would mark the violator transactions
-# NOTE: This is the final desired output
-organized_transaction = pd.DataFrame()
+    # list is fixed in size with placeholder for efficiency so that it doesn't get resided
+    user_records: List[Optional[Dict]] = [None] * (
+        len(users_by_email) + len(unidentified_users)
+    )
 
+    for current_user in users_by_email.values():
+        # -------- 1 -----------
+        # Sort the user transactions by end time so that we can use a faster greedy algorithm to get violator transactions
+        # The calendar leave time includes the year, so December sorts before January.
+        # NOTE: sort_values returns a sorted copy, so the result has to be assigned back.
+        # A stable sort keeps transactions leaving at the same minute in file order.
+        if not current_user.transactions.empty:
+            current_user.transactions = current_user.transactions.sort_values(
+                by="Calendar Leave Time", ignore_index=True, kind="stable"
+            )
+
+        # --------- 2-----------
+        # Check for License Plate Registrations mismatch
+        # NOTE: current_user.licence is a set and mismatch's happen because of a flow in the Registrations system
+        has_mismatch: str = ""
+        for plate in current_user.license:
+            # check if this email is associated with more than 1 email
+            if len(plate_to_emails[plate]) > 1:
+                has_mismatch = "Yes"
+                emails_with_plate_mismatch.add(current_user.email)
+
+        # --------- 3 -------------
+        # Populate the list of dictionary for creating an organized data frame at the end
+        # This dictionary represents a single row in the data frame
+        record = {
+            "First": current_user.first,
+            "Last": current_user.last,
+            "Email": current_user.email,
+            "ID": current_user.id,
+            "Phone Number": current_user.number,
+            "License": ", ".join(map(str, current_user.license)),
+            "Has mismatch": has_mismatch,
+        }
+
+        # This is the list that finally gets converted to a frame
+        user_records.append(record)
+
+    # Iterate through each unidentified users to group them after the users with email.
+    for current_user in unidentified_users.values():
+        # ------------ 4 -------------
+
+        # Unidentified users are guaranteed by our logic to have only one license plate.
+        # This assertion will halt the program if that assumption is ever violated.
+        assert len(current_user.license) == 1, (
+            f"Unidentified user has multiple plates: {current_user.license}"
+        )
+        current_plate = next(iter(current_user.license))
 
-# NOTE: Previous version of code built the data frame row by row
-# A more efficient approach would be to Populate a list of dictionary and make the data frame at the end
+        # Sort the transactions made by unidentified_users
+        if not current_user.transactions.empty:
+            current_user.transactions = current_user.transactions.sort_values(
+                by="Calendar Leave Time", ignore_index=True, kind="stable"
+            )
 
-# list is fixed in size with placeholder for efficiency so that it doesn't get resided
-user_records: List[Optional[Dict]] = [None] * (
-    len(users_by_email) + len(unidentified_users)
-)
+        # -------- 5 -----------
+        # Check for mismatch
+        # NOTE: we can not directly check if unidentified_users have mismatched plates
+        # Instead what this code does is checks if the plate has an associated email
 
+        has_mismatch = ""  # Assume no mismatch by default
+        email_found = ""
 
-for current_user in users_by_email.values():
-    # -------- 1 -----------
-    # Sort the user transactions by end time so that we can use a faster greedy algorithm to get violator transactions
-    if not current_user.transactions.empty:
-        current_user.transactions.sort_values(
-            by="Absolute Leave Time", ignore_index=True
-        )
-
-    # --------- 2-----------
-    # Check for License Plate Registrations mismatch
-    # NOTE: current_user.licence is a set and mismatch's happen because of a flow in the Registrations system
-    has_mismatch: str = ""
-    for plate in current_user.license:
-        # check if this email is associated with more than 1 email
-        if len(plate_to_emails[plate]) > 1:
+        # A mismatch occurs if this plate is also found in our `plate_to_emails` lookup,
+        # meaning parkers registered the vehicle twice. Once with email and the other one without
+        if current_plate in plate_to_emails:
             has_mismatch = "Yes"
-            emails_with_plate_mismatch.add(current_user.email)
-
-    # --------- 3 -------------
-    # Populate the list of dictionary for creating an organized data frame at the end
-    # This dictionary represents a single row in the data frame
-    record = {
-        "First": current_user.first,
-        "Last": current_user.last,
-        "Email": current_user.email,
-        "ID": current_user.id,
-        "Phone Number": current_user.number,
-        "License": ", ".join(map(str, current_user.license)),
-        "Has mismatch": has_mismatch,
-    }
-
-    # This is the list that finally gets converted to a frame
-    user_records.append(record)
-
-# Iterate through each unidentified users to group them after the users with email.
-for current_user in unidentified_users.values():
-    # ------------ 4 -------------
-
-    # Unidentified users are guaranteed by our logic to have only one license plate.
-    # This assertion will halt the program if that assumption is ever violated.
-    assert len(current_user.license) == 1, (
-        f"Unidentified user has multiple plates: {current_user.license}"
+            email_found = "Email Found"
+
+        # -------- 6 ---------
+        # Create a Dictionary Record for this Unidentified user
+        # This record is added after the users with an email are added
+        record = {
+            "First": current_user.first,
+            "Last": current_user.last,
+            "Email": current_user.email,
+            "ID": current_user.id,
+            "Phone Number": current_user.number,
+            "License": ", ".join(map(str, current_user.license)),
+            "Has mismatch": has_mismatch,
+            "email_found": email_found,
+        }
+        # append the transaction record to list.
+        # It is finally converted to a data frame
+        user_records.append(record)
+
+    # ---------- 7 -----------
+    # creating the data frame
+    # Each Users with plate mismatch is marked and all the license plates are grouped under their associated email
+    assert user_records[-1] != None, (
+        "Logic error detected in populating List with transactions. \nArray Length shorter than expected"
+    )
+    organized_subscription = pd.DataFrame(user_records)
+
+    save_checkpoint(
+        "grouping",
+        [
+            "users_by_email",
+            "unidentified_users",
+            "emails_with_plate_mismatch",
+            "organized_subscription",
+            "transactions_outside_subscription",
+            "merged_users",
+        ],
     )
-    current_plate = next(iter(current_user.license))
-
-    # Sort the transactions made by unidentified_users
-    if not current_user.transactions.empty:
-        current_user.transactions.sort_values(
-            by="Absolute Leave Time", ignore_index=True
-        )
-
-    # -------- 5 -----------
-    # Check for mismatch
-    # NOTE: we can not directly check if unidentified_users have mismatched plates
-    # Instead what this code does is checks if the plate has an associated email
-
-    has_mismatch = ""  # Assume no mismatch by default
-    email_found = ""
-
-    # A mismatch occurs if this plate is also found in our `plate_to_emails` lookup,
-    # meaning parkers registered the vehicle twice. Once with email and the other one without
-    if current_plate in plate_to_emails:
-        has_mismatch = "Yes"
-        email_found = "Email Found"
-
-    # -------- 6 ---------
-    # Create a Dictionary Record for this Unidentified user
-    # This record is added after the users with an email are added
-    record = {
-        "First": current_user.first,
-        "Last": current_user.last,
-        "Email": current_user.email,
-        "ID": current_user.id,
-        "Phone Number": current_user.number,
-        "License": ", ".join(map(str, current_user.license)),
-        "Has mismatch": has_mismatch,
-        "email_found": email_found,
-    }
-    # append the transaction record to list.
-    # It is finally converted to a data frame
-    user_records.append(record)
-
-
-# ---------- 7 -----------
-# creating the data frame
-# Each Users with plate mismatch is marked and all the license plates are grouped under their associated email
-assert user_records[-1] != None, (
-    "Logic error detected in populating List with transactions. \nArray Length shorter than expected"
-)
-organized_subscription = pd.DataFrame(user_records)
 
 
 # ===================================================================================
@@ -428,82 +703,175 @@ organized_subscription = pd.DataFrame(user_records)
 # NOTE: This is the main section of the code
 # All the codes before were a set up and pre-processing for this part of code
 
-index: int = 0
-for current_user in users_by_email.values():
-    # --- Prepare for Processing ---
-
-    # Get the number of transactions for this user; skip if there are none.
-    n = len(current_user.transactions)
-    if n == 0:
-        continue
-
-    # Ensure the index is a clean 0-based sequence for reliable .loc access.
-    current_user.transactions.reset_index(drop=True, inplace=True)
-
-    # --- Two-Pointer Algorithm to Find Parking Violations ---
-    # This algorithm checks for overlapping parking times for a single user.
-    # 'i' serves as the anchor, pointing to the last known valid transaction.
-    # 'j' is the scanner, checking the next transaction against the anchor.
-    i = 0
-    j = 1
-
-    while j < n:
-        # Get the departure time of the anchor vehicle.
-        parked = int(current_user.transactions.loc[i, "Absolute Leave Time"])
-        # Get the arrival time of the next vehicle.
-        next_arrival = int(current_user.transactions.loc[j, "Absolute Visit Time"])
-
-        # Core Logic: If the next vehicle arrives before the anchor vehicle has left,
-        # it's a violation of the "one-vehicle-at-a-time" rule.
-        if next_arrival < parked:
-            current_user.transactions.loc[j, "Violation"] = "Violator"
-        else:
-            # If there's no overlap, this transaction is valid and becomes the new anchor.
-            i = j
-
-        # --- Populate the Consolidated 'organized_transaction' DataFrame ---
-        # For each transaction processed by the scanner (j), copy its details and
-        # violation status into the final, combined DataFrame.
-        organized_transaction.loc[index, "Email"] = current_user.email
-        organized_transaction.loc[index, "Visit Start Date"] = (
-            current_user.transactions.loc[j, "Visit Start Date (local)"]
-        )
-        organized_transaction.loc[index, "Visit Start Time"] = (
-            current_user.transactions.loc[j, "Visit Start Time (local)"]
-        )
-        organized_transaction.loc[index, "Visit End Date"] = (
-            current_user.transactions.loc[j, "Visit End Date (local)"]
-        )
-        organized_transaction.loc[index, "Visit End Time"] = (
-            current_user.transactions.loc[j, "Visit End Time (local)"]
+# Stage "detection" (skipped when resuming from its checkpoint)
+if stages_done < 4:
+    # This Data Frame will hold transactions made by each user and would mark the violator transactions
+    # NOTE: This is the final desired output
+    organized_transaction = pd.DataFrame()
+
+    # Violation counts per grace period for the what-if mode
+    what_if_counts: List[int] = [0] * len(options.what_if or [])
+
+    # The worst offenders, kept in a heap of `--top` users as each user is finished
+    leaderboard = Leaderboard(options.top, options.rank_by)
+
+    index: int = 0
+    for current_user in users_by_email.values():
+        # --- Prepare for Processing ---
+
+        # Get the number of transactions for this user; skip if there are none.
+        n = len(current_user.transactions)
+        if n == 0:
+            continue
+
+        # Ensure the index is a clean 0-based sequence for reliable .loc access.
+        current_user.transactions.reset_index(drop=True, inplace=True)
+
+        # Transactions of the lookback before `--from` only serve as anchors
+        reported = in_window(
+            current_user.transactions["Visit Start Date (local)"], options.date_from
         )
-        organized_transaction.loc[index, "Visit Duration (minutes)"] = (
-            current_user.transactions.loc[j, "Visit Duration (minutes)"]
+
+        # The calendar times of this user's transactions, in leave order
+        calendar_visit = current_user.transactions["Calendar Visit Time"].to_numpy()
+        calendar_leave = current_user.transactions["Calendar Leave Time"].to_numpy()
+
+        # What-if mode: count the violations of every grace period in one pass
+        # over this user's sorted arrays.
+        if options.what_if:
+            user_counts = sweep_sorted(
+                [current_user.email] * n,
+                calendar_visit.tolist(),
+                calendar_leave.tolist(),
+                options.what_if,
+                reported.tolist(),
+            )
+            what_if_counts = [a + b for a, b in zip(what_if_counts, user_counts)]
+
+        # --- Two-Pointer Algorithm to Find Parking Violations ---
+        # This algorithm checks for overlapping parking times for a single user.
+        # 'i' serves as the anchor, pointing to the last known valid transaction.
+        # 'j' is the scanner, checking the next transaction against the anchor.
+        i = 0
+        j = 1
+
+        # The minutes each violation overlaps its anchor (the `i` at that moment), and
+        # the first row of this user in `organized_transaction`. The anchor may be a
+        # transaction of the lookback, so the overlap is recorded here rather than
+        # recomputed from the reported rows.
+        current_user.transactions["Overlap Minutes"] = 0.0
+        first_row = index
+
+        # Running totals of this user for the leaderboard
+        user_violations: int = 0
+        user_overlap: float = 0
+        plates_involved: Set[str] = set()
+
+        while j < n:
+            # Get the departure time of the anchor vehicle.
+            parked = calendar_leave[i]
+            # Get the arrival time of the next vehicle.
+            next_arrival = calendar_visit[j]
+
+            # Core Logic: If the next vehicle arrives before the anchor vehicle has left,
+            # it's a violation of the "one-vehicle-at-a-time" rule.
+            # Overlaps of up to `--grace` minutes are tolerated (gate timestamps drift).
+            if next_arrival < parked - options.grace:
+                overlap = min(calendar_leave[i], calendar_leave[j]) - calendar_visit[j]
+                current_user.transactions.loc[j, "Violation"] = "Violator"
+                current_user.transactions.loc[j, "Overlap Minutes"] = overlap
+
+                if reported[j]:
+                    user_violations += 1
+                    user_overlap += overlap
+                    plates_involved.update(
+                        current_user.transactions.loc[[i, j], "Vehicle License Plate"]
+                    )
+            else:
+                # If there's no overlap, this transaction is valid and becomes the new anchor.
+                i = j
+
+            # --- Populate the Consolidated 'organized_transaction' DataFrame ---
+            # For each transaction processed by the scanner (j), copy its details and
+            # violation status into the final, combined DataFrame.
+            organized_transaction.loc[index, "Email"] = current_user.email
+            organized_transaction.loc[index, "Visit Start Date"] = (
+                current_user.transactions.loc[j, "Visit Start Date (local)"]
+            )
+            organized_transaction.loc[index, "Visit Start Time"] = (
+                current_user.transactions.loc[j, "Visit Start Time (local)"]
+            )
+            organized_transaction.loc[index, "Visit End Date"] = (
+                current_user.transactions.loc[j, "Visit End Date (local)"]
+            )
+            organized_transaction.loc[index, "Visit End Time"] = (
+                current_user.transactions.loc[j, "Visit End Time (local)"]
+            )
+            organized_transaction.loc[index, "Visit Duration (minutes)"] = (
+                current_user.transactions.loc[j, "Visit Duration (minutes)"]
+            )
+            organized_transaction.loc[index, "License Plate"] = (
+                current_user.transactions.loc[j, "Vehicle License Plate"]
+            )
+            organized_transaction.loc[index, "User Id"] = current_user.id
+
+            # Ensure the 'Violation' status is copied over correctly.
+            # This handles cases where the column might not have been created yet.
+            organized_transaction.loc[index, "Violation"] = (
+                current_user.transactions.loc[j, "Violation"]
+            )
+
+            # Increment both the scanner and the master index for the next loop.
+            j += 1
+            index += 1
+
+        # Evidence for disputed fines: `attach_evidence` gives every violation the
+        # plate, visit start and visit end of the car it overlapped. The transactions
+        # are already in the (user, leave time) order it walks, so its anchors are the
+        # `i` of the loop above. Transaction j is row first_row + j - 1 of the report.
+        evidence = attach_evidence(
+            current_user.transactions.assign(
+                **{"User Key": current_user.email, "Transaction Id": range(n)}
+            ),
+            current_user.transactions["Violation"] == "Violator",
         )
-        organized_transaction.loc[index, "License Plate"] = (
-            current_user.transactions.loc[j, "Vehicle License Plate"]
+        evidence = evidence[evidence["Anchor Id"].notna()]
+        if not evidence.empty:
+            organized_transaction.loc[
+                first_row - 1 + evidence.index, EVIDENCE_COLUMNS
+            ] = evidence[EVIDENCE_COLUMNS].to_numpy()
+
+        leaderboard.push(
+            current_user.email, user_violations, user_overlap, len(plates_involved)
         )
-        organized_transaction.loc[index, "User Id"] = current_user.id
 
-        # Ensure the 'Violation' status is copied over correctly.
-        # This handles cases where the column might not have been created yet.
-        organized_transaction.loc[index, "Violation"] = current_user.transactions.loc[
-            j, "Violation"
-        ]
-
-        # Increment both the scanner and the master index for the next loop.
-        j += 1
-        index += 1
+    save_checkpoint(
+        "detection", ["organized_transaction", "what_if_counts", "leaderboard"]
+    )
 
 # print the results
 print("\n")
 print(f"{AnsiColors.LIGHT_BLUE}--- Initial Data Summary ---{AnsiColors.RESET}")
 print(
-    f"Total Transactions Read = {AnsiColors.RED}{len(transaction_data)}{AnsiColors.RESET}"
+    f"Total Transactions Read = {AnsiColors.RED}{transactions_read}{AnsiColors.RESET}"
 )
+print(
+    f"Transactions quarantined = {AnsiColors.RED}{len(quarantined_transactions)}{AnsiColors.RESET}"
+)
+if options.session_gap is not None:
+    print(
+        f"Sessions after merging split visits = {AnsiColors.RED}{len(transaction_data)}{AnsiColors.RESET}"
+    )
 print(
     f"Total Subscriptions Read = {AnsiColors.RED}{len(enterprise_subscription_data)}{AnsiColors.RESET}"
 )
+if date_range:
+    print(
+        f"Date range = {AnsiColors.RED}{'start' if options.date_from is None else options.date_from.date()}"
+        f" to {'end' if options.date_to is None else options.date_to.date()}{AnsiColors.RESET}"
+        f" ({options.lookback} days of lookback"
+        f", read from {'the dataset' if from_dataset else 'the export'})"
+    )
 print("\n")
 
 print(f"{AnsiColors.LIGHT_BLUE}--- User Processing Status ---{AnsiColors.RESET}")
@@ -523,11 +891,32 @@ print(
 print(
     f"Users involved in a plate mismatch = {AnsiColors.RED}{len(emails_with_plate_mismatch)}{AnsiColors.RESET}"
 )
+print(
+    f"Plates seen with conflicting User Ids = {AnsiColors.RED}{len(user_id_conflicts)}{AnsiColors.RESET}"
+)
+print(
+    f"Transactions outside a valid subscription = {AnsiColors.RED}{transactions_outside_subscription}{AnsiColors.RESET}"
+)
+if options.resolve_identities:
+    print(
+        f"Users merged into another account = {AnsiColors.RED}{merged_users}{AnsiColors.RESET}"
+    )
 print("\n")
 
+if options.what_if:
+    print(f"{AnsiColors.LIGHT_BLUE}--- Grace Period What-If ---{AnsiColors.RESET}")
+    for grace, count in zip(options.what_if, what_if_counts):
+        print(
+            f"Violations with a {grace} minute grace period = {AnsiColors.RED}{count}{AnsiColors.RESET}"
+        )
+    print("\n")
 
-# Define the output directory for the final Excel reports.
-path_of_write: str = path + "/output/"
+
+# The transactions of the lookback were only read as anchors and are not reported
+if options.date_from is not None:
+    organized_transaction = organized_transaction[
+        in_window(organized_transaction["Visit Start Date"], options.date_from)
+    ]
 
 # For a cleaner final report, mask duplicate emails in the transaction list,
 # showing an email only on its first appearance for a given user.
@@ -542,6 +931,80 @@ organized_subscription.to_excel(
 )
 organized_transaction.to_excel(path + "Final Report.xlsx", index=False)
 
+# Plates seen with more than one User Id are written to an integrity report
+if not user_id_conflicts.empty:
+    os.makedirs(path_of_write, exist_ok=True)
+    user_id_conflicts.to_excel(path_of_write + "User Id Conflicts.xlsx", index=False)
+
+# Quarantined transactions are written with their reason codes for review
+if not quarantined_transactions.empty:
+    os.makedirs(path_of_write, exist_ok=True)
+    quarantined_transactions.to_csv(path_of_write + "Quarantine.csv", index=False)
+
+# The repeat-offender leaderboard, best first
+leaderboard.ranking().to_csv(path_of_write + LEADERBOARD_NAME, index=False)
+
+# Pre-aggregate every user's flagged transactions into a daily summary cube keyed by
+# (user, day, site), so dashboards and monthly rollups don't rescan the full report.
+flagged_transactions: List[pd.DataFrame] = [
+    current_user.transactions.assign(**{"User Key": user_key})
+    for user_key, current_user in (users_by_email | unidentified_users).items()
+    if not current_user.transactions.empty
+]
+if flagged_transactions:
+    all_transactions = pd.concat(flagged_transactions, ignore_index=True)
+    all_transactions = all_transactions[
+        in_window(all_transactions["Visit Start Date (local)"], options.date_from)
+    ].reset_index(drop=True)
+    os.makedirs(path_of_write, exist_ok=True)
+    all_violations = all_transactions["Violation"] == "Violator"
+
+    # The overlaps recorded by the detection loop, since an anchor may be a lookback
+    # transaction that was filtered out above (unidentified users are never flagged)
+    write_summary(
+        daily_summary(
+            all_transactions,
+            all_violations,
+            all_transactions["Overlap Minutes"].fillna(0).astype(float),
+        ),
+        path_of_write,
+    )
+
+    # When do violations happen? Hour-of-week counts per site and subscription tier
+    violation_heatmap(
+        all_transactions, all_violations, plate_tiers(enterprise_subscription_data)
+    ).to_csv(path_of_write + HEATMAP_NAME, index=False)
+
+    # A run limited to a date range leaves the ledger alone: it would retract every
+    # violation outside the range.
+    if not date_range:
+        # Every run flags the whole history again. The ledger of the violations
+        # reported by earlier runs tells which ones are new, which changed and which
+        # were retracted. It is only updated once the reports above were written.
+        reported_violations = all_transactions[all_violations]
+        ledger = ViolationLedger(path_of_write + LEDGER_NAME)
+        new_violations, changed_violations, retracted_violations = ledger.compare(
+            reported_violations
+        )
+        new_violations.to_csv(path_of_write + "New Violations.csv", index=False)
+        changed_violations.to_csv(path_of_write + "Changed Violations.csv", index=False)
+        retracted_violations.to_csv(
+            path_of_write + "Retracted Violations.csv", index=False
+        )
+        ledger.update(reported_violations)
+
+        print(f"{AnsiColors.LIGHT_BLUE}--- Since the Last Run ---{AnsiColors.RESET}")
+        print(
+            f"New violations = {AnsiColors.RED}{len(new_violations)}{AnsiColors.RESET}"
+        )
+        print(
+            f"Changed violations = {AnsiColors.RED}{len(changed_violations)}{AnsiColors.RESET}"
+        )
+        print(
+            f"Retracted violations = {AnsiColors.RED}{len(retracted_violations)}{AnsiColors.RESET}"
+        )
+        print("\n")
+
 print(
     f"{AnsiColors.LIGHT_BLUE}Successfully generated Excel reports in: {AnsiColors.RESET}{path}"
 )
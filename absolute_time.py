@@ -1,5 +1,7 @@
 from typing import List
 
+import pandas as pd
+
 
 def abs_time(visit_t: str, visit_d: str, leave_t: str, leave_d: str) -> List[int]:
     """Calculates an approximate absolute minute value from date and time strings.
@@ -66,3 +68,134 @@ def abs_time(visit_t: str, visit_d: str, leave_t: str, leave_d: str) -> List[int
     leave = leave_min + (leave_hour * 60) + (leave_day * 1440) + (leave_month * 44640)
 
     return [visit, leave]
+
+
+def _parse_columns(times: pd.Series, dates: pd.Series) -> pd.DataFrame:
+    """Splits time and date columns into numeric parts (NaN when malformed).
+
+    Accepts "H:MM AM/PM" (seconds are allowed and ignored) and "M/D/YYYY".
+
+    Returns:
+        A Data Frame with the float columns "hour" (24-hour format), "minute",
+        "year", "month" and "day", with the same index as `times`.
+    """
+    time_parts = times.astype("string").str.extract(
+        r"^\s*(\d{1,2}):(\d{2})(?::\d{2})?\s+([AaPp][Mm])\s*$"
+    )
+    date_parts = dates.astype("string").str.extract(
+        r"^\s*(\d{1,2})/(\d{1,2})/(\d{4})\s*$"
+    )
+
+    # An hour outside 1-12 or a minute outside 0-59 is malformed as well
+    hour = pd.to_numeric(time_parts[0]).astype("float64")
+    minute = pd.to_numeric(time_parts[1]).astype("float64")
+    malformed = (hour < 1) | (hour > 12) | (minute > 59)
+    hour = hour.mask(malformed)
+    minute = minute.mask(malformed)
+    is_pm = time_parts[2].str.upper() == "PM"
+
+    # Convert 12-hour to 24-hour format: 12 AM is hour 0, 1 PM becomes 13
+    hour = hour.mask(hour == 12, 0.0)
+    hour = hour.where(~is_pm.fillna(False).astype(bool), hour + 12)
+
+    parts = pd.DataFrame(
+        {
+            "hour": hour,
+            "minute": minute,
+            "year": pd.to_numeric(date_parts[2]).astype("float64"),
+            "month": pd.to_numeric(date_parts[0]).astype("float64"),
+            "day": pd.to_numeric(date_parts[1]).astype("float64"),
+        }
+    )
+    parts.index = times.index
+    return parts
+
+
+def abs_minutes(times: pd.Series, dates: pd.Series) -> pd.Series:
+    """Vectorized version of `abs_time` for a whole column of times and dates.
+
+    Uses the same approximate minute scale as `abs_time` so the results of both
+    functions can be compared directly. Instead of raising on a malformed value
+    (for example a missing AM/PM, or a NaN end time for a car still inside),
+    the result for that row is NaN, so a single bad row does not abort the run.
+
+    Args:
+        times: Time strings (e.g., "1:30 PM").
+        dates: Date strings (e.g., "6/26/2025"), aligned with `times`.
+
+    Returns:
+        A float Series of absolute minutes with the same index as `times`.
+    """
+    parts = _parse_columns(times, dates)
+
+    # Same approximation as `abs_time` (see the warning there)
+    return (
+        parts["minute"]
+        + (parts["hour"] * 60)
+        + (parts["day"] * 1440)
+        + (parts["month"] * 44640)
+    )
+
+
+def calendar_minutes(times: pd.Series, dates: pd.Series) -> pd.Series:
+    """Minutes since 1/1/1970 of time and date columns, on the real calendar.
+
+    Unlike the scale of `abs_time`, this one counts the year and the real length
+    of every month: differences are exact durations, and times of different
+    years are in order. Malformed values (including impossible dates such as
+    2/30/2025) give NaN, like in `abs_minutes`.
+
+    Args:
+        times: Time strings (e.g., "1:30 PM").
+        dates: Date strings (e.g., "6/26/2025"), aligned with `times`.
+
+    Returns:
+        A float Series of minutes with the same index as `times`.
+    """
+    parts = _parse_columns(times, dates)
+    days = pd.to_datetime(parts[["year", "month", "day"]], errors="coerce")
+    return (
+        (days - pd.Timestamp("1970-01-01")) / pd.Timedelta(minutes=1)
+        + (parts["hour"] * 60)
+        + parts["minute"]
+    )
+
+
+def add_absolute_times(transaction_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns a copy of the transactions with the absolute visit and leave times.
+
+    The "Absolute Visit Time" and "Absolute Leave Time" columns are computed
+    with `abs_minutes` from the local start and end date/time columns.
+    """
+    return transaction_data.assign(
+        **{
+            "Absolute Visit Time": abs_minutes(
+                transaction_data["Visit Start Time (local)"],
+                transaction_data["Visit Start Date (local)"],
+            ),
+            "Absolute Leave Time": abs_minutes(
+                transaction_data["Visit End Time (local)"],
+                transaction_data["Visit End Date (local)"],
+            ),
+        }
+    )
+
+
+def add_calendar_times(transaction_data: pd.DataFrame) -> pd.DataFrame:
+    """Returns a copy of the transactions with the calendar visit and leave times.
+
+    The "Calendar Visit Time" and "Calendar Leave Time" columns are computed
+    with `calendar_minutes` from the local start and end date/time columns.
+    """
+    return transaction_data.assign(
+        **{
+            "Calendar Visit Time": calendar_minutes(
+                transaction_data["Visit Start Time (local)"],
+                transaction_data["Visit Start Date (local)"],
+            ),
+            "Calendar Leave Time": calendar_minutes(
+                transaction_data["Visit End Time (local)"],
+                transaction_data["Visit End Date (local)"],
+            ),
+        }
+    )
@@ -0,0 +1,494 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple  # Static typing
+
+import hashlib
+import http.client
+import json
+import os
+import queue
+import threading
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from ingest import (
+    TRANSACTION_COLUMNS,
+    filter_subscriptions,
+    filter_transactions,
+    find_export,
+    read_export,
+)  # Helpers that read the UTF-16 exports into filtered data frames
+
+
+# ===================================================================================
+# MODULE PURPOSE: Pull transactions and subscriptions from the operator's paginated API
+# ===================================================================================
+
+# Instead of downloading the UTF-16 exports by hand before every run, both tables can
+# be pulled from a paginated HTTP JSON API:
+#
+#   GET /<resource>?cursor=<cursor>&limit=<rows>
+#   -> {"records": [...], "next_cursor": "<cursor>" or null, "total": <rows>}
+#
+# The cursor is opaque: the only way to reach a page is the "next_cursor" of the page
+# before it, so by default the pages are fetched one after another (`fetch_pages`).
+#
+# Some APIs also give random access to the rows through an offset parameter:
+#
+#   GET /<resource>?offset=<row>&limit=<rows>     (same reply)
+#
+# Only when the caller says the API supports it (`offsets=True`, or `--api-offsets`
+# in Catch.py) does the puller fan out: once the first page gave the total, every
+# other page is requested by its offset, at most `CONCURRENCY` at a time over a small
+# pool of keep-alive connections (HTTP/1.1), one per worker (`fetch_offset_pages`).
+# The pages are still consumed strictly in order. Every page is filtered right away
+# and appended to the same filtered frame `ingest` would build.
+#
+# Each page is also appended to a partial spool file with the cursor that follows it
+# and the number of rows spooled so far, so an interrupted pull resumes from the last
+# cursor (or row offset) instead of the first page. A pull that completed starts over
+# on the next run, since the operator's data may have changed. A completed pull only
+# replaces the spool file (`<resource>.jsonl`, which stands in for the export) when its
+# content hash differs: rewriting an unchanged spool would change its fingerprint and
+# invalidate every checkpoint of Catch.py.
+#
+# `StandInServer` serves the local exports through the same API, so the puller can be
+# tested and benchmarked without network access.
+
+
+# Rows per page and maximum number of pages fetched at the same time
+PAGE_SIZE: int = 5000
+CONCURRENCY: int = 4
+
+# Name of the directory (created in the data directory) holding the spooled pages
+SPOOL_DIR_NAME: str = ".api_spool"
+
+# For every resource: the export served by the stand-in, its columns (None for all)
+# and the filter `ingest` applies to it
+RESOURCES: Dict[str, Tuple[str, Optional[List[str]], Callable]] = {
+    "transactions": ("transaction_data.csv", TRANSACTION_COLUMNS, filter_transactions),
+    "subscriptions": ("enterprise_subscription_detail.csv", None, filter_subscriptions),
+}
+
+
+# ------------------------------- Stand-in server -----------------------------------
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Serves pages of the local exports as JSON, over keep-alive connections."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        resource = url.path.strip("/")
+        tables: Dict[str, pd.DataFrame] = self.server.tables  # type: ignore
+        if resource not in tables:
+            self._send(404, {"error": f"unknown resource {resource}"})
+            return
+
+        # The cursors of the stand-in are row offsets, but clients must not rely on it
+        query = urllib.parse.parse_qs(url.query)
+        offset = int(query.get("offset", query.get("cursor", ["0"]))[0])
+        limit = int(query.get("limit", [str(PAGE_SIZE)])[0])
+        table = tables[resource]
+
+        page = table.iloc[offset : offset + limit]
+        end = offset + len(page)
+        self._send(
+            200,
+            {
+                # NaN is not valid JSON, so missing values are sent as null
+                "records": page.astype(object)
+                .where(page.notna(), None)
+                .to_dict("records"),
+                "next_cursor": str(end) if end < len(table) else None,
+                "total": len(table),
+            },
+        )
+
+    def _send(self, status: int, body: Dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args) -> None:
+        """Keeps the console quiet; one line per page would drown the output."""
+
+
+class StandInServer(ThreadingHTTPServer):
+    """A local stand-in for the operator API, serving the exports of a data directory.
+
+    Attributes:
+        tables (Dict[str, pd.DataFrame]): The unfiltered table of every resource.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, data_dir: str, port: int = 0) -> None:
+        """Loads the exports and binds to localhost (port 0 picks a free port)."""
+        self.tables: Dict[str, pd.DataFrame] = {
+            resource: read_export(find_export(data_dir, file_name), usecols=columns)
+            for resource, (file_name, columns, _) in RESOURCES.items()
+        }
+        super().__init__(("127.0.0.1", port), _StandInHandler)
+
+    @property
+    def url(self) -> str:
+        """The base URL of the server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        """Serves requests from a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+# ----------------------------------- Puller ----------------------------------------
+
+
+class ConnectionPool:
+    """A fixed set of keep-alive connections to one host, shared between threads."""
+
+    def __init__(self, base_url: str, size: int = CONCURRENCY) -> None:
+        """Opens (lazily) `size` connections to the host of `base_url`."""
+        url = urllib.parse.urlsplit(base_url)
+        connection_class = (
+            http.client.HTTPSConnection
+            if url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.prefix = url.path.rstrip("/")
+        self._idle: "queue.Queue[http.client.HTTPConnection]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(connection_class(url.netloc, timeout=60))
+
+    def get_json(self, path: str) -> Dict:
+        """Sends a GET request on an idle connection and decodes the JSON reply.
+
+        A connection closed by the server in the meantime is reopened once.
+        """
+        connection = self._idle.get()
+        try:
+            for attempt in range(2):
+                try:
+                    connection.request("GET", self.prefix + path)
+                    response = connection.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError):
+                    connection.close()
+                    if attempt == 1:
+                        raise
+            if response.status != 200:
+                raise RuntimeError(
+                    f"GET {path} failed with {response.status}: {body!r}"
+                )
+            return json.loads(body)
+        finally:
+            self._idle.put(connection)
+
+    def close(self) -> None:
+        """Closes every connection of the pool."""
+        while not self._idle.empty():
+            self._idle.get().close()
+
+
+def _page_path(resource: str, page_size: int, **position: object) -> str:
+    """Returns the path of a page, positioned by a cursor or an offset (or neither)."""
+    query = {key: value for key, value in position.items() if value is not None}
+    query["limit"] = page_size
+    return f"/{resource}?{urllib.parse.urlencode(query)}"
+
+
+def fetch_pages(
+    pool: ConnectionPool,
+    resource: str,
+    cursor: Optional[str] = None,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+    """Fetches the pages of a resource one after another, following "next_cursor".
+
+    Args:
+        pool: Connections to the API.
+        resource: "transactions" or "subscriptions".
+        cursor: The cursor to start from (None for the first page).
+        page_size: Rows per page.
+
+    Yields:
+        The records of every page, in order, with the cursor of the next page
+        (None after the last page).
+    """
+    while True:
+        page = pool.get_json(_page_path(resource, page_size, cursor=cursor))
+        yield page["records"], page["next_cursor"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return
+
+
+def fetch_offset_pages(
+    pool: ConnectionPool,
+    resource: str,
+    start: int = 0,
+    page_size: int = PAGE_SIZE,
+    concurrency: int = CONCURRENCY,
+) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+    """Fetches the pages of a resource by row offset, at most `concurrency` at a time.
+
+    Only for APIs that accept the `offset` parameter (see the module comment).
+
+    Args:
+        pool: Connections to the API.
+        resource: "transactions" or "subscriptions".
+        start: The row to start from.
+        page_size: Rows per page.
+        concurrency: Maximum number of pages in flight.
+
+    Yields:
+        The records of every page, in order, with the cursor of the next page
+        (None after the last page).
+    """
+    first = pool.get_json(_page_path(resource, page_size, offset=start))
+    yield first["records"], first["next_cursor"]
+    if first["next_cursor"] is None:
+        return
+
+    # The first page gave the total, so the offsets of the other pages are known
+    offsets = range(start + page_size, int(first["total"]), page_size)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight: "queue.Queue[Future]" = queue.Queue()
+        pages = iter(offsets)
+
+        def submit_next() -> None:
+            offset = next(pages, None)
+            if offset is not None:
+                in_flight.put(
+                    executor.submit(
+                        pool.get_json, _page_path(resource, page_size, offset=offset)
+                    )
+                )
+
+        for _ in range(concurrency):
+            submit_next()
+        while not in_flight.empty():
+            page = in_flight.get().result()
+            submit_next()
+            yield page["records"], page["next_cursor"]
+
+
+def _file_digest(path: str) -> str:
+    """Returns the SHA-1 of a file's content."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_spool(
+    spool_path: str, resource: str, page_size: int = PAGE_SIZE
+) -> pd.DataFrame:
+    """Reads a spool file into the filtered frame, keeping the export's columns.
+
+    The records are read one page at a time, and every page is reduced to the
+    columns `ingest` reads from the export before it is filtered.
+    """
+    _, columns, filter_frame = RESOURCES[resource]
+    filtered = [
+        filter_frame(chunk if columns is None else chunk.reindex(columns=columns))
+        for chunk in pd.read_json(
+            spool_path, lines=True, dtype=False, chunksize=page_size
+        )
+    ]
+    return (
+        pd.concat(filtered, ignore_index=True)
+        if filtered
+        else filter_frame(pd.DataFrame(columns=columns))
+    )
+
+
+def pull(
+    base_url: str,
+    resource: str,
+    spool_dir: str,
+    page_size: int = PAGE_SIZE,
+    concurrency: int = CONCURRENCY,
+    offsets: bool = False,
+) -> pd.DataFrame:
+    """Pulls one resource into the filtered frame `ingest` builds from its export.
+
+    Args:
+        base_url: Base URL of the API, e.g. "http://127.0.0.1:8000".
+        resource: "transactions" or "subscriptions".
+        spool_dir: Directory for the spooled pages and the resume position. The
+            records of a completed pull are in `<resource>.jsonl`.
+        page_size: Rows per page.
+        concurrency: Maximum number of pages fetched at the same time (only
+            with `offsets`).
+        offsets: Whether the API accepts the `offset` parameter, which lets
+            the pages be fetched in parallel.
+
+    Returns:
+        The filtered records of the resource (index reset).
+    """
+    _, columns, filter_frame = RESOURCES[resource]
+    os.makedirs(spool_dir, exist_ok=True)
+    spool_path = os.path.join(spool_dir, f"{resource}.jsonl")
+    partial_path = spool_path + ".partial"
+    state_path = os.path.join(spool_dir, f"{resource}.state.json")
+
+    # Resume an interrupted pull from its last cursor, otherwise start over
+    state = {"cursor": None, "rows": 0, "bytes": 0, "complete": True}
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as state_file:
+            state = json.load(state_file)
+        # A state saved before the rows were counted can not resume by offset,
+        # and one saved before the pages went to the partial file can not resume
+        state.setdefault("rows", 0)
+        if offsets and state["bytes"] and not state["rows"]:
+            state["complete"] = True
+        if state["bytes"] and not os.path.exists(partial_path):
+            state["complete"] = True
+
+    filtered: List[pd.DataFrame] = []
+    if state["complete"]:
+        state = {"cursor": None, "rows": 0, "bytes": 0, "complete": False}
+    elif state["bytes"]:
+        # Drop anything written after the last saved cursor
+        with open(partial_path, "r+b") as spool:
+            spool.truncate(state["bytes"])
+        filtered.append(read_spool(partial_path, resource, page_size))
+
+    pool = ConnectionPool(base_url, concurrency if offsets else 1)
+    pages = (
+        fetch_offset_pages(pool, resource, state["rows"], page_size, concurrency)
+        if offsets
+        else fetch_pages(pool, resource, state["cursor"], page_size)
+    )
+    try:
+        with open(partial_path, "ab" if state["bytes"] else "wb") as spool:
+            for records, next_cursor in pages:
+                page = pd.DataFrame.from_records(records, columns=columns)
+                filtered.append(filter_frame(page))
+
+                for record in records:
+                    spool.write(json.dumps(record).encode("utf-8") + b"\n")
+                spool.flush()
+                state = {
+                    "cursor": next_cursor,
+                    "rows": state["rows"] + len(records),
+                    "bytes": spool.tell(),
+                    "complete": False,
+                }
+                _save_state(state, state_path)
+    finally:
+        pool.close()
+
+    # The pull is complete: publish it, unless the spool already holds the same records
+    if os.path.exists(spool_path) and _file_digest(spool_path) == _file_digest(
+        partial_path
+    ):
+        os.remove(partial_path)
+    else:
+        os.replace(partial_path, spool_path)
+    state["complete"] = True
+    _save_state(state, state_path)
+
+    return (
+        pd.concat(filtered, ignore_index=True)
+        if filtered
+        else filter_frame(pd.DataFrame(columns=columns))
+    )
+
+
+def _save_state(state: Dict, state_path: str) -> None:
+    """Writes the resume position of a pull (atomically)."""
+    with open(state_path + ".partial", "w", encoding="utf-8") as partial:
+        json.dump(state, partial)
+    os.replace(state_path + ".partial", state_path)
+
+
+def pull_transactions(
+    base_url: str, path_of_read: str, offsets: bool = False
+) -> pd.DataFrame:
+    """Pulls the filtered transactions, like `ingest.read_transactions`."""
+    return pull(
+        base_url,
+        "transactions",
+        os.path.join(path_of_read, SPOOL_DIR_NAME),
+        offsets=offsets,
+    )
+
+
+def pull_subscriptions(
+    base_url: str, path_of_read: str, offsets: bool = False
+) -> pd.DataFrame:
+    """Pulls the filtered subscriptions, like `ingest.read_subscriptions`."""
+    return pull(
+        base_url,
+        "subscriptions",
+        os.path.join(path_of_read, SPOOL_DIR_NAME),
+        offsets=offsets,
+    )
+
+
+# ===================================================================================
+# Usage: python api.py serve [port]        serve data/ through the stand-in API
+#        python api.py pull URL [offsets]  pull both tables from an API into data/
+#                                          (add "offsets" if it takes an offset)
+#        python api.py bench               pull from a local stand-in and compare to
+#                                          ingest, by cursor and by offset
+# ===================================================================================
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from ingest import read_transactions
+
+    path_of_read = os.getcwd() + "/data/"
+    command = sys.argv[1] if len(sys.argv) > 1 else "bench"
+
+    if command == "serve":
+        server = StandInServer(
+            path_of_read, int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+        )
+        print(f"Serving {path_of_read} on {server.url} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        server = None
+        if command == "pull":
+            base_url = sys.argv[2]
+            modes = [len(sys.argv) > 3 and sys.argv[3] == "offsets"]
+        else:
+            server = StandInServer(path_of_read).start()
+            base_url = server.url
+            modes = [False, True]
+
+        for offsets in modes:
+            start = time.perf_counter()
+            transactions = pull_transactions(base_url, path_of_read, offsets)
+            subscriptions = pull_subscriptions(base_url, path_of_read, offsets)
+            print(
+                f"Pulled {len(transactions)} transactions and {len(subscriptions)}"
+                f" subscriptions by {'offset' if offsets else 'cursor'}"
+                f" in {time.perf_counter() - start:.2f}s"
+            )
+
+            if server is not None:
+                expected = read_transactions(path_of_read)
+                same = expected.astype(str).equals(
+                    transactions[expected.columns].astype(str)
+                )
+                print(f"Same rows as the exports: {same}")
+
+        if server is not None:
+            server.shutdown()
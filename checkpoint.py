@@ -0,0 +1,132 @@
+from typing import Dict, List, Optional, Tuple  # Used for static typing
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+from ingest import file_fingerprint  # Cheap fingerprint of one version of a file
+
+
+# ===================================================================================
+# MODULE PURPOSE: Save the state after each pipeline stage and resume from it
+# ===================================================================================
+
+# A run of Catch.py on a large export can die at the very end (e.g. the Excel file is
+# open and locked, or the disk is full), which used to throw away all the parsing and
+# detection work. After each stage (ingest, registry, grouping, detection) the state
+# built so far is pickled into a checkpoint file. A rerun resumes after the last stage
+# whose checkpoint is still valid.
+#
+# A checkpoint is keyed by the fingerprints of the input files and by the options the
+# stage (and the stages before it) depend on. A new export or a different option gives
+# a different key, so a stale checkpoint is never reused: e.g. changing `--grace` only
+# invalidates the detection checkpoint, and the rerun resumes after grouping.
+
+
+# The pipeline stages, in the order they run
+STAGES: List[str] = ["ingest", "registry", "grouping", "detection"]
+
+# Bump when the content of the checkpoints changes, so old ones are not loaded
+CHECKPOINT_VERSION: int = 5
+
+# Name of the directory (created next to the output) holding the checkpoints
+CHECKPOINT_DIR_NAME: str = ".checkpoints"
+
+
+class Checkpoints:
+    """Saves and loads the state of Catch.py after each stage.
+
+    Attributes:
+        directory (str): Directory the checkpoint files are written to.
+        fingerprints (Dict[str, str]): Fingerprint of every input file.
+        options (Dict[str, Dict]): For every stage, the options it depends on.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        input_paths: List[str],
+        options: Dict[str, Dict],
+    ) -> None:
+        """Fingerprints the input files and prepares the checkpoint directory.
+
+        Args:
+            directory: Directory for the checkpoint files.
+            input_paths: The files the pipeline reads.
+            options: For every stage name, the options the stage itself depends
+                on (a stage also depends on the options of the stages before it).
+        """
+        self.directory = directory
+        self.fingerprints: Dict[str, str] = {
+            os.path.basename(path): file_fingerprint(path) for path in input_paths
+        }
+        self.options = options
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, stage: str) -> str:
+        """Returns the key of a stage's checkpoint for the inputs and options."""
+        # A stage depends on its own options and on those of every earlier stage
+        earlier = STAGES[: STAGES.index(stage) + 1]
+        identity = {
+            "version": CHECKPOINT_VERSION,
+            "stage": stage,
+            "inputs": self.fingerprints,
+            "options": {name: self.options.get(name, {}) for name in earlier},
+        }
+        text = json.dumps(identity, sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+    def _path(self, stage: str) -> str:
+        return os.path.join(self.directory, f"{stage}.{self.key(stage)}.pickle")
+
+    def save(self, stage: str, state: Dict) -> None:
+        """Writes the state after a stage, replacing older checkpoints of the stage.
+
+        The file is written under a temporary name and renamed when complete, so
+        a run that dies while saving never leaves a truncated checkpoint behind.
+        """
+        path = self._path(stage)
+        with open(path + ".partial", "wb") as partial:
+            pickle.dump(state, partial, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".partial", path)
+
+        # Checkpoints of the stage for older inputs or options are no longer needed
+        for stale in glob.glob(os.path.join(self.directory, f"{stage}.*.pickle")):
+            if stale != path:
+                os.remove(stale)
+
+    def load(self, stage: str) -> Optional[Dict]:
+        """Returns the state saved after a stage, or None when there is no valid one."""
+        path = self._path(stage)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as checkpoint:
+                return pickle.load(checkpoint)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Unreadable (e.g. written by an older version of the code): start over
+            return None
+
+    def resume(self) -> Tuple[int, Dict]:
+        """Finds the last stage with a valid checkpoint.
+
+        Returns:
+            The number of stages that can be skipped (0 when nothing is saved),
+            and the state saved after the last of them.
+        """
+        for done in range(len(STAGES), 0, -1):
+            state = self.load(STAGES[done - 1])
+            if state is not None:
+                return done, state
+        return 0, {}
+
+
+# ===================================================================================
+# Usage: python checkpoint.py   (lists the checkpoints saved in output/.checkpoints)
+# ===================================================================================
+if __name__ == "__main__":
+    directory = os.path.join(os.getcwd(), "output", CHECKPOINT_DIR_NAME)
+    for path in sorted(glob.glob(os.path.join(directory, "*.pickle"))):
+        print(f"{os.path.basename(path)}  {os.path.getsize(path) / 1e6:.1f} MB")
@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional  # Used for static typing to reduce errors
+
+import numpy as np
+import pandas as pd
+
+
+# ===================================================================================
+# MODULE PURPOSE: Write and read Data Frames in a columnar file format
+# ===================================================================================
+
+# The daily summary cube (summary.py) and the month partitions of the transaction
+# dataset (dataset.py) are stored in a columnar format, so a reader only decodes the
+# columns it needs. Parquet is used when pyarrow is installed (it is an optional
+# dependency, see `ingest.fastest_engine`). Otherwise every column is stored as a numpy
+# array in a compressed ".npz" archive, which is columnar as well: its arrays are only
+# decompressed when they are accessed.
+#
+# In an ".npz" archive numbers, booleans and days keep their numpy type. Every other
+# column is stored as fixed-width unicode with a null mask next to it, so missing
+# values come back as NaN and the archive never needs pickling.
+
+
+# Suffix of the null mask stored next to a string column in an ".npz" archive
+NULL_MASK_SUFFIX: str = " (null)"
+
+
+def has_parquet() -> bool:
+    """Returns whether pandas can write Parquet files (pyarrow is optional)."""
+    try:
+        import pyarrow  # noqa: F401  # pyright: ignore
+    except ImportError:
+        return False
+    return True
+
+
+def write_columnar(frame: pd.DataFrame, path: str) -> str:
+    """Writes a Data Frame (without its index) and returns the path written.
+
+    Args:
+        frame: The Data Frame to write.
+        path: Path of the file without its extension; ".parquet" or ".npz" is
+            added depending on the format used.
+    """
+    if has_parquet():
+        path += ".parquet"
+        frame.to_parquet(path, index=False)
+        return path
+
+    path += ".npz"
+    columns: Dict[str, np.ndarray] = {}
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_dtype(
+            values
+        ):
+            columns[column] = values.to_numpy()
+        else:
+            columns[column] = values.fillna("").to_numpy(dtype=str)
+            columns[column + NULL_MASK_SUFFIX] = values.isna().to_numpy()
+    np.savez_compressed(path, **columns)
+    return path
+
+
+def read_columnar(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Reads a file written by `write_columnar`, optionally only some columns."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+
+    frame: Dict[str, np.ndarray] = {}
+    with np.load(path, allow_pickle=False) as archive:
+        if columns is None:
+            columns = [
+                column
+                for column in archive.files
+                if not column.endswith(NULL_MASK_SUFFIX)
+            ]
+        for column in columns:
+            values = archive[column]
+            if column + NULL_MASK_SUFFIX in archive.files:
+                values = values.astype(object)
+                values[archive[column + NULL_MASK_SUFFIX]] = np.nan
+            frame[column] = values
+    return pd.DataFrame(frame)
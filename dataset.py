@@ -0,0 +1,230 @@
+from typing import Dict, List, Optional  # Used for static typing to reduce errors
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar import (
+    read_columnar,
+    write_columnar,
+)  # Parquet when pyarrow is installed, otherwise compressed numpy arrays
+from ingest import file_fingerprint  # Cheap fingerprint of one version of a file
+
+
+# ===================================================================================
+# MODULE PURPOSE: Keep the cleaned transactions in a month-partitioned columnar dataset
+# ===================================================================================
+
+# Investigating a complaint only needs a few weeks of data, but every run used to parse
+# and process the whole export. The validated transactions are therefore also written
+# to a dataset with one columnar file per month of the visit start date. A run limited
+# to a date range (`--from`/`--to` in Catch.py) only reads the partitions overlapping
+# that range, and then keeps the rows whose visit started in it.
+#
+# The dataset is rebuilt only when the export changes: its manifest records the
+# fingerprint of the export it was built from, like the UTF-8 cache of `ingest`.
+#
+# The greedy detection needs the stay a violation overlaps, which may have started
+# before the range. A lookback of a few days is therefore read before the start date;
+# those transactions only serve as anchors and are not reported.
+#
+# Partitions are Parquet files when pyarrow is installed, and otherwise compressed
+# ".npz" archives of one numpy array per column (see columnar.py).
+
+
+# Name of the directory (created next to the source files) holding the dataset
+DATASET_DIR_NAME: str = ".dataset"
+
+# File listing the partitions and the fingerprint of the export they came from
+MANIFEST_NAME: str = "manifest.json"
+
+# Days read before the start of a date range so stays crossing it have their anchor
+LOOKBACK_DAYS: int = 3
+
+# Position of every row in the export, so a read keeps the order of the export
+SOURCE_ROW: str = "Source Row"
+
+
+def visit_days(dates: pd.Series) -> pd.Series:
+    """Parses visit dates such as "3/1/2025" (NaT when they can not be parsed)."""
+    return pd.to_datetime(dates, format="%m/%d/%Y", errors="coerce")
+
+
+def in_window(
+    dates: pd.Series,
+    start: Optional[pd.Timestamp] = None,
+    end: Optional[pd.Timestamp] = None,
+) -> np.ndarray:
+    """Returns which dates fall in [start, end]; a missing bound is open.
+
+    Without any bound every row is in the window, even one without a date.
+    """
+    inside = np.ones(len(dates), dtype=bool)
+    if start is None and end is None:
+        return inside
+    days = visit_days(dates)
+    if start is not None:
+        inside &= (days >= start.normalize()).to_numpy()
+    if end is not None:
+        inside &= (days <= end.normalize()).to_numpy()
+    return inside
+
+
+def _write_partition(partition: pd.DataFrame, path: str) -> str:
+    """Writes one partition in a columnar format and returns its file name."""
+    return os.path.basename(write_columnar(partition, path))
+
+
+class TransactionDataset:
+    """The cleaned transactions of one export, partitioned by month.
+
+    Attributes:
+        directory (str): Directory holding the partitions and the manifest.
+        fingerprint (str): Fingerprint of the export the dataset should match.
+        manifest (Dict): The source fingerprint, the columns, and the file
+            and row count of every month ("2025-03", or "unknown" for rows
+            without a visit start date).
+    """
+
+    def __init__(self, directory: str, source_path: str) -> None:
+        """Opens the dataset of an export (it may not have been built yet)."""
+        self.directory = directory
+        self.fingerprint = file_fingerprint(source_path)
+        self.manifest: Dict = {"source": None, "columns": [], "partitions": {}}
+
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest:
+                self.manifest = json.load(manifest)
+
+    def is_current(self) -> bool:
+        """Returns whether the dataset was built from this version of the export."""
+        return self.manifest["source"] == self.fingerprint
+
+    def build(self, transactions: pd.DataFrame) -> None:
+        """Replaces the dataset with the given (validated) transactions.
+
+        The manifest is removed first and written last, so an interrupted build
+        leaves a dataset that is simply not current.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+        rows = transactions.reset_index(drop=True)
+        rows[SOURCE_ROW] = np.arange(len(rows))
+        months = (
+            visit_days(rows["Visit Start Date (local)"])
+            .dt.strftime("%Y-%m")
+            .fillna("unknown")
+        )
+
+        partitions: Dict[str, Dict] = {}
+        for month, partition in rows.groupby(months.to_numpy(), sort=True):
+            partitions[month] = {
+                "file": _write_partition(
+                    partition, os.path.join(self.directory, f"month={month}")
+                ),
+                "rows": len(partition),
+            }
+
+        self.manifest = {
+            "source": self.fingerprint,
+            "columns": list(transactions.columns),
+            "partitions": partitions,
+        }
+        partial_path = manifest_path + ".partial"
+        with open(partial_path, "w") as manifest:
+            json.dump(self.manifest, manifest, indent=2)
+        os.replace(partial_path, manifest_path)
+
+    def months(
+        self,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> List[str]:
+        """Returns the months of the partitions overlapping [start, end]."""
+        first = "" if start is None else start.strftime("%Y-%m")
+        last = "9999-99" if end is None else end.strftime("%Y-%m")
+        return [
+            month
+            for month in self.manifest["partitions"]
+            if month != "unknown" and first <= month <= last
+        ]
+
+    def read(
+        self,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> pd.DataFrame:
+        """Reads the transactions whose visit started in [start, end].
+
+        Only the partitions of the overlapping months are opened. The rows are
+        returned in the order of the export, with a fresh index.
+        """
+        columns = self.manifest["columns"] + [SOURCE_ROW]
+        partitions = [
+            read_columnar(
+                os.path.join(
+                    self.directory, self.manifest["partitions"][month]["file"]
+                ),
+                columns,
+            )
+            for month in self.months(start, end)
+        ]
+        if not partitions:
+            return pd.DataFrame(columns=self.manifest["columns"])
+
+        rows = pd.concat(partitions, ignore_index=True)
+        rows = rows[in_window(rows["Visit Start Date (local)"], start, end)]
+        return (
+            rows.sort_values(SOURCE_ROW, kind="stable")
+            .drop(columns=SOURCE_ROW)
+            .reset_index(drop=True)
+        )
+
+
+# ===================================================================================
+# Usage: python dataset.py [FROM] [TO]   (dates such as 3/1/2025; builds the dataset
+#                                          in data/ when the export changed)
+# ===================================================================================
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from ingest import find_export, read_transactions
+    from validation import validate_transactions
+
+    path_of_read = os.getcwd() + "/data/"
+    start = pd.Timestamp(sys.argv[1]) if len(sys.argv) > 1 else None
+    end = pd.Timestamp(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    begin = time.perf_counter()
+    full, _ = validate_transactions(read_transactions(path_of_read))
+    full_read = time.perf_counter() - begin
+
+    dataset = TransactionDataset(
+        path_of_read + DATASET_DIR_NAME,
+        find_export(path_of_read, "transaction_data.csv"),
+    )
+    if not dataset.is_current():
+        dataset.build(full)
+
+    begin = time.perf_counter()
+    selected = dataset.read(start, end)
+    ranged_read = time.perf_counter() - begin
+
+    print(f"Partitions = {len(dataset.manifest['partitions'])}")
+    print(f"Partitions read = {len(dataset.months(start, end))}")
+    print(f"Export read + validation = {full_read:.3f}s ({len(full)} rows)")
+    print(f"Ranged dataset read      = {ranged_read:.3f}s ({len(selected)} rows)")
+    assert selected.equals(
+        full[in_window(full["Visit Start Date (local)"], start, end)].reset_index(
+            drop=True
+        )
+    ), "The dataset does not match the export"
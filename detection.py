@@ -0,0 +1,493 @@
+from typing import Dict, Hashable, List, Optional, Tuple  # Used for static typing
+
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# ===================================================================================
+# MODULE PURPOSE: Flag violating transactions, over the whole history or per partition
+# ===================================================================================
+
+# This is the greedy algorithm of Section 4 in Catch.py, written over flat arrays:
+# each user's transactions are walked in order of leave time. The anchor is the last
+# valid transaction; a transaction that arrives before the anchor has left is marked
+# as a violation, otherwise it becomes the new anchor.
+#
+# The only thing the algorithm remembers about a user is the leave time of the current
+# anchor. Passing that value on (the "carry-over" state) lets the history be cut into
+# month or week partitions by leave time that are processed one after another: since
+# the partitions follow leave order, the flags are exactly the same as for a single
+# whole-history run. The state leaving every partition is saved (`save_carry_states`),
+# so a single partition can be recomputed (e.g. after a data correction) from the
+# state of the partition before it, without a pass over the whole history.
+#
+# The times are the "Calendar Visit Time" and "Calendar Leave Time" columns (see
+# `absolute_time.calendar_minutes`): unlike the scale of `abs_time` they include the
+# year, so a multi-year history is in order and the partitions are real calendar
+# months.
+#
+# Gate timestamps drift by a few minutes, so a grace period can be given: the next
+# vehicle only counts as a violation when it arrives more than `grace` minutes before
+# the anchor leaves. `grace_sweep` evaluates several grace periods in a single pass.
+
+# The carry-over state: for each user key, the leave time of the active anchor.
+Carry = Dict[Hashable, float]
+
+# Columns `attach_evidence` adds to every violation
+EVIDENCE_COLUMNS: List[str] = ["Anchor Plate", "Anchor Visit Start", "Anchor Visit End"]
+
+# Length of a week partition. Weeks start on Monday, and 1/1/1970 (minute 0 of the
+# calendar scale) was a Thursday.
+WEEK_MINUTES: int = 7 * 1440
+WEEK_OFFSET: int = 3 * 1440
+
+# File of the saved carry-over states in the output directory
+CARRY_STATES_NAME: str = "Carry States.json"
+
+
+def flag_sorted(
+    keys: List[Hashable],
+    visit: List[float],
+    leave: List[float],
+    carry: Optional[Carry] = None,
+    grace: float = 0,
+) -> Tuple[List[bool], Carry]:
+    """Runs the greedy detection over transactions sorted by (user, leave time).
+
+    Args:
+        keys: The user key of every transaction.
+        visit: The visit time of every transaction, in minutes.
+        leave: The leave time of every transaction, in minutes.
+        carry: The anchor leave time of each user before these transactions.
+            The dictionary is not modified.
+        grace: Minutes of overlap tolerated before it counts as a violation.
+
+    Returns:
+        A violation flag for every transaction, and the carry-over state after
+        the last transaction.
+    """
+    anchors: Carry = dict(carry) if carry else {}
+    flags: List[bool] = [False] * len(keys)
+
+    for k in range(len(keys)):
+        parked = anchors.get(keys[k])
+
+        # If the next vehicle arrives before the anchor vehicle has left,
+        # it's a violation of the "one-vehicle-at-a-time" rule.
+        if parked is not None and visit[k] < parked - grace:
+            flags[k] = True
+        else:
+            # If there's no overlap, this transaction becomes the new anchor.
+            anchors[keys[k]] = leave[k]
+
+    return flags, anchors
+
+
+def sweep_sorted(
+    keys: List[Hashable],
+    visit: List[float],
+    leave: List[float],
+    graces: List[float],
+    counted: Optional[List[bool]] = None,
+) -> List[int]:
+    """Counts the violations for several grace periods in a single pass.
+
+    Every grace period keeps its own anchor per user, since a transaction that
+    is a violation under one grace period can be the new anchor under another.
+
+    Args:
+        keys: The user key of every transaction, sorted by (user, leave time).
+        visit: The visit time of every transaction, in minutes.
+        leave: The leave time of every transaction, in minutes.
+        graces: The grace periods to evaluate, in minutes.
+        counted: Which transactions are counted when they are violations (all
+            by default). The others still serve as anchors, e.g. the lookback
+            read before a date range.
+
+    Returns:
+        The number of violations for every grace period, in the same order.
+    """
+    counts: List[int] = [0] * len(graces)
+    anchors: List[Optional[float]] = [None] * len(graces)
+    current_user: Optional[Hashable] = None
+
+    for k in range(len(keys)):
+        if keys[k] != current_user:
+            current_user = keys[k]
+            anchors = [None] * len(graces)
+
+        for g, grace in enumerate(graces):
+            parked = anchors[g]
+            if parked is not None and visit[k] < parked - grace:
+                if counted is None or counted[k]:
+                    counts[g] += 1
+            else:
+                anchors[g] = leave[k]
+
+    return counts
+
+
+def _ordered(keyed: pd.DataFrame) -> pd.DataFrame:
+    """Drops the rows without times and sorts the rest by (user, leave time)."""
+    valid = keyed.dropna(subset=["Calendar Visit Time", "Calendar Leave Time"])
+
+    # A stable sort keeps the original order between transactions that leave
+    # at the same minute, so the result does not depend on how rows are split.
+    return valid.sort_values(["User Key", "Calendar Leave Time"], kind="stable")
+
+
+def detect(
+    keyed: pd.DataFrame, carry: Optional[Carry] = None, grace: float = 0
+) -> Tuple[pd.Series, Carry]:
+    """Flags the violating transactions of a keyed transaction Data Frame.
+
+    The rows do not need to be sorted. Rows whose visit or leave time is
+    missing can not be placed on the timeline and are never flagged.
+
+    Args:
+        keyed: Transactions with the "User Key", "Calendar Visit Time" and
+            "Calendar Leave Time" columns (see `registry.key_transactions`).
+        carry: The carry-over state from the previous partition, if any.
+        grace: Minutes of overlap tolerated before it counts as a violation.
+
+    Returns:
+        A boolean Series aligned with `keyed` (True for a violation), and the
+        carry-over state after these transactions.
+    """
+    ordered = _ordered(keyed)
+    flags, carry_out = flag_sorted(
+        ordered["User Key"].tolist(),
+        ordered["Calendar Visit Time"].tolist(),
+        ordered["Calendar Leave Time"].tolist(),
+        carry,
+        grace,
+    )
+
+    violation = pd.Series(False, index=keyed.index)
+    violation.loc[ordered.index] = flags
+    return violation, carry_out
+
+
+def overlap_minutes(keyed: pd.DataFrame, violation: pd.Series) -> pd.Series:
+    """Minutes each violating transaction overlaps the anchor it was flagged against.
+
+    The anchor of a transaction is the last earlier non-violating transaction of
+    the same user in (user, leave time) order, so it is found for all rows at
+    once with a forward fill instead of replaying the greedy loop.
+
+    Args:
+        keyed: Transactions with the "User Key", "Calendar Visit Time" and
+            "Calendar Leave Time" columns.
+        violation: The flags returned by `detect` for `keyed`.
+
+    Returns:
+        A Series aligned with `keyed`: the overlap in minutes for violations,
+        0 for every other transaction.
+    """
+    ordered = _ordered(keyed)
+    flagged = violation.loc[ordered.index].to_numpy(dtype=bool)
+    user = ordered["User Key"]
+
+    # Leave time of the current anchor, carried forward over the violations
+    anchor_leave = (
+        ordered["Calendar Leave Time"].where(~flagged).groupby(user, sort=False).ffill()
+    )
+    overlap = (
+        np.minimum(anchor_leave, ordered["Calendar Leave Time"])
+        - ordered["Calendar Visit Time"]
+    ).where(flagged, 0)
+
+    minutes = pd.Series(0.0, index=keyed.index)
+    minutes.loc[ordered.index] = overlap.clip(lower=0).to_numpy()
+    return minutes
+
+
+def anchor_ids(keyed: pd.DataFrame, violation: pd.Series) -> pd.Series:
+    """The "Transaction Id" of the anchor each violation was flagged against.
+
+    Found like in `overlap_minutes`, by carrying the id of the last
+    non-violating transaction of each user forward over the violations.
+
+    Returns:
+        A Series aligned with `keyed`: the anchor's id for violations, NaN for
+        every other transaction.
+    """
+    ordered = _ordered(keyed)
+    flagged = violation.loc[ordered.index].to_numpy(dtype=bool)
+    anchor = (
+        ordered["Transaction Id"]
+        .astype("float64")
+        .where(~flagged)
+        .groupby(ordered["User Key"], sort=False)
+        .ffill()
+        .where(flagged)
+    )
+
+    ids = pd.Series(np.nan, index=keyed.index)
+    ids.loc[ordered.index] = anchor.to_numpy()
+    return ids
+
+
+def attach_evidence(keyed: pd.DataFrame, violation: pd.Series) -> pd.DataFrame:
+    """Attaches the conflicting anchor's plate, visit start and end to every violation.
+
+    The anchors are found with a single self-join of the transactions on
+    (user, anchor id). The user is part of the join key because a plate shared
+    by several users gives the same transaction to each of them.
+
+    Args:
+        keyed: Transactions with the "Transaction Id", "User Key", "Vehicle
+            License Plate", visit start/end date and time, and calendar time columns.
+        violation: The flags returned by `detect` for `keyed`.
+
+    Returns:
+        A copy of `keyed` (same index) with the additional "Anchor Id" column and
+        the `EVIDENCE_COLUMNS`, empty for transactions that are not violations.
+    """
+    anchors = pd.DataFrame(
+        {
+            "User Key": keyed["User Key"],
+            "Anchor Id": keyed["Transaction Id"].astype("float64"),
+            "Anchor Plate": keyed["Vehicle License Plate"],
+            "Anchor Visit Start": keyed["Visit Start Date (local)"].astype(str)
+            + " "
+            + keyed["Visit Start Time (local)"].astype(str),
+            "Anchor Visit End": keyed["Visit End Date (local)"].astype(str)
+            + " "
+            + keyed["Visit End Time (local)"].astype(str),
+        }
+    ).drop_duplicates(["User Key", "Anchor Id"])
+
+    with_ids = keyed.assign(**{"Anchor Id": anchor_ids(keyed, violation)})
+    return with_ids.join(
+        anchors.set_index(["User Key", "Anchor Id"]), on=["User Key", "Anchor Id"]
+    )
+
+
+def grace_sweep(keyed: pd.DataFrame, graces: List[float]) -> pd.DataFrame:
+    """What-if analysis: the number of violations for every grace period.
+
+    Args:
+        keyed: Transactions with the "User Key", "Calendar Visit Time" and
+            "Calendar Leave Time" columns.
+        graces: The grace periods to evaluate, in minutes.
+
+    Returns:
+        A Data Frame with the columns "Grace Period (minutes)" and "Violations".
+    """
+    ordered = _ordered(keyed)
+    counts = sweep_sorted(
+        ordered["User Key"].tolist(),
+        ordered["Calendar Visit Time"].tolist(),
+        ordered["Calendar Leave Time"].tolist(),
+        graces,
+    )
+    return pd.DataFrame({"Grace Period (minutes)": graces, "Violations": counts})
+
+
+def partition_labels(keyed: pd.DataFrame, period: str = "month") -> pd.Series:
+    """Labels every transaction with the month or week of its leave time.
+
+    The labels increase with the leave time, which is what keeps partitioned
+    detection equal to a whole-history run.
+
+    Args:
+        keyed: Transactions with the "Calendar Leave Time" column.
+        period: "month" or "week".
+
+    Returns:
+        An integer-valued Series aligned with `keyed` (NaN for missing times):
+        the month count since year 0 (year * 12 + month - 1), or the week count
+        since the Monday before 1/1/1970.
+    """
+    leave = keyed["Calendar Leave Time"]
+    if period == "month":
+        days = pd.to_datetime(leave, unit="m")
+        return days.dt.year * 12 + days.dt.month - 1
+    if period == "week":
+        return (leave + WEEK_OFFSET) // WEEK_MINUTES
+    raise ValueError(f"Unknown partition period: {period}")
+
+
+def partition_end(label: float, period: str = "month") -> float:
+    """Returns the calendar minute at which a partition of `partition_labels` ends."""
+    if period == "month":
+        year, month = divmod(int(label) + 1, 12)
+        end = pd.Timestamp(year=year, month=month + 1, day=1)
+        return (end - pd.Timestamp("1970-01-01")) / pd.Timedelta(minutes=1)
+    return (label + 1) * WEEK_MINUTES - WEEK_OFFSET
+
+
+def partition_name(label: float, period: str = "month") -> str:
+    """Names a partition of `partition_labels`, e.g. "2025-03" for March 2025.
+
+    A week is named after its Monday ("2025-03-03"). The names sort in the
+    same order as the labels.
+    """
+    if period == "month":
+        year, month = divmod(int(label), 12)
+        return f"{year:04d}-{month + 1:02d}"
+    start = pd.Timestamp("1970-01-01") + pd.Timedelta(
+        minutes=label * WEEK_MINUTES - WEEK_OFFSET
+    )
+    return start.strftime("%Y-%m-%d")
+
+
+def detect_partitioned(
+    keyed: pd.DataFrame, period: str = "month", grace: float = 0
+) -> Tuple[pd.Series, Dict[str, Carry]]:
+    """Runs detection one partition at a time, passing the carry-over state on.
+
+    Args:
+        keyed: Transactions with the "User Key", "Calendar Visit Time" and
+            "Calendar Leave Time" columns.
+        period: "month" or "week".
+        grace: Minutes of overlap tolerated before it counts as a violation.
+
+    Returns:
+        The violation flags aligned with `keyed`, and for every partition (by
+        `partition_name`) the carry-over state leaving it. Save the states with
+        `save_carry_states` to recompute a single partition later with
+        `detect_partition`.
+    """
+    labels = partition_labels(keyed, period)
+    violation = pd.Series(False, index=keyed.index)
+    carry_out: Dict[str, Carry] = {}
+
+    carry: Carry = {}
+    for label, partition in keyed.groupby(labels, sort=True):
+        flags, carry = detect(partition, carry, grace)
+        carry_out[partition_name(label, period)] = carry
+        violation.loc[partition.index] = flags
+
+    return violation, carry_out
+
+
+def detect_partition(
+    partition: pd.DataFrame,
+    carry_in: Carry,
+    carry_out: Optional[Carry] = None,
+    grace: float = 0,
+) -> Tuple[pd.Series, Carry, bool]:
+    """Recomputes a single partition from the carry-over state that entered it.
+
+    Args:
+        partition: The (corrected) transactions of one partition.
+        carry_in: The state leaving the previous partition ({} for the first).
+        carry_out: The state that left this partition before the correction,
+            if known.
+        grace: Minutes of overlap tolerated before it counts as a violation.
+
+    Returns:
+        The violation flags aligned with `partition`, the new state leaving the
+        partition, and whether it differs from `carry_out`. When it does, the
+        following partition has to be recomputed as well.
+    """
+    violation, carry_next = detect(partition, carry_in, grace)
+    changed = carry_out is not None and carry_next != carry_out
+    return violation, carry_next, changed
+
+
+def save_carry_states(
+    states: Dict[str, Carry], path: str, period: str = "month", grace: float = 0
+) -> None:
+    """Writes the carry-over states of `detect_partitioned` to a JSON file.
+
+    The period and grace period are saved with the states, since a state is
+    only valid for the settings it was computed with.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"period": period, "grace": grace, "states": states}, file)
+
+
+def load_carry_states(
+    path: str, period: str = "month", grace: float = 0
+) -> Dict[str, Carry]:
+    """Reads the states written by `save_carry_states`, in partition order.
+
+    Raises:
+        ValueError: If the states were computed for another period or grace.
+    """
+    with open(path, encoding="utf-8") as file:
+        saved = json.load(file)
+    if saved["period"] != period or saved["grace"] != grace:
+        raise ValueError(
+            f"{path} holds {saved['period']} states for a grace of"
+            f" {saved['grace']} minutes, not {period} states for {grace} minutes"
+        )
+    return dict(sorted(saved["states"].items()))
+
+
+# ===================================================================================
+# Check that partitioned detection matches a whole-history run on the data directory,
+# and save the carry-over state leaving every partition. Given a partition name
+# (e.g. 2025-03), only that partition is recomputed, from the saved states.
+# Usage: python detection.py [month|week] [PARTITION]
+#        (writes output/Carry States.json; a recomputed partition writes
+#         output/Violations PARTITION.csv)
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+    import sys
+    import time
+
+    from registry import read_keyed
+
+    period = sys.argv[1] if len(sys.argv) > 1 else "month"
+    path_of_read = os.getcwd() + "/data/"
+    path_of_write = os.getcwd() + "/output/"
+    states_path = path_of_write + CARRY_STATES_NAME
+    keyed = read_keyed(path_of_read)
+
+    if len(sys.argv) > 2:
+        name = sys.argv[2]
+        states = load_carry_states(states_path, period)
+        names = list(states)
+        if name not in states:
+            sys.exit(f"No {period} partition {name} in {states_path}")
+        position = names.index(name)
+        carry_in = states[names[position - 1]] if position else {}
+
+        start = time.perf_counter()
+        labels = partition_labels(keyed, period)
+        partition = keyed[
+            labels.map(lambda label: partition_name(label, period), na_action="ignore")
+            == name
+        ]
+        violation, carry_next, changed = detect_partition(
+            partition, carry_in, states[name]
+        )
+        partition_time = time.perf_counter() - start
+
+        partition[violation.to_numpy()].to_csv(
+            path_of_write + f"Violations {name}.csv", index=False
+        )
+        states[name] = carry_next
+        save_carry_states(states, states_path, period)
+        print(
+            f"Partition {name}: {int(violation.sum())} violations"
+            f" in {partition_time:.3f}s"
+        )
+        if changed and position + 1 < len(names):
+            print(f"Its state changed: recompute {names[position + 1]} next")
+        sys.exit()
+
+    start = time.perf_counter()
+    whole, _ = detect(keyed)
+    whole_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    partitioned, states = detect_partitioned(keyed, period)
+    partitioned_time = time.perf_counter() - start
+
+    os.makedirs(path_of_write, exist_ok=True)
+    save_carry_states(states, states_path, period)
+
+    print(f"Whole history: {int(whole.sum())} violations in {whole_time:.3f}s")
+    print(
+        f"{len(states)} {period} partitions: {int(partitioned.sum())} violations"
+        f" in {partitioned_time:.3f}s"
+    )
+    print(f"Identical flags: {bool(np.array_equal(whole, partitioned))}")
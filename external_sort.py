@@ -0,0 +1,256 @@
+from typing import Dict, Iterator, List, Optional, Tuple  # Used for static typing
+
+import csv
+import heapq
+import os
+import tempfile
+
+import pandas as pd
+
+from ingest import (
+    TRANSACTION_COLUMNS,
+    filter_transactions,
+    read_export_chunks,
+)  # Helpers that read the (compressed) UTF-16 exports into filtered data frames
+from registry import key_transactions  # Attaches user keys and absolute times
+
+
+# ===================================================================================
+# MODULE PURPOSE: Sort transactions larger than RAM by (user, leave time) on disk
+# ===================================================================================
+
+# Detection needs each user's transactions ordered by leave time. For multi-year
+# archives the transactions do not fit in memory, so they are sorted externally:
+#
+# 1. The export is streamed (decompressed when needed) in chunks of `RUN_ROWS` rows.
+#    Every chunk is keyed, sorted in memory and written to disk as a sorted "run".
+# 2. The runs are k-way merged with a heap that only holds the current row of each run.
+# 3. Detection streams over the merged rows. Since they arrive grouped by user and in
+#    order of leave time, the only state kept is the current user's anchor leave time.
+#
+# The sort key and the comparisons use the calendar times ("Calendar Leave Time", see
+# `absolute_time.calendar_minutes`). The minute scale of `abs_time` has no year, which
+# would interleave the transactions of different years of an archive.
+#
+# Peak memory is one chunk during step 1, and one row per run during steps 2 and 3.
+# When there are more than `MAX_FAN_IN` runs, groups of runs are first merged into
+# longer runs so the number of open files stays bounded.
+
+
+# Number of transactions sorted in memory per run
+RUN_ROWS: int = 500_000
+
+# Maximum number of runs merged at once (each one holds an open file)
+MAX_FAN_IN: int = 256
+
+# Columns written to the sorted runs (and to the detection output)
+RUN_COLUMNS: List[str] = TRANSACTION_COLUMNS + [
+    "Transaction Id",
+    "User Key",
+    "Absolute Visit Time",
+    "Absolute Leave Time",
+    "Calendar Visit Time",
+    "Calendar Leave Time",
+]
+
+
+def keyed_chunks(
+    transactions_path: str, owners: pd.Series, chunk_rows: int = RUN_ROWS
+) -> Iterator[pd.DataFrame]:
+    """Streams a transaction export in chunks of keyed, filtered transactions.
+
+    Rows whose visit or leave time is missing are dropped.
+
+    Args:
+        transactions_path: Path to the UTF-16 transaction export, possibly
+            compressed (see `ingest.open_export`).
+        owners: The plate to user key mapping from `registry.plate_owners`.
+        chunk_rows: Number of (unfiltered) rows read per chunk.
+
+    Yields:
+        Keyed transactions (see `registry.key_transactions`). Their
+        "Transaction Id" is the position in the filtered transactions of the
+        whole file, not of the chunk.
+    """
+    offset = 0
+    for chunk in read_export_chunks(transactions_path, TRANSACTION_COLUMNS, chunk_rows):
+        filtered = filter_transactions(chunk)
+        keyed = key_transactions(filtered, owners)
+        keyed["Transaction Id"] += offset
+        offset += len(filtered)
+
+        yield keyed.dropna(subset=["Calendar Visit Time", "Calendar Leave Time"])
+
+
+def write_sorted_runs(
+    transactions_path: str,
+    owners: pd.Series,
+    run_dir: str,
+    run_rows: int = RUN_ROWS,
+) -> List[str]:
+    """Splits a transaction export into sorted runs on disk.
+
+    Args:
+        transactions_path: Path to the UTF-16 transaction export.
+        owners: The plate to user key mapping from `registry.plate_owners`.
+        run_dir: Directory the runs are written to.
+        run_rows: Number of (unfiltered) rows read per run.
+
+    Returns:
+        The paths of the runs, each sorted by (user key, leave time, transaction id).
+    """
+    run_paths: List[str] = []
+    for keyed in keyed_chunks(transactions_path, owners, run_rows):
+        if keyed.empty:
+            continue
+
+        keyed = keyed.sort_values(
+            ["User Key", "Calendar Leave Time", "Transaction Id"], kind="stable"
+        )
+        run_path = os.path.join(run_dir, f"run_{len(run_paths):05d}.csv")
+        keyed[RUN_COLUMNS].to_csv(run_path, index=False, encoding="utf-8")
+        run_paths.append(run_path)
+
+    return run_paths
+
+
+def _read_run(run_path: str) -> Iterator[Tuple[Tuple[str, float, int], Dict]]:
+    """Yields the rows of one run with their merge key."""
+    with open(run_path, encoding="utf-8", newline="") as run:
+        for row in csv.DictReader(run):
+            key = (
+                row["User Key"],
+                float(row["Calendar Leave Time"]),
+                int(row["Transaction Id"]),
+            )
+            yield key, row
+
+
+def merge_runs(run_paths: List[str]) -> Iterator[Dict]:
+    """K-way merges sorted runs into one stream ordered by (user, leave time).
+
+    Only the current row of every run is held in memory.
+    """
+    merged = heapq.merge(*(_read_run(run_path) for run_path in run_paths))
+    for _, row in merged:
+        yield row
+
+
+def reduce_runs(run_paths: List[str], run_dir: str) -> List[str]:
+    """Merges groups of runs into longer runs until at most `MAX_FAN_IN` remain."""
+    generation = 0
+    while len(run_paths) > MAX_FAN_IN:
+        merged_paths: List[str] = []
+        for first in range(0, len(run_paths), MAX_FAN_IN):
+            group = run_paths[first : first + MAX_FAN_IN]
+            merged_path = os.path.join(
+                run_dir, f"merge_{generation:02d}_{len(merged_paths):05d}.csv"
+            )
+            with open(merged_path, "w", encoding="utf-8", newline="") as merged:
+                writer = csv.DictWriter(merged, fieldnames=RUN_COLUMNS)
+                writer.writeheader()
+                writer.writerows(merge_runs(group))
+            for run_path in group:
+                os.remove(run_path)
+            merged_paths.append(merged_path)
+        run_paths = merged_paths
+        generation += 1
+    return run_paths
+
+
+def stream_detect(rows: Iterator[Dict]) -> Iterator[Tuple[Dict, bool]]:
+    """Runs the greedy detection over rows sorted by (user, leave time).
+
+    Args:
+        rows: Rows with the "User Key", "Calendar Visit Time" and
+            "Calendar Leave Time" fields, grouped by user and sorted by leave time.
+
+    Yields:
+        Every row with its violation flag.
+    """
+    current_user: Optional[str] = None
+    parked = 0.0
+
+    for row in rows:
+        visit = float(row["Calendar Visit Time"])
+        leave = float(row["Calendar Leave Time"])
+
+        # The first transaction of a user is always the first anchor
+        if row["User Key"] != current_user:
+            current_user = row["User Key"]
+            parked = leave
+            yield row, False
+        elif visit < parked:
+            yield row, True
+        else:
+            parked = leave
+            yield row, False
+
+
+def external_detect(
+    transactions_path: str,
+    owners: pd.Series,
+    output_path: str,
+    run_rows: int = RUN_ROWS,
+    run_dir: Optional[str] = None,
+) -> Tuple[int, int]:
+    """Sorts a transaction export on disk and writes every row with its flag.
+
+    Args:
+        transactions_path: Path to the UTF-16 transaction export.
+        owners: The plate to user key mapping from `registry.plate_owners`.
+        output_path: CSV file receiving the sorted rows and a "Violation" column.
+        run_rows: Number of rows sorted in memory per run.
+        run_dir: Directory for the runs; a temporary directory by default. The
+            runs are removed once the output is written.
+
+    Returns:
+        The number of rows written and the number of violations.
+    """
+    with tempfile.TemporaryDirectory(dir=run_dir) as temporary_dir:
+        run_paths = write_sorted_runs(
+            transactions_path, owners, temporary_dir, run_rows
+        )
+        run_paths = reduce_runs(run_paths, temporary_dir)
+
+        written = flagged = 0
+        with open(output_path, "w", encoding="utf-8", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(RUN_COLUMNS + ["Violation"])
+            for row, violation in stream_detect(merge_runs(run_paths)):
+                writer.writerow(
+                    [row[column] for column in RUN_COLUMNS]
+                    + ["Violator" if violation else ""]
+                )
+                written += 1
+                flagged += violation
+
+    return written, flagged
+
+
+# ===================================================================================
+# Usage: python external_sort.py [rows per run]
+# ===================================================================================
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from ingest import find_export, read_subscriptions
+    from registry import plate_owners
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+    os.makedirs(path_of_write, exist_ok=True)
+
+    start = time.perf_counter()
+    written, flagged = external_detect(
+        find_export(path_of_read, "transaction_data.csv"),
+        plate_owners(read_subscriptions(path_of_read)),
+        path_of_write + "Sorted Transactions.csv",
+        int(sys.argv[1]) if len(sys.argv) > 1 else RUN_ROWS,
+    )
+    print(
+        f"Sorted {written} transactions ({flagged} violations)"
+        f" in {time.perf_counter() - start:.2f}s"
+    )
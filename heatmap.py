@@ -0,0 +1,118 @@
+from typing import List  # Used for static typing to reduce errors
+
+import numpy as np
+import pandas as pd
+
+
+# ===================================================================================
+# MODULE PURPOSE: Break the violations down by hour of the week, per site and tier
+# ===================================================================================
+
+# Patrols should be scheduled when plate sharing actually happens. Every violation is
+# placed in one of the 168 hour-of-week buckets (Monday 0:00 to Sunday 23:59) by the
+# time its visit started, and the buckets are counted per (site, tier) with a single
+# `np.bincount` over a combined group and bucket code. There is no python loop over
+# the transactions, so the heatmap is cheap enough to compute on every run.
+#
+# The hour comes from "Absolute Visit Time": the minute scale of `abs_time` is made of
+# whole days (a month is 31 days), so the minute of the day is exactly the time modulo
+# 1440. That scale can not give the day of the week, which is therefore taken from the
+# visit start date.
+
+
+# Names of the days, in the order of `Series.dt.dayofweek`
+DAYS: List[str] = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+HOURS_PER_WEEK: int = 7 * 24
+
+# File name of the heatmap in the output directory
+HEATMAP_NAME: str = "Violation Heatmap.csv"
+
+
+def hour_of_week(transactions: pd.DataFrame) -> pd.Series:
+    """Returns the hour-of-week bucket (0 to 167) of every visit (NaN if unknown)."""
+    weekday = pd.to_datetime(
+        transactions["Visit Start Date (local)"], format="%m/%d/%Y", errors="coerce"
+    ).dt.dayofweek
+    hour = (transactions["Absolute Visit Time"] % 1440) // 60
+    return weekday * 24 + hour
+
+
+def violation_heatmap(
+    transactions: pd.DataFrame, violation: pd.Series, tiers: pd.Series
+) -> pd.DataFrame:
+    """Counts the violations of every (site, tier) per day of the week and hour.
+
+    Args:
+        transactions: Transactions with the "Site Internal Name", "Vehicle License
+            Plate", "Visit Start Date (local)" and "Absolute Visit Time" columns.
+        violation: The violation flags aligned with `transactions`.
+        tiers: The plate to subscription tier mapping from `registry.plate_tiers`.
+
+    Returns:
+        One row per (site, tier, day of the week) with the columns "Site",
+        "Tier", "Day" and one column per hour "0" to "23".
+    """
+    flagged = transactions[violation.fillna(False).to_numpy(dtype=bool)]
+    bucket = hour_of_week(flagged)
+    known = bucket.notna().to_numpy()
+    flagged = flagged[known]
+
+    groups = pd.DataFrame(
+        {
+            "Site": flagged["Site Internal Name"].astype(str).to_numpy(),
+            "Tier": flagged["Vehicle License Plate"]
+            .astype(str)
+            .map(tiers)
+            .fillna("Unknown")
+            .to_numpy(),
+        }
+    )
+    grouped = groups.groupby(["Site", "Tier"], sort=True)
+    codes = grouped.ngroup().to_numpy()
+    labels = grouped.size().index
+
+    # One bincount over (group, bucket) pairs counts every cell of every heatmap
+    counts = np.bincount(
+        codes * HOURS_PER_WEEK + bucket[known].to_numpy(dtype="int64"),
+        minlength=len(labels) * HOURS_PER_WEEK,
+    ).reshape(len(labels) * 7, 24)
+
+    heatmap = pd.DataFrame(counts, columns=[str(hour) for hour in range(24)])
+    heatmap.insert(0, "Day", DAYS * len(labels))
+    heatmap.insert(0, "Tier", np.repeat(labels.get_level_values("Tier"), 7))
+    heatmap.insert(0, "Site", np.repeat(labels.get_level_values("Site"), 7))
+    return heatmap
+
+
+# ===================================================================================
+# Usage: python heatmap.py   (writes output/Violation Heatmap.csv)
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+
+    from detection import detect
+    from ingest import read_subscriptions
+    from registry import plate_tiers, read_keyed
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+    os.makedirs(path_of_write, exist_ok=True)
+
+    keyed = read_keyed(path_of_read)
+    violation, _ = detect(keyed)
+
+    heatmap = violation_heatmap(
+        keyed, violation, plate_tiers(read_subscriptions(path_of_read))
+    )
+    heatmap.to_csv(path_of_write + HEATMAP_NAME, index=False)
+    print(heatmap.groupby(["Site", "Tier"]).sum(numeric_only=True).sum(axis=1))
@@ -0,0 +1,391 @@
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple  # Typing
+
+import codecs
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import time
+import zipfile
+
+import pandas as pd
+
+
+# ===================================================================================
+# MODULE PURPOSE: Read the exported CSV files into filtered Data Frames
+# ===================================================================================
+
+# The operator exports `transaction_data.csv` and `enterprise_subscription_detail.csv`
+# as UTF-16. Decoding UTF-16 inside `pd.read_csv` is slow and forces the slower python
+# parsing path, so every file is first transcoded once to UTF-8 and cached on disk.
+# The cached copy is keyed by a fingerprint of the source file, so it is only rebuilt
+# when a new export replaces the old one.
+#
+# Archived exports may be compressed (`.gz`, `.xz` or `.zip`). The compression is
+# detected from the first bytes of the file and the payload is decompressed as a stream
+# with the standard library, straight into the UTF-16 decoder and the CSV parser
+# (`read_export`, `read_export_chunks`), so nothing is unpacked to disk. Only plain
+# exports get a cached UTF-8 copy.
+
+
+# Columns of the transaction export that the analysis actually uses.
+TRANSACTION_COLUMNS: List[str] = [
+    "Site Internal Name",
+    "Visit Start Date (local)",
+    "Visit Start Time (local)",
+    "Visit End Date (local)",
+    "Visit End Time (local)",
+    "Visit Duration (minutes)",
+    "Vehicle License Plate",
+    "License Plate State",
+    "User Id",
+    "User Registered Date",
+    "Subscription Status",
+]
+
+# The parking sites we are interested in
+SITES: List[str] = [
+    "Kellogg Square Reserved Nest (Minneapolis",
+    "Kellogg Square Garage (Minneapolis",
+]
+
+# Only 1st Vehicle and Additional Vehicle is considered in the analysis
+# TODO: Remove Additional Veshicle
+ENTERPRISES: List[str] = [
+    "Kellogg Square Residents - 1 st Vehicle",
+    "Kellogg Square Residents -Additional Vehicle",
+]
+
+# Size of the read buffer used when transcoding (1 MiB).
+# The transcoder never holds more than one buffer of the source file in memory.
+BUFFER_SIZE: int = 1 << 20
+
+# Number of bytes from the start of a file that are hashed into its fingerprint.
+FINGERPRINT_BYTES: int = 1 << 16
+
+# Name of the directory (created next to the source files) holding transcoded copies.
+CACHE_DIR_NAME: str = ".utf8_cache"
+
+# Extensions tried, in order, when looking for an export in the data directory
+EXPORT_EXTENSIONS: List[str] = ["", ".gz", ".xz", ".zip"]
+
+# File name endings of the exports `find_export` can return: "name.csv" with one of
+# the `EXPORT_EXTENSIONS`, or "name.zip"
+EXPORT_SUFFIXES: Tuple[str, ...] = tuple(
+    ".csv" + extension for extension in EXPORT_EXTENSIONS
+) + (".zip",)
+
+# Magic numbers of the supported compression formats
+GZIP_MAGIC: bytes = b"\x1f\x8b"
+XZ_MAGIC: bytes = b"\xfd7zXZ\x00"
+ZIP_MAGIC: bytes = b"PK\x03\x04"
+
+
+def file_fingerprint(path: str) -> str:
+    """Computes a cheap fingerprint identifying one version of a file.
+
+    The fingerprint combines the file size, its modification time and a hash of
+    the first `FINGERPRINT_BYTES` bytes. This is enough to notice a replaced
+    export without having to hash the whole (possibly very large) file.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        A short hexadecimal string.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(path, "rb") as source:
+        digest.update(source.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()[:16]
+
+
+def find_export(path_of_read: str, file_name: str) -> str:
+    """Returns the path of an export, compressed or not, in the data directory.
+
+    `transaction_data.csv` is looked up as is, then as `transaction_data.csv.gz`,
+    `.csv.xz` and `.csv.zip`, then as `transaction_data.zip`. When none exists
+    the plain path is returned, so the caller's error names the expected file.
+    """
+    plain = os.path.join(path_of_read, file_name)
+    candidates = [plain + extension for extension in EXPORT_EXTENSIONS]
+    candidates.append(os.path.splitext(plain)[0] + ".zip")
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return plain
+
+
+def is_export(file_name: str) -> bool:
+    """Returns whether a file name is one of an export, compressed or not."""
+    return file_name.lower().endswith(EXPORT_SUFFIXES)
+
+
+def is_compressed(path: str) -> bool:
+    """Returns whether an export is gzip, xz or zip compressed (by magic number)."""
+    with open(path, "rb") as probe:
+        magic = probe.read(len(XZ_MAGIC))
+    return magic.startswith((GZIP_MAGIC, XZ_MAGIC, ZIP_MAGIC))
+
+
+def open_export(path: str) -> BinaryIO:
+    """Opens an export for reading, decompressing it on the fly when needed.
+
+    The compression is detected from the magic number, not from the extension.
+    A zip archive is expected to hold the export as its first `.csv` member.
+
+    Returns:
+        A binary stream of the (decompressed) export. Close it when done.
+    """
+    with open(path, "rb") as probe:
+        magic = probe.read(len(XZ_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rb")  # type: ignore[return-value]
+    if magic.startswith(XZ_MAGIC):
+        return lzma.open(path, "rb")  # type: ignore[return-value]
+    if magic.startswith(ZIP_MAGIC):
+        archive = zipfile.ZipFile(path)
+        members = [name for name in archive.namelist() if name.lower().endswith(".csv")]
+        if not members:
+            archive.close()
+            raise ValueError(f"No .csv file in the archive {path}")
+        # The member stream keeps the archive open until it is closed
+        return archive.open(members[0])  # type: ignore[return-value]
+    return open(path, "rb")
+
+
+def read_export_chunks(
+    path: str, usecols: Optional[Iterable[str]] = None, chunk_rows: int = 500_000
+) -> Iterator[pd.DataFrame]:
+    """Parses a (compressed) UTF-16 export in chunks without writing anything to disk.
+
+    The decompressed bytes are decoded by a text stream and fed straight into
+    the chunked CSV parser, so memory holds one chunk of rows at a time.
+    """
+    with open_export(path) as stream:
+        text = io.TextIOWrapper(stream, encoding="utf-16", newline="")
+        yield from pd.read_csv(
+            text,
+            usecols=None if usecols is None else list(usecols),
+            chunksize=chunk_rows,
+            low_memory=False,
+        )
+
+
+def transcode_to_utf8(
+    source_path: str,
+    cache_dir: Optional[str] = None,
+    buffer_size: int = BUFFER_SIZE,
+) -> str:
+    """Streams a UTF-16 file into a cached UTF-8 copy and returns its path.
+
+    The file is decoded with an incremental decoder through a fixed-size buffer,
+    so memory use does not depend on the size of the export. The UTF-16 decoder
+    consumes the byte order mark (BOM) and uses it to pick the endianness; the
+    UTF-8 copy is written without a BOM.
+
+    The result is memoized by the fingerprint of the source file: if a copy for
+    the same fingerprint already exists it is returned without any work, and
+    copies of older versions of the same file are removed.
+
+    Args:
+        source_path: Path to the UTF-16 encoded file, possibly compressed
+            (see `open_export`).
+        cache_dir: Directory for the transcoded copies. Defaults to a
+            `.utf8_cache` directory next to the source file.
+        buffer_size: Number of bytes read from the source per iteration.
+
+    Returns:
+        The path of the UTF-8 encoded copy.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(source_path), CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # The copies are named after the whole file name, so exports sharing a prefix
+    # ("transactions.jan.csv", "transactions.feb.csv") never replace each other
+    name = os.path.basename(source_path)
+    target_path = os.path.join(cache_dir, f"{name}.{file_fingerprint(source_path)}.csv")
+
+    # Memoized: this version of the file was already transcoded
+    if os.path.exists(target_path):
+        return target_path
+
+    # Write to a temporary name first so an interrupted run never leaves
+    # a partial file behind under the final (memoized) name.
+    partial_path = target_path + ".partial"
+    decoder = codecs.getincrementaldecoder("utf-16")()
+    with (
+        open_export(source_path) as source,
+        open(partial_path, "w", encoding="utf-8", newline="") as target,
+    ):
+        while True:
+            chunk = source.read(buffer_size)
+            if not chunk:
+                break
+            target.write(decoder.decode(chunk))
+        target.write(decoder.decode(b"", final=True))
+    os.replace(partial_path, target_path)
+
+    # Remove the copies made from older versions of the same export: "<name>.<fp>.csv"
+    for cached in os.listdir(cache_dir):
+        copy_of = cached.removesuffix(".csv").rpartition(".")[0]
+        if copy_of == name and cached != os.path.basename(target_path):
+            os.remove(os.path.join(cache_dir, cached))
+
+    return target_path
+
+
+def fastest_engine() -> str:
+    """Returns the fastest CSV parsing engine available to pandas.
+
+    The pyarrow engine is multi-threaded but is an optional dependency,
+    so fall back to the default C engine when it is not installed.
+    """
+    try:
+        import pyarrow  # noqa: F401  # pyright: ignore
+    except ImportError:
+        return "c"
+    return "pyarrow"
+
+
+def read_csv_fast(
+    source, usecols: Optional[Iterable[str]] = None, encoding: str = "utf-8"
+) -> pd.DataFrame:
+    """Reads a whole CSV file or binary stream with the fastest available engine."""
+    engine = fastest_engine()
+    kwargs = {} if engine == "pyarrow" else {"low_memory": False}
+    return pd.read_csv(
+        source,
+        usecols=None if usecols is None else list(usecols),
+        encoding=encoding,
+        engine=engine,
+        **kwargs,
+    )
+
+
+def read_csv_utf8(path: str, usecols: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Reads a UTF-8 CSV file with the fastest available engine."""
+    return read_csv_fast(path, usecols)
+
+
+def read_export(
+    path: str,
+    usecols: Optional[Iterable[str]] = None,
+    cache_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    """Reads a whole (possibly compressed) UTF-16 export into a Data Frame.
+
+    A compressed export is parsed straight from the decompressed stream, so no
+    decompressed copy is written to disk. A plain export is read from its cached
+    UTF-8 copy (see `transcode_to_utf8`). Both are parsed by the same engine
+    (`fastest_engine`), so the column types do not depend on the compression.
+
+    Args:
+        path: Path to the export.
+        usecols: The columns to read (all by default).
+        cache_dir: Directory of the UTF-8 copies (see `transcode_to_utf8`).
+    """
+    if is_compressed(path):
+        with open_export(path) as stream:
+            return read_csv_fast(stream, usecols, encoding="utf-16")
+    return read_csv_utf8(transcode_to_utf8(path, cache_dir), usecols=usecols)
+
+
+def filter_transactions(transaction_data: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the non-transient transactions made at the Kellogg Square sites.
+
+    Transient transactions are short parking stays the user already paid for.
+    The index is reset so that index based looping across the data frame works.
+    """
+    transaction_data = transaction_data[
+        (transaction_data["Subscription Status"] != "Transient")
+        & (transaction_data["Site Internal Name"].isin(SITES))
+    ]
+    return transaction_data.reset_index(drop=True)
+
+
+def filter_subscriptions(enterprise_subscription_data: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the subscriptions of the enterprises used in the analysis.
+
+    The index is reset so that index based looping across the data frame works.
+    """
+    enterprise_subscription_data = enterprise_subscription_data[
+        enterprise_subscription_data["Enterprise Name"].isin(ENTERPRISES)
+    ]
+    return enterprise_subscription_data.reset_index(drop=True)
+
+
+def read_transactions(path_of_read: str) -> pd.DataFrame:
+    """Reads and filters `transaction_data.csv` from the data directory."""
+    return filter_transactions(
+        read_export(
+            find_export(path_of_read, "transaction_data.csv"),
+            usecols=TRANSACTION_COLUMNS,
+        )
+    )
+
+
+def read_subscriptions(path_of_read: str) -> pd.DataFrame:
+    """Reads and filters `enterprise_subscription_detail.csv` from the data folder."""
+    return filter_subscriptions(
+        read_export(find_export(path_of_read, "enterprise_subscription_detail.csv"))
+    )
+
+
+# ===================================================================================
+# Compare the parse time of the original UTF-16 read against the transcoded read, and
+# the streaming read of compressed exports against the uncompressed one
+# Usage: python ingest.py [data directory] [compressed exports, e.g. data.csv.gz ...]
+# ===================================================================================
+if __name__ == "__main__":
+    import shutil
+    import sys
+    import tracemalloc
+
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), "data")
+    source = os.path.join(data_dir, "transaction_data.csv")
+
+    # Before: what Catch.py used to do on every run
+    start = time.perf_counter()
+    pd.read_csv(
+        source, usecols=TRANSACTION_COLUMNS, encoding="UTF-16", low_memory=False
+    )
+    before = time.perf_counter() - start
+
+    # After, cold cache: transcode once and parse the UTF-8 copy
+    shutil.rmtree(os.path.join(data_dir, CACHE_DIR_NAME), ignore_errors=True)
+    start = time.perf_counter()
+    read_csv_utf8(transcode_to_utf8(source), usecols=TRANSACTION_COLUMNS)
+    cold = time.perf_counter() - start
+
+    # After, warm cache: the memoized copy is reused
+    start = time.perf_counter()
+    read_csv_utf8(transcode_to_utf8(source), usecols=TRANSACTION_COLUMNS)
+    warm = time.perf_counter() - start
+
+    print(f"UTF-16 read            = {before:.3f}s")
+    print(f"Transcode + UTF-8 read = {cold:.3f}s (engine: {fastest_engine()})")
+    print(f"Cached UTF-8 read      = {warm:.3f}s")
+
+    # Streaming read of each export: throughput of the decoded payload and peak memory
+    payload_mb = os.path.getsize(source) / 2**20
+    print(f"\nStreaming chunked read ({payload_mb:.1f} MB of UTF-16 payload)")
+    for export in [source] + sys.argv[2:]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows = sum(
+            len(chunk)
+            for chunk in read_export_chunks(export, TRANSACTION_COLUMNS, 100_000)
+        )
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{os.path.basename(export):<28} {os.path.getsize(export) / 2**20:7.1f} MB"
+            f" {rows} rows  {payload_mb / elapsed:6.1f} MB/s"
+            f"  peak {peak / 2**20:6.1f} MB"
+        )
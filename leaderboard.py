@@ -0,0 +1,181 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple  # Static typing
+
+import heapq
+
+import pandas as pd
+
+from external_sort import (
+    merge_runs,
+    reduce_runs,
+    stream_detect,
+    write_sorted_runs,
+)  # Sorts an export by (user, leave time) on disk and streams detection over it
+
+
+# ===================================================================================
+# MODULE PURPOSE: Rank the worst repeat offenders while detection streams its results
+# ===================================================================================
+
+# Enforcement staff look at the worst offenders first, which used to mean sorting
+# "Final Report.xlsx" by hand once the whole report was built. A leaderboard keeps the
+# top K users in a min-heap while detection produces its results one user at a time:
+# a finished user is pushed on the heap, and when the heap holds more than K users the
+# smallest one is dropped. Memory stays O(K) no matter how many users there are.
+#
+# Users can be ranked by:
+#   Violations        number of violating transactions
+#   Overlap Minutes   total minutes the violations overlap their anchor
+#   Plates Involved   number of distinct plates in a violation (either side)
+#
+# Overlaps are measured on the calendar times (see `calendar_minutes` in
+# absolute_time.py), like the durations of the daily summary.
+
+
+# The metrics a leaderboard can rank by
+RANKINGS: List[str] = ["Violations", "Overlap Minutes", "Plates Involved"]
+
+# Default size of the leaderboard
+TOP_K: int = 25
+
+# File name of the leaderboard in the output directory
+LEADERBOARD_NAME: str = "Leaderboard.csv"
+
+
+class Leaderboard:
+    """Keeps the K users with the highest score in a bounded min-heap.
+
+    Attributes:
+        k (int): Number of users kept.
+        rank_by (str): The metric users are ranked by, one of `RANKINGS`.
+    """
+
+    def __init__(self, k: int = TOP_K, rank_by: str = "Violations") -> None:
+        """Initializes an empty leaderboard."""
+        if rank_by not in RANKINGS:
+            raise ValueError(f"Unknown ranking: {rank_by} (expected one of {RANKINGS})")
+        self.k = k
+        self.rank_by = rank_by
+
+        # Entries are (score, user key, metrics); the root is the weakest user kept.
+        # Between users with the same score, the greater user key ranks higher.
+        self._heap: List[Tuple[float, str, Dict[str, float]]] = []
+
+    def push(
+        self, user_key: str, violations: int, overlap_minutes: float, plates: int
+    ) -> None:
+        """Offers the metrics of one finished user to the leaderboard."""
+        if violations == 0:
+            return
+        metrics = {
+            "Violations": violations,
+            "Overlap Minutes": overlap_minutes,
+            "Plates Involved": plates,
+        }
+        entry = (metrics[self.rank_by], str(user_key), metrics)
+
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            # Better than the weakest user kept: replace it
+            heapq.heapreplace(self._heap, entry)
+
+    def ranking(self) -> pd.DataFrame:
+        """Returns the users kept, best first, with their rank and metrics."""
+        best_first = sorted(self._heap, key=lambda entry: entry[:2], reverse=True)
+        ranking = pd.DataFrame(
+            [{"User Key": user_key, **metrics} for _, user_key, metrics in best_first],
+            columns=["User Key"] + RANKINGS,
+        )
+        ranking.insert(0, "Rank", range(1, len(ranking) + 1))
+        return ranking
+
+
+def rank_stream(
+    flagged_rows: Iterable[Tuple[Dict, bool]],
+    k: int = TOP_K,
+    rank_by: str = "Violations",
+) -> Leaderboard:
+    """Builds a leaderboard from detection results streamed in (user, leave) order.
+
+    Only the running totals of the current user are held besides the heap.
+
+    Args:
+        flagged_rows: Rows with their violation flag, grouped by user and sorted
+            by leave time, as yielded by `external_sort.stream_detect`.
+        k: Number of users kept.
+        rank_by: The metric users are ranked by, one of `RANKINGS`.
+
+    Returns:
+        The leaderboard of the whole stream.
+    """
+    leaderboard = Leaderboard(k, rank_by)
+
+    current_user: Optional[str] = None
+    violations = 0
+    overlap = 0.0
+    plates: Set[str] = set()
+    anchor_leave = 0.0
+    anchor_plate = ""
+
+    for row, violation in flagged_rows:
+        if row["User Key"] != current_user:
+            if current_user is not None:
+                leaderboard.push(current_user, violations, overlap, len(plates))
+            current_user = row["User Key"]
+            violations, overlap, plates = 0, 0.0, set()
+
+        visit = float(row["Calendar Visit Time"])
+        leave = float(row["Calendar Leave Time"])
+        if violation:
+            violations += 1
+            overlap += min(anchor_leave, leave) - visit
+            plates.update((anchor_plate, row["Vehicle License Plate"]))
+        else:
+            anchor_leave, anchor_plate = leave, row["Vehicle License Plate"]
+
+    if current_user is not None:
+        leaderboard.push(current_user, violations, overlap, len(plates))
+    return leaderboard
+
+
+def _merged_detection(
+    transactions_path: str, owners: pd.Series, run_dir: str
+) -> Iterator[Tuple[Dict, bool]]:
+    """Streams the detection results of an export through the external sort."""
+    run_paths = write_sorted_runs(transactions_path, owners, run_dir)
+    return stream_detect(merge_runs(reduce_runs(run_paths, run_dir)))
+
+
+# ===================================================================================
+# Usage: python leaderboard.py [K] [Violations|"Overlap Minutes"|"Plates Involved"]
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+
+    from ingest import find_export, read_subscriptions
+    from registry import plate_owners
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+    os.makedirs(path_of_write, exist_ok=True)
+
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else TOP_K
+    rank_by = sys.argv[2] if len(sys.argv) > 2 else "Violations"
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        leaderboard = rank_stream(
+            _merged_detection(
+                find_export(path_of_read, "transaction_data.csv"),
+                plate_owners(read_subscriptions(path_of_read)),
+                run_dir,
+            ),
+            k,
+            rank_by,
+        )
+
+    ranking = leaderboard.ranking()
+    ranking.to_csv(path_of_write + LEADERBOARD_NAME, index=False)
+    print(ranking.to_string(index=False))
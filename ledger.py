@@ -0,0 +1,301 @@
+from typing import List, Optional, Tuple  # Used for static typing to reduce errors
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from absolute_time import (
+    calendar_minutes,
+)  # Parses the date and time strings, so their spelling does not change the hashes
+
+
+# ===================================================================================
+# MODULE PURPOSE: Remember the reported violations so a run only reports what is new
+# ===================================================================================
+
+# Every run flags the whole history again, so staff could not tell new violations from
+# the ones already handled. The ledger keeps a compact record of every violation that
+# was reported, and each run is compared against it:
+#   new        violations that were never reported
+#   changed    violations reported before whose details (end time, duration) differ
+#   retracted  violations reported before that are no longer flagged (e.g. the data
+#              was corrected or the grace period changed)
+#
+# A violation is identified by a 64-bit hash of (user, plate, visit start, site), and
+# its details by a second hash. Both are computed for all rows at once with
+# `pd.util.hash_pandas_object`, which gives the same value in every run. The fields are
+# put in a canonical form first, so that a value spelled differently by another run
+# hashes the same: a duration is read as "240" whether its column was parsed as
+# integers or as floats (one blank duration, `--session-gap` or the API turn it into
+# "240.0"), and "03/01/2025 01:30 PM" is the same visit as "3/1/2025 1:30 PM".
+#
+# The ledger is stored as numpy arrays sorted by identity hash: 24 bytes per violation
+# for the two hashes and the day it was first reported. Instead of a python set
+# (roughly 60 bytes per entry plus the ints), the lookups are a vectorized
+# `np.searchsorted` over the sorted array, which stays fast and small with millions of
+# entries.
+#
+# A hash can not be read back, so the identity columns of every violation are stored
+# as well (never searched). They are what a retracted violation is listed with, since
+# it is not part of the current run's report. Each column is stored like a categorical:
+# its distinct values once, as UTF-8 bytes, and per violation the position of its value
+# in the smallest unsigned integer type that fits. The values repeat a lot (a handful
+# of sites, 1440 minutes of the day, one key per user), so this adds about 10 bytes per
+# violation.
+
+
+# Columns identifying a violation, and the columns whose change is reported
+IDENTITY_COLUMNS: List[str] = [
+    "User Key",
+    "Vehicle License Plate",
+    "Visit Start Date (local)",
+    "Visit Start Time (local)",
+    "Site Internal Name",
+]
+DETAIL_COLUMNS: List[str] = [
+    "Visit End Date (local)",
+    "Visit End Time (local)",
+    "Visit Duration (minutes)",
+]
+
+# Columns put in canonical form before hashing (the others are stripped strings)
+DATE_COLUMNS: List[str] = ["Visit Start Date (local)", "Visit End Date (local)"]
+TIME_COLUMNS: List[str] = ["Visit Start Time (local)", "Visit End Time (local)"]
+NUMBER_COLUMNS: List[str] = ["Visit Duration (minutes)"]
+
+# File name of the ledger in the output directory
+LEDGER_NAME: str = "Violation Ledger.npz"
+
+# Version of the ledger file. Version 1 hashed the raw strings and stored the identity
+# columns as one fixed-width string array.
+LEDGER_VERSION: int = 2
+
+# Detail hash of an entry whose details are not known (a version 1 entry, whose
+# identity was hashed again on load); such an entry is never reported as changed
+UNKNOWN_DETAILS: int = 0
+
+
+def _pack_column(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Splits a column into the codes of its values and its distinct UTF-8 values."""
+    codes, uniques = pd.factorize(values.astype(str))
+    distinct = np.array([value.encode("utf-8") for value in uniques], dtype="S")
+    return codes.astype(np.min_scalar_type(max(len(uniques) - 1, 0))), distinct
+
+
+def _unpack_column(codes: np.ndarray, distinct: np.ndarray) -> pd.Categorical:
+    """Rebuilds a column packed by `_pack_column`."""
+    return pd.Categorical.from_codes(
+        codes.astype("int64"), [value.decode("utf-8") for value in distinct]
+    )
+
+
+def _canonical(values: pd.Series, column: str) -> pd.Series:
+    """Puts one column in the canonical form that is hashed.
+
+    Dates become their day number and times their minute of the day (see
+    `calendar_minutes`), numbers are rounded to whole minutes. A value that
+    can not be parsed is kept as its stripped string.
+    """
+    text = values.astype("string").str.strip()
+    if column in DATE_COLUMNS:
+        parsed = calendar_minutes(pd.Series("12:00 AM", index=values.index), values)
+    elif column in TIME_COLUMNS:
+        parsed = calendar_minutes(values, pd.Series("1/1/1970", index=values.index))
+    elif column in NUMBER_COLUMNS:
+        parsed = pd.to_numeric(values, errors="coerce")
+    else:
+        return text.fillna("").astype(str)
+    canonical = parsed.round().astype("Int64").astype("string")
+    return canonical.fillna(text).fillna("").astype(str)
+
+
+def _hash_rows(violations: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Hashes the canonical form of the given columns of every row into one uint64."""
+    canonical = pd.DataFrame(
+        {column: _canonical(violations[column], column) for column in columns},
+        index=violations.index,
+    )
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy(dtype="uint64")
+
+
+class ViolationLedger:
+    """The violations reported by earlier runs, as sorted hash arrays.
+
+    Attributes:
+        path (str): The ledger file.
+        keys (np.ndarray): Identity hashes, sorted ascending.
+        details (np.ndarray): Detail hash of every identity hash.
+        first_reported (np.ndarray): Day each violation was first reported.
+        identities (pd.DataFrame): The `IDENTITY_COLUMNS` of every violation
+            (categorical), one row per identity hash (empty strings in a ledger
+            saved before they were kept).
+    """
+
+    def __init__(self, path: str) -> None:
+        """Loads the ledger, or starts an empty one if the file does not exist."""
+        self.path = path
+        self.keys = np.empty(0, dtype="uint64")
+        self.details = np.empty(0, dtype="uint64")
+        self.first_reported = np.empty(0, dtype="datetime64[D]")
+        self.identities = pd.DataFrame(columns=IDENTITY_COLUMNS, dtype="category")
+
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as ledger:
+                self.keys = ledger["keys"]
+                self.details = ledger["details"]
+                self.first_reported = ledger["first_reported"]
+                version = int(ledger["version"]) if "version" in ledger.files else 1
+                has_identities = "identity_codes_0" in ledger.files
+                if has_identities:
+                    self.identities = pd.DataFrame(
+                        {
+                            column: _unpack_column(
+                                ledger[f"identity_codes_{number}"],
+                                ledger[f"identity_values_{number}"],
+                            )
+                            for number, column in enumerate(IDENTITY_COLUMNS)
+                        }
+                    )
+                elif "identities" in ledger.files:
+                    # Saved by version 1 as one fixed-width string array
+                    has_identities = True
+                    self.identities = pd.DataFrame(
+                        ledger["identities"], columns=IDENTITY_COLUMNS
+                    ).astype("category")
+                else:
+                    self.identities = pd.DataFrame(
+                        "", index=range(len(self.keys)), columns=IDENTITY_COLUMNS
+                    ).astype("category")
+
+            # Version 1 hashed the raw strings: hash the kept identities again.
+            # Their details were not kept, so they can not be reported as changed.
+            if version == 1 and has_identities:
+                keys = _hash_rows(self.identities, IDENTITY_COLUMNS)
+                order = np.argsort(keys, kind="stable")
+                self.keys = keys[order]
+                self.details = np.full(len(keys), UNKNOWN_DETAILS, dtype="uint64")
+                self.first_reported = self.first_reported[order]
+                self.identities = self.identities.iloc[order].reset_index(drop=True)
+
+    def __len__(self) -> int:
+        """Returns the number of violations in the ledger."""
+        return len(self.keys)
+
+    def _positions(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds `keys` in the ledger: their positions and whether they are there.
+
+        The position of a key that is not in the ledger is meaningless.
+        """
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype="int64"), np.zeros(len(keys), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return positions, self.keys[positions] == keys
+
+    def compare(
+        self, violations: pd.DataFrame
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """Compares the violations of this run with the ledger.
+
+        Args:
+            violations: The flagged transactions, with the `IDENTITY_COLUMNS`
+                and `DETAIL_COLUMNS` columns.
+
+        Returns:
+            The new violations, the changed violations, and the retracted ones
+            (their `IDENTITY_COLUMNS`, "Violation Hash" and "First Reported" day).
+        """
+        keys = _hash_rows(violations, IDENTITY_COLUMNS)
+        details = _hash_rows(violations, DETAIL_COLUMNS)
+        positions, found = self._positions(keys)
+
+        changed = found.copy()
+        known = self.details[positions[found]]
+        changed[found] = (known != UNKNOWN_DETAILS) & (known != details[found])
+        new = violations[~found]
+        changed = violations[changed]
+
+        # Entries of the ledger that this run did not flag again
+        still_flagged = np.isin(self.keys, keys)
+        retracted = (
+            self.identities[~still_flagged].astype(str).reset_index(drop=True)
+        ).assign(
+            **{
+                "Violation Hash": [f"{key:016x}" for key in self.keys[~still_flagged]],
+                "First Reported": self.first_reported[~still_flagged],
+            }
+        )
+        return new, changed, retracted
+
+    def update(
+        self, violations: pd.DataFrame, today: Optional[np.datetime64] = None
+    ) -> None:
+        """Replaces the ledger with the violations of this run and saves it.
+
+        Violations already in the ledger keep their first reported day (`today`
+        for the new ones, the current date by default); retracted ones are dropped.
+        """
+        if today is None:
+            today = np.datetime64("today")
+        keys = _hash_rows(violations, IDENTITY_COLUMNS)
+        details = _hash_rows(violations, DETAIL_COLUMNS)
+        positions, found = self._positions(keys)
+        first_reported = np.full(len(keys), np.datetime64(today, "D"))
+        first_reported[found] = self.first_reported[positions[found]]
+
+        keys, unique = np.unique(keys, return_index=True)
+        self.keys = keys
+        self.details = details[unique]
+        self.first_reported = first_reported[unique]
+        self.identities = (
+            violations[IDENTITY_COLUMNS]
+            .astype(str)
+            .iloc[unique]
+            .reset_index(drop=True)
+            .astype("category")
+        )
+
+        packed = {}
+        for number, column in enumerate(IDENTITY_COLUMNS):
+            codes, distinct = _pack_column(self.identities[column])
+            packed[f"identity_codes_{number}"] = codes
+            packed[f"identity_values_{number}"] = distinct
+
+        # Write under a temporary name first, so a failed write keeps the old ledger
+        partial_path = self.path + ".partial.npz"
+        np.savez_compressed(
+            partial_path,
+            keys=self.keys,
+            details=self.details,
+            first_reported=self.first_reported,
+            version=np.array(LEDGER_VERSION),
+            **packed,
+        )
+        os.replace(partial_path, self.path)
+
+
+# ===================================================================================
+# Usage: python ledger.py   (reports new/changed/retracted violations and updates the
+#                            ledger in output/)
+# ===================================================================================
+if __name__ == "__main__":
+    from detection import detect
+    from registry import read_keyed
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+    os.makedirs(path_of_write, exist_ok=True)
+
+    keyed = read_keyed(path_of_read)
+    violation, _ = detect(keyed)
+
+    ledger = ViolationLedger(path_of_write + LEDGER_NAME)
+    new, changed, retracted = ledger.compare(keyed[violation.to_numpy()])
+    ledger.update(keyed[violation.to_numpy()])
+
+    print(f"Ledger entries = {len(ledger)}")
+    print(f"New = {len(new)}, changed = {len(changed)}, retracted = {len(retracted)}")
+    if not retracted.empty:
+        print("Retracted:")
+        print(retracted.to_string(index=False))
@@ -0,0 +1,567 @@
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)  # Used for static typing to reduce errors
+
+import codecs
+import io
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from absolute_time import (
+    add_absolute_times,
+    add_calendar_times,
+)  # Vectorized conversion of time and date columns into the minute scales
+from detection import (
+    Carry,
+    detect,
+    partition_end,
+    partition_labels,
+)  # Greedy detection, one leave-time partition at a time with a carry-over state
+from external_sort import RUN_COLUMNS  # Columns of the keyed transactions written out
+from ingest import (
+    TRANSACTION_COLUMNS,
+    filter_transactions,
+    open_export,
+)  # Reads the (compressed) UTF-16 exports and filters them
+from registry import (
+    active_subscriptions,
+    key_subscribers,
+)  # Keys every transaction by the subscription valid on its visit day, like Catch.py
+from sessions import sessionize  # Merges split visits of the same plate into sessions
+from validation import validate_transactions  # Sets malformed transactions aside
+
+
+# ===================================================================================
+# MODULE PURPOSE: Run ingest, detection and writing as concurrent pipeline stages
+# ===================================================================================
+
+# Catch.py runs strictly one step after the other: the whole export is read, then
+# detection runs, then the reports are written, so the CPU waits on the disk and the
+# disk waits on the CPU. In pipelined mode four stages run in their own threads,
+# connected by bounded queues:
+#   read     reads (and decompresses) the export in blocks and decodes the UTF-16 text
+#   parse    parses each block of complete lines, filters, validates and keys it
+#   detect   flags violations one leave-time partition (month) at a time
+#   write    appends the flagged transactions to the report
+#
+# A full queue blocks the stage feeding it (backpressure), so a slow writer never
+# lets parsed blocks pile up in memory: at most `queue_size` items wait between two
+# stages.
+#
+# Parsing is the heaviest stage and is python/pandas work that holds the GIL, so
+# threads alone do not make it faster. With `workers` above 1 the parse stage hands
+# its blocks to a process pool, keeping at most two blocks per worker in flight and
+# passing the results on in the order of the export.
+#
+# Detection needs all the transactions of a partition. When the export arrives in
+# visit order (the usual case), every later transaction leaves after the latest visit
+# seen so far, so each partition ending before that visit is complete and is flagged
+# while the rest of the export is still being read. The carry-over state of
+# `detection` makes the result the same as a whole-history run. If the order breaks,
+# the remaining partitions are flagged at the end of the input.
+#
+# Blocks are cut at line ends, so the export must not have line breaks inside quoted
+# fields (the operator exports never do).
+#
+# The same stages can be chained in a single thread (`run_sequential`) to compare the
+# wall time of both modes with the time spent in each stage.
+#
+# The transactions are keyed like in Catch.py: each one goes to the user whose
+# subscription of its plate was valid on its visit day (see `subscription_intervals`
+# and `active_subscriptions` in registry.py), and only the users Catch.py flags (the
+# ones with an email) are kept. With a session gap the split visits are merged like
+# `--session-gap` does. A session needs the whole history of its plate, so the parse
+# stage then keeps every validated block and keys the sessions at the end of the input.
+
+
+# The pipeline stages, in order
+STAGE_NAMES: List[str] = ["read", "parse", "detect", "write"]
+
+# Bytes of the export read per block (1 MiB)
+BLOCK_BYTES: int = 1 << 20
+
+# Capacity of each queue between two stages
+QUEUE_SIZE: int = 8
+
+# Columns of the pipelined report
+REPORT_COLUMNS: List[str] = RUN_COLUMNS + ["Violation"]
+
+# File name of the pipelined report in the output directory
+PIPELINED_REPORT_NAME: str = "Pipelined Report.csv"
+
+# Marks the end of a stream in a queue
+_END = object()
+
+
+def read_blocks(path: str, block_bytes: int = BLOCK_BYTES) -> Iterator[str]:
+    """Reads an export and yields its decoded text in blocks of complete lines.
+
+    The first block starts with the header line.
+    """
+    decoder = codecs.getincrementaldecoder("utf-16")()
+    pending = ""
+    with open_export(path) as source:
+        while True:
+            block = source.read(block_bytes)
+            text = pending + decoder.decode(block, final=not block)
+            if not block:
+                if text.strip():
+                    yield text
+                return
+
+            # Keep the incomplete last line for the next block
+            cut = text.rfind("\n") + 1
+            pending = text[cut:]
+            if cut:
+                yield text[:cut]
+
+
+def key_block(
+    transactions: pd.DataFrame, windows: pd.DataFrame, users: Set[str]
+) -> pd.DataFrame:
+    """Keys validated transactions (or sessions) by their subscriber, like Catch.py.
+
+    Only the transactions of `users` with both times are kept; the "Transaction
+    Id" is the position in `transactions`.
+    """
+    keyed = key_subscribers(transactions, active_subscriptions(transactions, windows))
+    keyed = keyed[keyed["User Key"].isin(users)]
+    return keyed.dropna(subset=["Calendar Visit Time", "Calendar Leave Time"])
+
+
+def parse_block(
+    text: str, windows: pd.DataFrame, users: Set[str], keyed: bool = True
+) -> Tuple[pd.DataFrame, int]:
+    """Parses one block (header line included) into keyed transactions.
+
+    Returns:
+        The keyed transactions, with a "Transaction Id" relative to the block
+        (or only the validated transactions when `keyed` is False), and the
+        number of valid transactions in the block.
+    """
+    chunk = pd.read_csv(
+        io.StringIO(text), usecols=TRANSACTION_COLUMNS, low_memory=False
+    )
+    valid, _ = validate_transactions(filter_transactions(chunk))
+    if not keyed:
+        return valid, len(valid)
+    return key_block(valid, windows, users), len(valid)
+
+
+def parse_blocks(
+    blocks: Iterable[str],
+    windows: pd.DataFrame,
+    users: Set[str],
+    workers: int = 1,
+    session_gap: Optional[float] = None,
+) -> Iterator[pd.DataFrame]:
+    """Parses blocks of lines into filtered, validated and keyed transactions.
+
+    Rows whose visit or leave time is missing are dropped. The "Transaction Id"
+    is the position in the valid transactions of the whole export.
+
+    Args:
+        blocks: Blocks of complete lines from `read_blocks`.
+        windows: The subscription validity intervals from
+            `registry.subscription_intervals`.
+        users: The user keys whose transactions are kept.
+        workers: Number of processes parsing blocks in parallel.
+        session_gap: Merge each plate's visits separated by less than this many
+            minutes (see `sessions.sessionize`). The sessions are then keyed
+            and yielded at the end of the input, as a single Data Frame whose
+            "Transaction Id" is the position among the sessions.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    in_flight: "deque[Future]" = deque()
+    header: Optional[str] = None
+    offset = 0
+    keyed = session_gap is None
+    validated: List[pd.DataFrame] = []
+
+    def numbered(block: pd.DataFrame, valid: int) -> Iterator[pd.DataFrame]:
+        nonlocal offset
+        if not keyed:
+            validated.append(block)
+            return
+        block["Transaction Id"] += offset
+        offset += valid
+        yield block
+
+    try:
+        for text in blocks:
+            if header is None:
+                header, _, text = text.partition("\n")
+                header += "\n"
+            if not text.strip():
+                continue
+
+            if pool is None:
+                yield from numbered(*parse_block(header + text, windows, users, keyed))
+                continue
+
+            in_flight.append(
+                pool.submit(parse_block, header + text, windows, users, keyed)
+            )
+            if len(in_flight) >= 2 * workers:
+                yield from numbered(*in_flight.popleft().result())
+
+        while in_flight:
+            yield from numbered(*in_flight.popleft().result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if validated:
+        transactions = pd.concat(validated, ignore_index=True)
+        sessions = sessionize(
+            add_calendar_times(add_absolute_times(transactions)), session_gap
+        )
+        yield key_block(sessions, windows, users)
+
+
+def detect_partitions(
+    chunks: Iterable[pd.DataFrame], period: str = "month", grace: float = 0
+) -> Iterator[pd.DataFrame]:
+    """Flags keyed transactions one leave-time partition at a time, as they complete.
+
+    Args:
+        chunks: Keyed transactions, in the order of the export.
+        period: "month" or "week" (see `detection.partition_labels`).
+        grace: Minutes of overlap tolerated before it counts as a violation.
+
+    Yields:
+        The transactions of each partition, in increasing partition order, with
+        the `REPORT_COLUMNS` ("Violation" is "Violator" or empty).
+    """
+    pending: Dict[float, List[pd.DataFrame]] = {}
+    carry: Carry = {}
+
+    # Latest visit seen, and whether the visits arrived in order so far
+    watermark = -np.inf
+    in_order = True
+
+    def flagged(label: float) -> pd.DataFrame:
+        nonlocal carry
+        partition = pd.concat(pending.pop(label), ignore_index=True)
+        violation, carry = detect(partition, carry, grace)
+        partition["Violation"] = np.where(violation, "Violator", "")
+        return partition[REPORT_COLUMNS]
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        for label, partition in chunk.groupby(partition_labels(chunk, period)):
+            pending.setdefault(label, []).append(partition)
+
+        visits = chunk["Calendar Visit Time"]
+        in_order = (
+            in_order and visits.is_monotonic_increasing and visits.iloc[0] >= watermark
+        )
+        watermark = max(watermark, visits.max())
+
+        # Every later transaction leaves after the watermark, so the partitions
+        # ending before it are complete
+        while in_order and pending and partition_end(min(pending), period) <= watermark:
+            yield flagged(min(pending))
+
+    while pending:
+        yield flagged(min(pending))
+
+
+def write_report(partitions: Iterable[pd.DataFrame], report_path: str) -> Iterator[int]:
+    """Appends each flagged partition to the report, yielding its violation count."""
+    with open(report_path, "w", encoding="utf-8", newline="") as report:
+        pd.DataFrame(columns=REPORT_COLUMNS).to_csv(report, index=False)
+        for partition in partitions:
+            partition.to_csv(report, header=False, index=False)
+            yield int((partition["Violation"] == "Violator").sum())
+
+
+def _stages(
+    path: str,
+    windows: pd.DataFrame,
+    users: Set[str],
+    report_path: str,
+    block_bytes: int,
+    period: str,
+    grace: float,
+    workers: int,
+    session_gap: Optional[float],
+) -> List[Callable[[Iterable], Iterator]]:
+    """Returns the stages as functions from an input stream to an output stream."""
+    return [
+        lambda _: read_blocks(path, block_bytes),
+        lambda blocks: parse_blocks(blocks, windows, users, workers, session_gap),
+        lambda chunks: detect_partitions(chunks, period, grace),
+        lambda partitions: write_report(partitions, report_path),
+    ]
+
+
+def run_sequential(
+    path: str,
+    windows: pd.DataFrame,
+    users: Set[str],
+    report_path: str,
+    block_bytes: int = BLOCK_BYTES,
+    period: str = "month",
+    grace: float = 0,
+    session_gap: Optional[float] = None,
+) -> Tuple[int, Dict[str, float]]:
+    """Chains the stages in a single thread.
+
+    The arguments are those of `run_pipelined`.
+
+    Returns:
+        The number of violations, and the seconds spent in each stage (and
+        "wall" for the whole run).
+    """
+    start = time.perf_counter()
+    inclusive: List[float] = []
+    stream: Iterable = iter(())
+
+    def metered(items: Iterator, slot: int) -> Iterator:
+        # Time spent producing each item, including the upstream stages
+        while True:
+            begin = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                inclusive[slot] += time.perf_counter() - begin
+                return
+            inclusive[slot] += time.perf_counter() - begin
+            yield item
+
+    for slot, stage in enumerate(
+        _stages(
+            path,
+            windows,
+            users,
+            report_path,
+            block_bytes,
+            period,
+            grace,
+            1,
+            session_gap,
+        )
+    ):
+        inclusive.append(0.0)
+        stream = metered(stage(stream), slot)
+    violations = sum(stream)
+
+    timings = {
+        name: inclusive[slot] - (inclusive[slot - 1] if slot else 0.0)
+        for slot, name in enumerate(STAGE_NAMES)
+    }
+    timings["wall"] = time.perf_counter() - start
+    return violations, timings
+
+
+def run_pipelined(
+    path: str,
+    windows: pd.DataFrame,
+    users: Set[str],
+    report_path: str,
+    block_bytes: int = BLOCK_BYTES,
+    period: str = "month",
+    grace: float = 0,
+    queue_size: int = QUEUE_SIZE,
+    workers: int = 1,
+    session_gap: Optional[float] = None,
+) -> Tuple[int, Dict[str, float]]:
+    """Runs every stage in its own thread, connected by bounded queues.
+
+    An error in any stage stops the others and is raised again here. With
+    `workers` above 1 the parse stage parses blocks in a process pool.
+
+    Args:
+        path: The transaction export.
+        windows: The validity intervals of `registry.subscription_intervals`.
+        users: The user keys to flag (the users with an email, like Catch.py).
+        report_path: The report to write.
+        block_bytes: Bytes of the export read per block.
+        period: Detection partition, "month" or "week".
+        grace: Minutes of overlap tolerated before it counts as a violation.
+        queue_size: Capacity of each queue between two stages.
+        workers: Number of processes parsing blocks in parallel.
+        session_gap: Merge split visits like `--session-gap` in Catch.py.
+
+    Returns:
+        The number of violations, and the seconds each stage was busy, i.e.
+        not waiting on a queue (and "wall" for the whole run).
+    """
+    stages = _stages(
+        path,
+        windows,
+        users,
+        report_path,
+        block_bytes,
+        period,
+        grace,
+        workers,
+        session_gap,
+    )
+    queues: List["queue.Queue"] = [queue.Queue(queue_size) for _ in stages[:-1]]
+    waiting = [0.0] * len(stages)
+    busy: Dict[str, float] = {}
+    results: List[int] = []
+    errors: List[BaseException] = []
+    stop = threading.Event()
+
+    def receive(inbox: "queue.Queue", slot: int) -> Iterator:
+        while True:
+            begin = time.perf_counter()
+            while True:
+                try:
+                    item = inbox.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    if stop.is_set():
+                        return
+            waiting[slot] += time.perf_counter() - begin
+            if item is _END:
+                return
+            yield item
+
+    def send(outbox: "queue.Queue", item: object, slot: int) -> None:
+        begin = time.perf_counter()
+        while not stop.is_set():
+            try:
+                outbox.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        waiting[slot] += time.perf_counter() - begin
+
+    def run(slot: int) -> None:
+        begin = time.perf_counter()
+        inbox = queues[slot - 1] if slot else None
+        outbox = queues[slot] if slot < len(queues) else None
+        try:
+            for item in stages[slot](receive(inbox, slot) if inbox else iter(())):
+                if outbox is None:
+                    results.append(item)
+                else:
+                    send(outbox, item, slot)
+        except BaseException as error:  # noqa: BLE001  # re-raised by the caller
+            errors.append(error)
+            stop.set()
+        finally:
+            if outbox is not None:
+                send(outbox, _END, slot)
+            busy[STAGE_NAMES[slot]] = time.perf_counter() - begin - waiting[slot]
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run, args=(slot,), name=STAGE_NAMES[slot], daemon=True)
+        for slot in range(len(stages))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    timings = {name: busy[name] for name in STAGE_NAMES}
+    timings["wall"] = time.perf_counter() - start
+    return sum(results), timings
+
+
+# ===================================================================================
+# Compare the pipelined run with the same stages run one after another, and with the
+# report of Catch.py when it was run before with the same session gap
+# Usage: python pipeline.py [queue size] [block size in KiB] [parse workers] [gap]
+#        (writes output/Pipelined Report.csv; parse workers default to the CPU count)
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+    import sys
+
+    from ingest import find_export, read_subscriptions, read_transactions
+    from registry import (
+        backfill_user_ids,
+        plate_owners,
+        registration_dates,
+        subscription_intervals,
+    )
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+    os.makedirs(path_of_write, exist_ok=True)
+
+    queue_size = int(sys.argv[1]) if len(sys.argv) > 1 else QUEUE_SIZE
+    block_bytes = int(sys.argv[2]) * 1024 if len(sys.argv) > 2 else BLOCK_BYTES
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 1
+    session_gap = float(sys.argv[4]) if len(sys.argv) > 4 else None
+
+    # The subscription windows need every user's User Id and registration day, which
+    # only the transactions have: they are found in a pass before the pipeline.
+    export = find_export(path_of_read, "transaction_data.csv")
+    subscriptions = read_subscriptions(path_of_read)
+    transactions = read_transactions(path_of_read)
+    owners = plate_owners(subscriptions)
+    user_ids, _ = backfill_user_ids(transactions, owners)
+    windows = subscription_intervals(
+        subscriptions, registration_dates(transactions, user_ids), owners
+    )
+    users = set(subscriptions["User Email"].dropna().astype(str))
+    report_path = path_of_write + PIPELINED_REPORT_NAME
+
+    sequential, sequential_times = run_sequential(
+        export, windows, users, report_path, block_bytes, session_gap=session_gap
+    )
+    pipelined, pipelined_times = run_pipelined(
+        export,
+        windows,
+        users,
+        report_path,
+        block_bytes,
+        queue_size=queue_size,
+        workers=workers,
+        session_gap=session_gap,
+    )
+    assert sequential == pipelined, "The pipelined run flagged different violations"
+
+    times = pd.DataFrame(
+        {"Sequential (s)": sequential_times, "Pipelined busy (s)": pipelined_times}
+    )
+    print(f"Violations = {pipelined} (parse workers: {workers})")
+    print(times.round(3).to_string())
+    stage_sum = sum(pipelined_times[name] for name in STAGE_NAMES)
+    speedup = sequential_times["wall"] / pipelined_times["wall"]
+    print(f"Sum of the pipelined stage times = {stage_sum:.3f}s")
+    print(f"Speed-up over the sequential run = {speedup:.2f}x")
+
+    # The violations of Catch.py's report, by plate and visit start
+    catch_report_path = path + "Final Report.xlsx"
+    if os.path.exists(catch_report_path):
+        report = pd.read_csv(report_path, dtype=str, keep_default_na=False)
+        flagged = report[report["Violation"] == "Violator"][
+            [
+                "Vehicle License Plate",
+                "Visit Start Date (local)",
+                "Visit Start Time (local)",
+            ]
+        ]
+        catch_report = pd.read_excel(catch_report_path, dtype=str)
+        catch_flagged = catch_report[catch_report["Violation"] == "Violator"][
+            ["License Plate", "Visit Start Date", "Visit Start Time"]
+        ]
+        same = sorted(map(tuple, flagged.to_numpy())) == sorted(
+            map(tuple, catch_flagged.to_numpy())
+        )
+        print(f"Same violations as {catch_report_path} = {same}")
@@ -0,0 +1,179 @@
+from typing import Dict, List, Tuple  # Used for static typing to reduce errors
+
+import numpy as np
+import pandas as pd
+
+
+# ===================================================================================
+# MODULE PURPOSE: Answer "which of this user's cars were parked at time t?"
+# ===================================================================================
+
+# The index is built once from the keyed transactions (see `registry.key_transactions`)
+# and then answers point-in-time and time-range questions with binary searches, so
+# thousands of lookups per second are possible without touching the Data Frame again.
+# The times are calendar minutes ("Calendar Visit Time" and "Calendar Leave Time"),
+# which include the year, so a multi-year history is one timeline.
+#
+# For every user the finished stays are sorted by visit time and stored as arrays:
+# - visit:   calendar visit minute, sorted ascending
+# - leave:   calendar leave minute
+# - reach:   running maximum of `leave`, which is also sorted ascending
+#
+# A transaction [visit, leave) overlaps the window [t0, t1) when visit < t1 and
+# leave > t0. Every candidate is at a position before the first visit >= t1, and no
+# transaction before the first position whose reach > t0 can still be inside at t0.
+# Both positions are found with `np.searchsorted`; only the few rows in between are
+# checked one by one.
+#
+# A car that is still inside (no end time yet) has no leave minute. Kept in the arrays
+# with an infinite leave it would make `reach` infinite for every later visit and turn
+# every later lookup into a linear scan, so the open stays of each user are kept in a
+# separate short list and checked on their own: inside from their visit on.
+
+# A single transaction returned by the index: (plate, visit minute, leave minute)
+Visit = Tuple[str, float, float]
+
+
+class PresenceIndex:
+    """Per-user sorted timelines of parking transactions.
+
+    Attributes:
+        timelines (Dict[str, Tuple[np.ndarray, ...]]): For every user key the
+            (visit, leave, reach, plate) arrays of the finished stays, sorted
+            by visit time.
+        open_stays (Dict[str, List[Tuple[str, float]]]): For every user key
+            with a car still inside, the (plate, visit) of those cars.
+    """
+
+    def __init__(self, keyed_transactions: pd.DataFrame) -> None:
+        """Builds the timelines of every user in a single pass.
+
+        Args:
+            keyed_transactions: Transactions with the "User Key",
+                "Calendar Visit Time" and "Calendar Leave Time" columns.
+        """
+        transactions = keyed_transactions[
+            keyed_transactions["Calendar Visit Time"].notna()
+        ]
+
+        # A transaction without an end time is a car that is still inside
+        still_inside = transactions["Visit End Time (local)"].isna()
+        self.open_stays: Dict[str, List[Tuple[str, float]]] = {}
+        for key, plate, visit in zip(
+            transactions.loc[still_inside, "User Key"],
+            transactions.loc[still_inside, "Vehicle License Plate"].astype(str),
+            transactions.loc[still_inside, "Calendar Visit Time"],
+        ):
+            self.open_stays.setdefault(str(key), []).append((plate, float(visit)))
+
+        # Finished stays whose end can not be parsed can not be placed
+        finished = transactions[
+            ~still_inside & transactions["Calendar Leave Time"].notna()
+        ]
+        frame = pd.DataFrame(
+            {
+                "key": finished["User Key"].to_numpy(),
+                "visit": finished["Calendar Visit Time"].to_numpy("float64"),
+                "leave": finished["Calendar Leave Time"].to_numpy("float64"),
+                "plate": finished["Vehicle License Plate"].astype(str).to_numpy(),
+            }
+        ).sort_values(["key", "visit"], kind="stable")
+
+        self.timelines: Dict[str, Tuple[np.ndarray, ...]] = {}
+        for key, group in frame.groupby("key", sort=False):
+            leave_times = group["leave"].to_numpy()
+            self.timelines[str(key)] = (
+                group["visit"].to_numpy(),
+                leave_times,
+                np.maximum.accumulate(leave_times),
+                group["plate"].to_numpy(),
+            )
+
+    def __len__(self) -> int:
+        """Returns the number of users in the index."""
+        return len(self.timelines.keys() | self.open_stays.keys())
+
+    def overlaps(self, user: str, t0: float, t1: float) -> List[Visit]:
+        """Lists the transactions of a user that overlap the window [t0, t1).
+
+        Args:
+            user: The user key (email, or plate for users without an email).
+            t0: Start of the window in calendar minutes.
+            t1: End of the window in calendar minutes.
+
+        Returns:
+            (plate, visit, leave) tuples in order of visit time, with an infinite
+            leave for a car that is still inside. An unknown user has no
+            transactions.
+        """
+        found: List[Visit] = [
+            (plate, visit, np.inf)
+            for plate, visit in self.open_stays.get(user, [])
+            if visit < t1
+        ]
+        if user in self.timelines:
+            visit, leave, reach, plate = self.timelines[user]
+            first = int(np.searchsorted(reach, t0, side="right"))
+            last = int(np.searchsorted(visit, t1, side="left"))
+            found.extend(
+                (plate[k], visit[k], leave[k])
+                for k in range(first, last)
+                if leave[k] > t0
+            )
+        return sorted(found, key=lambda stay: stay[1])
+
+    def who_was_parked(self, user: str, t: float) -> List[str]:
+        """Lists the plates of a user that were inside the ramp at minute t.
+
+        A car counts as inside from its visit minute up to (not including)
+        its leave minute, and from its visit minute on while it has not left.
+        """
+        parked: List[str] = []
+        if user in self.timelines:
+            visit, leave, reach, plate = self.timelines[user]
+            first = int(np.searchsorted(reach, t, side="right"))
+            last = int(np.searchsorted(visit, t, side="right"))
+            parked = [plate[k] for k in range(first, last) if leave[k] > t]
+        parked.extend(
+            plate for plate, visit in self.open_stays.get(user, []) if visit <= t
+        )
+        return parked
+
+
+# ===================================================================================
+# Usage: python presence.py USER DATE TIME
+#        (e.g. python presence.py a@b.com 3/1/2025 "1:30 PM")
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+    import random
+    import sys
+    import time
+
+    from absolute_time import calendar_minutes
+    from registry import read_keyed
+
+    path_of_read = os.getcwd() + "/data/"
+    start = time.perf_counter()
+    keyed = read_keyed(path_of_read)
+    index = PresenceIndex(keyed)
+    print(f"Indexed {len(index)} users in {time.perf_counter() - start:.2f}s")
+
+    if len(sys.argv) > 3:
+        minute = calendar_minutes(pd.Series([sys.argv[3]]), pd.Series([sys.argv[2]]))[0]
+        print(f"Parked: {', '.join(index.who_was_parked(sys.argv[1], minute))}")
+
+    # Benchmark random lookups over the whole time range of the data
+    if len(index) > 0:
+        users = list(index.timelines)
+        low = float(keyed["Calendar Visit Time"].min())
+        high = float(keyed["Calendar Visit Time"].max())
+        queries = [
+            (random.choice(users), random.uniform(low, high)) for _ in range(10000)
+        ]
+
+        start = time.perf_counter()
+        for user, minute in queries:
+            index.who_was_parked(user, minute)
+        elapsed = time.perf_counter() - start
+        print(f"{len(queries) / elapsed:,.0f} lookups per second")
@@ -0,0 +1,410 @@
+from typing import Tuple  # Used for static typing to reduce errors
+
+import numpy as np
+import pandas as pd
+
+from absolute_time import (
+    add_absolute_times,
+    add_calendar_times,
+)  # Vectorized conversion of time and date columns into the minute scales
+from ingest import (
+    read_subscriptions,
+    read_transactions,
+)  # Reads the UTF-16 exports into filtered data frames
+
+
+# ===================================================================================
+# MODULE PURPOSE: Vectorized version of the user registry built in Catch.py
+# ===================================================================================
+
+# Catch.py registers users one subscription row at a time (`add_user`) and then groups
+# the transactions one row at a time. The helpers in this module build the same
+# registry with whole-column operations, for the tools that need all the transactions
+# of the subscribed users in a single flat Data Frame.
+#
+# Every user is identified by a "user key":
+# - users with an email are keyed by their email (`users_by_email` in Catch.py)
+# - users without an email are keyed by their only license plate (`unidentified_users`)
+#
+# A plate only belongs to a user while the subscription is valid. The export has no
+# dates, so the validity interval of a (user, plate) subscription starts on the user's
+# "User Registered Date" (found in the transactions through the user's User Id), and a
+# "Subscription Removed" subscription ends where the next subscription of the same
+# plate starts. Each transaction is matched to the subscription of its plate that was
+# valid on its visit day with one sorted as-of join (`pd.merge_asof`).
+
+
+def plate_owners(
+    enterprise_subscription_data: pd.DataFrame, all_owners: bool = False
+) -> pd.Series:
+    """Maps every registered license plate to the key of the user who owns it.
+
+    Follows the same rules as Catch.py: a plate registered with an email belongs
+    to that email, even if the same plate is also registered without one. When a
+    plate is registered to several emails the first one in the export is used,
+    unless `all_owners` is set.
+
+    Args:
+        enterprise_subscription_data: The filtered subscription data.
+        all_owners: Keep every email a plate is registered to. The returned
+            Series then has one entry per (plate, email) pair.
+
+    Returns:
+        A Series indexed by license plate whose values are user keys.
+    """
+    plates = (
+        enterprise_subscription_data["Vehicle License Plate Text"]
+        .astype(str)
+        .str.strip()
+    )
+    emails = enterprise_subscription_data["User Email"]
+
+    # Users without an email are keyed by their plate
+    keys = emails.astype("object").where(emails.notna(), plates)
+
+    owners = pd.DataFrame({"plate": plates, "key": keys, "has_email": emails.notna()})
+
+    # Stable sort so that emails come first, in the order of the export
+    owners = owners.sort_values("has_email", ascending=False, kind="stable")
+    if all_owners:
+        # A plate-keyed entry only survives when no email owns the plate
+        owners = owners.drop_duplicates(["plate", "key"])
+        owners = owners[owners["has_email"] | ~owners["plate"].duplicated()]
+    else:
+        owners = owners.drop_duplicates("plate")
+    return owners.set_index("plate")["key"]
+
+
+def plate_tiers(enterprise_subscription_data: pd.DataFrame) -> pd.Series:
+    """Maps every registered license plate to its subscription tier.
+
+    The tier is the "Enterprise Name" of the plate's subscription (1st Vehicle or
+    Additional Vehicle). A plate listed more than once keeps its first tier.
+
+    Returns:
+        A Series indexed by license plate whose values are tier names.
+    """
+    plates = (
+        enterprise_subscription_data["Vehicle License Plate Text"]
+        .astype(str)
+        .str.strip()
+    )
+    tiers = pd.Series(
+        enterprise_subscription_data["Enterprise Name"].to_numpy(), index=plates
+    )
+    return tiers[~tiers.index.duplicated()]
+
+
+def user_table(enterprise_subscription_data: pd.DataFrame) -> pd.DataFrame:
+    """Builds one row per user with their contact details.
+
+    For a user listed more than once, the details of the first row in the
+    export are kept, as `add_user` does in Catch.py.
+
+    Returns:
+        A Data Frame with the columns "User Key", "First", "Last", "Email"
+        and "Phone Number".
+    """
+    plates = (
+        enterprise_subscription_data["Vehicle License Plate Text"]
+        .astype(str)
+        .str.strip()
+    )
+    emails = enterprise_subscription_data["User Email"]
+    has_email = emails.notna()
+
+    users = pd.DataFrame(
+        {
+            "User Key": emails.astype("object").where(has_email, plates),
+            "First": enterprise_subscription_data["User First Name"].where(has_email),
+            "Last": enterprise_subscription_data["User Last Name"].where(has_email),
+            "Email": emails,
+            "Phone Number": enterprise_subscription_data["User Phone Number"].where(
+                has_email
+            ),
+        }
+    )
+    return users.drop_duplicates("User Key").reset_index(drop=True)
+
+
+def key_transactions(transaction_data: pd.DataFrame, owners: pd.Series) -> pd.DataFrame:
+    """Attaches the owning user key and absolute times to every transaction.
+
+    Transactions whose plate is not registered to any subscribed user are
+    dropped. The remaining rows keep their original order. When `owners` maps
+    a plate to several users, its transactions are repeated once per user.
+
+    Args:
+        transaction_data: The filtered transaction data.
+        owners: The plate to user key mapping from `plate_owners`.
+
+    Returns:
+        A copy of the subscribed users' transactions with the additional columns
+        "Transaction Id" (the row position in `transaction_data`), "User Key",
+        "Absolute Visit Time", "Absolute Leave Time", "Calendar Visit Time" and
+        "Calendar Leave Time".
+    """
+    keyed = transaction_data.assign(
+        **{
+            "Vehicle License Plate": transaction_data["Vehicle License Plate"].astype(
+                str
+            ),
+            "Transaction Id": range(len(transaction_data)),
+        }
+    )
+    keyed = keyed.merge(
+        owners.rename("User Key"),
+        how="inner",
+        left_on="Vehicle License Plate",
+        right_index=True,
+    ).reset_index(drop=True)
+
+    return add_calendar_times(add_absolute_times(keyed))
+
+
+def read_keyed(path_of_read: str, all_owners: bool = False) -> pd.DataFrame:
+    """Reads both exports of a data directory and keys the transactions.
+
+    This is where the command line checks of the other modules start.
+
+    Args:
+        path_of_read: The directory holding the exports.
+        all_owners: Key a plate registered to several emails once per email
+            (see `plate_owners`).
+    """
+    return key_transactions(
+        read_transactions(path_of_read),
+        plate_owners(read_subscriptions(path_of_read), all_owners),
+    )
+
+
+def backfill_user_ids(
+    transaction_data: pd.DataFrame, owners: pd.Series
+) -> Tuple[pd.Series, pd.DataFrame]:
+    """Finds the User Id of every user from the transaction data in one pass.
+
+    The User Id is not part of the subscription export, so it is taken from the
+    first transaction (in file order) made with any of the user's plates. The
+    same pass checks that every plate is only ever seen with one User Id.
+
+    Args:
+        transaction_data: The filtered transaction data.
+        owners: The plate to user key mapping from `plate_owners`.
+
+    Returns:
+        A Series mapping user keys to their User Id, and an integrity report
+        with one row per plate seen with conflicting User Ids (columns
+        "License Plate", "User Key" and "User Ids").
+    """
+    ids = pd.DataFrame(
+        {
+            "plate": transaction_data["Vehicle License Plate"].astype(str),
+            "id": pd.to_numeric(transaction_data["User Id"], errors="coerce"),
+        }
+    ).dropna()
+    ids = ids[ids["plate"].isin(owners.index)]
+
+    # Every distinct (plate, User Id) pair, in the order it was first seen
+    pairs = ids.drop_duplicates().astype({"id": "int64"})
+    pairs["key"] = pairs["plate"].map(owners)
+
+    first_ids = pairs.drop_duplicates("key").set_index("key")["id"]
+
+    # Plates seen with more than one User Id
+    conflicting = pairs[pairs["plate"].duplicated(keep=False)]
+    conflicts = (
+        conflicting.groupby("plate", sort=False)
+        .agg(
+            key=("key", "first"),
+            ids=("id", lambda values: ", ".join(map(str, values))),
+        )
+        .reset_index()
+        .rename(
+            columns={"plate": "License Plate", "key": "User Key", "ids": "User Ids"}
+        )
+    )
+    return first_ids, conflicts
+
+
+# Values of "Current Status (description)" in the subscription export
+SUBSCRIPTION_ADDED: str = "Subscription Added"
+SUBSCRIPTION_REMOVED: str = "Subscription Removed"
+
+
+def registration_dates(
+    transaction_data: pd.DataFrame, user_ids: pd.Series
+) -> pd.Series:
+    """Finds the day every user registered, from the transactions of their User Id.
+
+    Args:
+        transaction_data: The filtered transaction data.
+        user_ids: The user key to User Id mapping from `backfill_user_ids`.
+
+    Returns:
+        A Series mapping user keys to their registration day (users whose User
+        Id or registration date is unknown are left out).
+    """
+    registered = pd.DataFrame(
+        {
+            "id": pd.to_numeric(transaction_data["User Id"], errors="coerce"),
+            "day": pd.to_datetime(
+                transaction_data["User Registered Date"],
+                format="%m/%d/%Y",
+                errors="coerce",
+            ),
+        }
+    ).dropna()
+    first_days = registered.groupby("id")["day"].min()
+    return user_ids.map(first_days).dropna()
+
+
+def subscription_intervals(
+    enterprise_subscription_data: pd.DataFrame,
+    registered: pd.Series,
+    owners: pd.Series,
+) -> pd.DataFrame:
+    """Builds the validity interval of every (user, plate) subscription.
+
+    A subscription is valid from its user's registration day (from the start of
+    time when it is unknown). An added subscription never ends; a removed one
+    ends where the next subscription of the same plate starts, or never when
+    there is none, since the export does not say when it was removed.
+
+    Between subscriptions of a plate starting on the same day, an added one
+    ranks above a removed one, and then the plate's owner in `owners` wins.
+
+    Args:
+        enterprise_subscription_data: The filtered subscription data.
+        registered: The user key to registration day mapping from
+            `registration_dates`.
+        owners: The plate to user key mapping that decides ties.
+
+    Returns:
+        A Data Frame with the columns "Vehicle License Plate", "User Key",
+        "Valid From", "Valid To" and "Status", sorted by plate and then by
+        rank (the highest ranked subscription of a day comes last).
+    """
+    plates = (
+        enterprise_subscription_data["Vehicle License Plate Text"]
+        .astype(str)
+        .str.strip()
+    )
+    all_owners = plate_owners(enterprise_subscription_data, all_owners=True)
+
+    subscriptions = pd.DataFrame(
+        {
+            "Vehicle License Plate": plates,
+            "User Key": enterprise_subscription_data["User Email"]
+            .astype("object")
+            .where(enterprise_subscription_data["User Email"].notna(), plates),
+            "Status": enterprise_subscription_data["Current Status (description)"],
+        }
+    )
+    # A plate-keyed subscription is dropped when an email owns the plate
+    subscriptions = subscriptions.merge(
+        all_owners.rename("User Key").reset_index(),
+        left_on=["Vehicle License Plate", "User Key"],
+        right_on=["plate", "User Key"],
+    ).drop(columns="plate")
+
+    # A (user, plate) listed more than once is added if any of its rows is
+    subscriptions["Added"] = subscriptions["Status"] != SUBSCRIPTION_REMOVED
+    subscriptions = subscriptions.sort_values("Added", ascending=False, kind="stable")
+    subscriptions = subscriptions.drop_duplicates(["Vehicle License Plate", "User Key"])
+
+    subscriptions["Valid From"] = (
+        subscriptions["User Key"]
+        .map(registered)
+        .astype("datetime64[ns]")
+        .fillna(pd.Timestamp.min)
+    )
+    subscriptions["Owner"] = (
+        subscriptions["Vehicle License Plate"].map(owners) == subscriptions["User Key"]
+    )
+    subscriptions = subscriptions.sort_values(
+        ["Vehicle License Plate", "Valid From", "Added", "Owner"], kind="stable"
+    ).reset_index(drop=True)
+
+    # A removed subscription ends where the next one of the plate starts
+    next_start = subscriptions.groupby("Vehicle License Plate")["Valid From"].shift(-1)
+    subscriptions["Valid To"] = next_start.where(~subscriptions["Added"]).fillna(
+        pd.Timestamp.max
+    )
+    return subscriptions[
+        ["Vehicle License Plate", "User Key", "Valid From", "Valid To", "Status"]
+    ]
+
+
+def active_subscriptions(
+    transaction_data: pd.DataFrame, intervals: pd.DataFrame
+) -> pd.Series:
+    """Finds the user whose subscription covered each transaction's plate that day.
+
+    One as-of join over the transactions sorted by visit day picks, for every
+    transaction, the last subscription of its plate that started on or before
+    the visit; the match only counts if the visit is before its end.
+
+    Args:
+        transaction_data: The filtered transaction data.
+        intervals: The validity intervals from `subscription_intervals`.
+
+    Returns:
+        A Series aligned with `transaction_data` holding the user key, or NaN
+        for transactions no subscription was valid for.
+    """
+    visits = pd.DataFrame(
+        {
+            "Vehicle License Plate": transaction_data["Vehicle License Plate"]
+            .astype(str)
+            .to_numpy(),
+            "Visit Day": pd.to_datetime(
+                transaction_data["Visit Start Date (local)"],
+                format="%m/%d/%Y",
+                errors="coerce",
+            )
+            .astype("datetime64[ns]")
+            .to_numpy(),
+            "Row": np.arange(len(transaction_data)),
+        }
+    ).dropna(subset=["Visit Day"])
+
+    matched = pd.merge_asof(
+        visits.sort_values("Visit Day", kind="stable"),
+        intervals.sort_values("Valid From", kind="stable"),
+        left_on="Visit Day",
+        right_on="Valid From",
+        by="Vehicle License Plate",
+        direction="backward",
+    )
+    matched = matched[matched["Visit Day"] < matched["Valid To"]]
+
+    keys = np.full(len(transaction_data), np.nan, dtype=object)
+    keys[matched["Row"].to_numpy()] = matched["User Key"].to_numpy()
+    return pd.Series(keys, index=transaction_data.index, name="User Key")
+
+
+def key_subscribers(
+    transaction_data: pd.DataFrame, subscriber_keys: pd.Series
+) -> pd.DataFrame:
+    """Attaches the subscriber key and the times to every subscribed transaction.
+
+    Like `key_transactions`, but every transaction goes to the one user whose
+    subscription of the plate was valid on its visit day, as in Catch.py.
+
+    Args:
+        transaction_data: The filtered transaction data.
+        subscriber_keys: The user key of every transaction from
+            `active_subscriptions` (NaN for the ones no subscription covered).
+
+    Returns:
+        A copy of the covered transactions, in their original order, with the
+        same additional columns as `key_transactions`.
+    """
+    keyed = transaction_data.assign(
+        **{
+            "Transaction Id": range(len(transaction_data)),
+            "User Key": subscriber_keys.to_numpy(),
+        }
+    )
+    keyed = keyed[keyed["User Key"].notna()]
+    return add_calendar_times(add_absolute_times(keyed))
@@ -0,0 +1,203 @@
+from typing import Dict, Optional, Tuple  # Used for static typing to reduce errors
+
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# ===================================================================================
+# MODULE PURPOSE: Replay historical transactions as live gate events to time detection
+# ===================================================================================
+
+# There is no live feed to test a real-time mode against, so the history is replayed:
+# every keyed transaction becomes an entry event at its visit minute and an exit event
+# at its leave minute, on the calendar scale (so years do not interleave and the pacing
+# follows the real length of every month). A feeder thread releases the events in time
+# order, either paced at a speed-up of the original timeline (1x is real time, 60x
+# plays an hour per minute) or as fast as possible, and a detector thread consumes
+# them from a queue.
+#
+# The latency of an event is the time from its release by the feeder to the end of its
+# processing by the detector, so it includes the time spent waiting in the queue. The
+# report gives the latency percentiles and the throughput in events per second.
+#
+# `LiveDetector` applies a live version of the one-vehicle rule: a car that enters
+# while the user's anchor car is still inside is a violation, otherwise it becomes the
+# new anchor. Exits are processed before entries of the same minute, since arriving the
+# minute the anchor leaves is not an overlap.
+#
+# This is NOT the same rule as the batch detection (`detection.flag_sorted`), which
+# walks each user's stays in order of leave time, i.e. knowing when every car leaves.
+# Live, only the order of entries is known, so the anchor is the car that entered
+# first. Both can flag different stays, and even a different number of them: with
+# stays 8:00-18:00, 9:00-10:00 and 11:00-12:00, the batch rule flags the first one and
+# the live rule the other two. The replay measures latency and throughput; the reports
+# come from the batch detection.
+
+
+# Event kinds; exits sort before entries of the same minute
+EXIT: int = 0
+ENTRY: int = 1
+
+
+class LiveDetector:
+    """Flags entries as they happen, keeping only each user's current anchor.
+
+    The anchor is the car that entered first, so the flags can differ from the
+    batch detection of `detection.flag_sorted` (see the module comment).
+
+    Attributes:
+        anchors (Dict[str, int]): For every user with a car inside, the
+            transaction id of the anchor car.
+        violations (int): Number of entries flagged so far.
+    """
+
+    def __init__(self) -> None:
+        """Initializes a detector with nobody parked."""
+        self.anchors: Dict[str, int] = {}
+        self.violations = 0
+
+    def on_event(self, kind: int, user_key: str, transaction_id: int) -> bool:
+        """Processes one gate event and returns whether it is a violation."""
+        if kind == EXIT:
+            # Only the anchor leaving frees the user; a violating car never anchors
+            if self.anchors.get(user_key) == transaction_id:
+                del self.anchors[user_key]
+            return False
+
+        if user_key in self.anchors:
+            self.violations += 1
+            return True
+        self.anchors[user_key] = transaction_id
+        return False
+
+
+def build_events(keyed: pd.DataFrame) -> pd.DataFrame:
+    """Turns keyed transactions into time-ordered entry and exit events.
+
+    Args:
+        keyed: Transactions with the "Transaction Id", "User Key",
+            "Calendar Visit Time" and "Calendar Leave Time" columns.
+
+    Returns:
+        A Data Frame with the columns "Minute", "Kind", "User Key" and
+        "Transaction Id", sorted by minute (exits first within a minute).
+    """
+    timed = keyed.dropna(subset=["Calendar Visit Time", "Calendar Leave Time"])
+    events = pd.DataFrame(
+        {
+            "Minute": np.concatenate(
+                [timed["Calendar Visit Time"], timed["Calendar Leave Time"]]
+            ),
+            "Kind": np.repeat([ENTRY, EXIT], len(timed)),
+            "User Key": np.tile(timed["User Key"].astype(str).to_numpy(), 2),
+            "Transaction Id": np.tile(timed["Transaction Id"].to_numpy(), 2),
+        }
+    )
+    return events.sort_values(["Minute", "Kind"], kind="stable", ignore_index=True)
+
+
+def replay(
+    events: pd.DataFrame,
+    speedup: Optional[float] = None,
+    queue_size: int = 10_000,
+) -> Tuple[np.ndarray, float, LiveDetector]:
+    """Feeds the events to a `LiveDetector` and measures every event's latency.
+
+    Args:
+        events: Events from `build_events`.
+        speedup: How many times faster than the original timeline the events
+            are released (e.g. 1 to 10000), or None for as fast as possible.
+        queue_size: Capacity of the queue between feeder and detector. A full
+            queue blocks the feeder, like a gate controller would back off.
+
+    Returns:
+        The latency of every event in seconds, the wall time of the whole
+        replay in seconds, and the detector (with its violation count).
+    """
+    minutes = events["Minute"].to_numpy(dtype="float64")
+    kinds = events["Kind"].to_numpy()
+    users = events["User Key"].to_numpy()
+    ids = events["Transaction Id"].to_numpy()
+
+    detector = LiveDetector()
+    latencies = np.empty(len(events))
+    pending: "queue.Queue[Optional[Tuple[int, float]]]" = queue.Queue(queue_size)
+
+    def consume() -> None:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            position, released = item
+            detector.on_event(kinds[position], users[position], ids[position])
+            latencies[position] = time.perf_counter() - released
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    start = time.perf_counter()
+    consumer.start()
+
+    first_minute = minutes[0] if len(minutes) else 0.0
+    for position in range(len(events)):
+        if speedup is not None:
+            # Wait until the event is due on the sped-up timeline
+            due = start + (minutes[position] - first_minute) * 60 / speedup
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        pending.put((position, time.perf_counter()))
+
+    pending.put(None)
+    consumer.join()
+    return latencies, time.perf_counter() - start, detector
+
+
+def latency_report(latencies: np.ndarray, wall_time: float) -> pd.Series:
+    """Summarizes a replay: latency percentiles (in microseconds) and throughput.
+
+    An empty replay reports zeros.
+    """
+    percentiles = (
+        np.percentile(latencies, [50, 90, 99, 99.9]) * 1e6
+        if len(latencies)
+        else np.zeros(4)
+    )
+    return pd.Series(
+        {
+            "Events": len(latencies),
+            "Throughput (events/s)": len(latencies) / wall_time if wall_time else 0,
+            "p50 (us)": percentiles[0],
+            "p90 (us)": percentiles[1],
+            "p99 (us)": percentiles[2],
+            "p99.9 (us)": percentiles[3],
+            "Max (us)": latencies.max() * 1e6 if len(latencies) else 0,
+        }
+    )
+
+
+# ===================================================================================
+# Usage: python replay.py [speed-up, e.g. 1 to 10000, or "max"] [number of events]
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+    import sys
+
+    from detection import detect
+    from registry import read_keyed
+
+    speedup = None if len(sys.argv) < 2 or sys.argv[1] == "max" else float(sys.argv[1])
+    path_of_read = os.getcwd() + "/data/"
+
+    keyed = read_keyed(path_of_read)
+    events = build_events(keyed)
+    if len(sys.argv) > 2:
+        events = events.head(int(sys.argv[2]))
+
+    latencies, wall_time, detector = replay(events, speedup)
+    print(f"Speed-up: {'as fast as possible' if speedup is None else f'{speedup:g}x'}")
+    print(f"Violations flagged live = {detector.violations}")
+    print(f"Violations of the batch detection = {int(detect(keyed)[0].sum())}")
+    print(latency_report(latencies, wall_time).round(1).to_string())
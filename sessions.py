@@ -0,0 +1,108 @@
+import pandas as pd
+
+
+# ===================================================================================
+# MODULE PURPOSE: Merge split visits of the same plate into one parking session
+# ===================================================================================
+
+# The LPR system often logs one real stay as two transactions: an exit and a re-entry
+# a few minutes apart, or a move from the Garage to the Reserved Nest. The greedy
+# detector treats those as separate anchors. Sessionization merges, for every plate,
+# consecutive transactions separated by less than a gap into a single session, so
+# detection runs on real stays and has fewer intervals to process.
+#
+# Everything is vectorized: the transactions are sorted by (plate, visit time), a new
+# session starts where the plate changes or where the visit starts at least `gap`
+# minutes after every earlier transaction of the plate has ended, and a cumulative
+# sum of those starts numbers the sessions.
+#
+# Gaps and durations are measured on the calendar times (see `calendar_minutes` in
+# absolute_time.py): the minute scale of `abs_time` makes every month 31 days long,
+# which inflates a session crossing the end of a shorter month by days.
+
+
+# Default gap (in minutes) below which two transactions are one session
+SESSION_GAP: int = 15
+
+
+def sessionize(transactions: pd.DataFrame, gap: float = SESSION_GAP) -> pd.DataFrame:
+    """Merges each plate's transactions separated by less than `gap` minutes.
+
+    A session keeps the columns of its first transaction, except the end
+    date/time, "Absolute Leave Time" and "Calendar Leave Time", which come from
+    the transaction that leaves last, and "Visit Duration (minutes)", which spans
+    the whole session. Transactions without times are kept as they are.
+
+    Args:
+        transactions: Transactions with the "Vehicle License Plate" column and
+            the absolute and calendar visit and leave times (see
+            `absolute_time.add_absolute_times` and `add_calendar_times`).
+        gap: Minutes between the end of a transaction and the start of the next
+            one below which both are merged.
+
+    Returns:
+        One row per session with an additional "Merged Transactions" column (the
+        number of transactions in the session), in the original order of the
+        first transaction of every session, with a fresh 0-based index.
+    """
+    has_times = (
+        transactions["Calendar Visit Time"].notna()
+        & transactions["Calendar Leave Time"].notna()
+    )
+    timed = transactions[has_times]
+    ordered = timed.assign(
+        **{"Vehicle License Plate": timed["Vehicle License Plate"].astype(str)}
+    ).sort_values(["Vehicle License Plate", "Calendar Visit Time"], kind="stable")
+
+    plate = ordered["Vehicle License Plate"]
+    new_plate = plate != plate.shift()
+
+    # Latest leave time of all the earlier transactions of the same plate
+    previous_end = (
+        ordered.groupby(plate, sort=False)["Calendar Leave Time"].cummax().shift()
+    )
+    new_session = new_plate | (ordered["Calendar Visit Time"] - previous_end >= gap)
+    session = new_session.cumsum()
+
+    # Groups are listed in order of first appearance, i.e. in the order of `first`
+    sessions = ordered.groupby(session, sort=False)
+    first = ordered[new_session.to_numpy()]
+    last = ordered.loc[sessions["Calendar Leave Time"].idxmax().to_numpy()]
+
+    # The end of a session is the end of the transaction that leaves last
+    end_columns = [
+        "Visit End Date (local)",
+        "Visit End Time (local)",
+        "Absolute Leave Time",
+        "Calendar Leave Time",
+    ]
+    merged = first.assign(**{column: last[column].to_numpy() for column in end_columns})
+    merged["Visit Duration (minutes)"] = (
+        merged["Calendar Leave Time"] - merged["Calendar Visit Time"]
+    )
+    merged["Merged Transactions"] = sessions.size().to_numpy()
+
+    # Keep the original order of the transactions (by the first one of every session)
+    untimed = transactions[~has_times].assign(**{"Merged Transactions": 1})
+    return pd.concat([merged, untimed]).sort_index().reset_index(drop=True)
+
+
+# ===================================================================================
+# Usage: python sessions.py [gap in minutes]
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+    import sys
+
+    from detection import detect
+    from registry import read_keyed
+
+    gap = float(sys.argv[1]) if len(sys.argv) > 1 else SESSION_GAP
+    path_of_read = os.getcwd() + "/data/"
+    keyed = read_keyed(path_of_read)
+    sessions = sessionize(keyed, gap)
+
+    before, _ = detect(keyed)
+    after, _ = detect(sessions)
+    print(f"Transactions = {len(keyed)}, violations = {int(before.sum())}")
+    print(f"Sessions     = {len(sessions)}, violations = {int(after.sum())}")
@@ -0,0 +1,165 @@
+from typing import Dict, List, Set, Tuple  # Used for static typing to reduce errors
+
+import heapq
+
+import pandas as pd
+
+from registry import (
+    key_transactions,
+    plate_owners,
+)  # Vectorized registry of users, plates and their transactions
+
+
+# ===================================================================================
+# MODULE PURPOSE: Detect accounts that share plates to game two subscriptions
+# ===================================================================================
+
+# Catch.py only notices shared plates at registration time (`plate_to_emails`), and the
+# transactions of a shared plate are given to one of its emails at random; the other
+# accounts never see them. Here every transaction is attributed to every account that
+# owns its plate, and accounts that share at least one plate are "linked".
+#
+# A household gaming two subscriptions shows up as two linked accounts whose own
+# plates (each registered to only one of the two accounts) are parked at the same
+# time. Those overlaps are found with one sweep over the combined stream sorted by
+# calendar visit time (which includes the year, so stays of different years never
+# meet), keeping a min-heap of parked cars (by leave time) per account. Every
+# arriving car is only compared with the cars still parked under its linked accounts,
+# never with every other account.
+
+
+# Number of simultaneous stays from which a pair of accounts is reported
+MIN_OVERLAPS: int = 3
+
+
+def linked_accounts(owners: pd.Series) -> Dict[str, Set[str]]:
+    """Links every account to the other accounts it shares a plate with.
+
+    Args:
+        owners: The plate to user key mapping from `plate_owners(..., all_owners=True)`.
+
+    Returns:
+        For every account sharing a plate, the set of accounts it shares with.
+    """
+    links: Dict[str, Set[str]] = {}
+    for _, keys in owners.groupby(level=0):
+        if len(keys) < 2:
+            continue
+        for key in keys:
+            links.setdefault(key, set()).update(k for k in keys if k != key)
+    return links
+
+
+def shared_plate_overlaps(
+    keyed: pd.DataFrame, owners: pd.Series, min_overlaps: int = MIN_OVERLAPS
+) -> pd.DataFrame:
+    """Finds linked accounts whose own plates were parked at the same time.
+
+    Args:
+        keyed: Transactions attributed to every owning account, from
+            `key_transactions(transaction_data, owners)`.
+        owners: The plate to user key mapping from `plate_owners(..., all_owners=True)`.
+        min_overlaps: Minimum number of simultaneous stays to report a pair.
+
+    Returns:
+        One row per reported pair of accounts with the columns "Account A",
+        "Account B", "Shared Plates", "Simultaneous Stays" and "Overlap Minutes",
+        the most suspicious pairs first.
+    """
+    links = linked_accounts(owners)
+    plates_of: Dict[str, Set[str]] = {}
+    for plate, key in owners.items():
+        plates_of.setdefault(key, set()).add(str(plate))
+
+    # Only transactions of linked accounts matter; each physical stay is
+    # attributed to every owning account.
+    stream = keyed[keyed["User Key"].isin(links)].dropna(
+        subset=["Calendar Visit Time", "Calendar Leave Time"]
+    )
+    stream = stream.sort_values("Calendar Visit Time", kind="stable")
+
+    # Per account: min-heap of (leave time, plate) of the cars currently parked
+    parked: Dict[str, List[Tuple[float, str]]] = {key: [] for key in links}
+    stays: Dict[Tuple[str, str], int] = {}
+    minutes: Dict[Tuple[str, str], float] = {}
+
+    for key, plate, visit, leave in zip(
+        stream["User Key"],
+        stream["Vehicle License Plate"],
+        stream["Calendar Visit Time"],
+        stream["Calendar Leave Time"],
+    ):
+        # Only a plate registered to this account alone can be "its own" car
+        if all(plate not in plates_of[other] for other in links[key]):
+            for other in links[key]:
+                heap = parked[other]
+
+                # Drop the cars that left before this one arrived
+                while heap and heap[0][0] <= visit:
+                    heapq.heappop(heap)
+
+                for other_leave, other_plate in heap:
+                    # The other car must be the other account's own plate
+                    if other_plate in plates_of[key]:
+                        continue
+                    pair = (key, other) if key < other else (other, key)
+                    stays[pair] = stays.get(pair, 0) + 1
+                    minutes[pair] = minutes.get(pair, 0.0) + (
+                        min(leave, other_leave) - visit
+                    )
+
+        heapq.heappush(parked[key], (leave, plate))
+
+    records = [
+        {
+            "Account A": pair[0],
+            "Account B": pair[1],
+            "Shared Plates": ", ".join(sorted(plates_of[pair[0]] & plates_of[pair[1]])),
+            "Simultaneous Stays": count,
+            "Overlap Minutes": int(minutes[pair]),
+        }
+        for pair, count in stays.items()
+        if count >= min_overlaps
+    ]
+    columns = [
+        "Account A",
+        "Account B",
+        "Shared Plates",
+        "Simultaneous Stays",
+        "Overlap Minutes",
+    ]
+    return (
+        pd.DataFrame(records, columns=columns)
+        .sort_values(["Simultaneous Stays", "Overlap Minutes"], ascending=False)
+        .reset_index(drop=True)
+    )
+
+
+# ===================================================================================
+# Usage: python sharing.py [minimum simultaneous stays]
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+    import sys
+
+    from detection import detect
+    from ingest import read_subscriptions, read_transactions
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+
+    owners = plate_owners(read_subscriptions(path_of_read), all_owners=True)
+    keyed = key_transactions(read_transactions(path_of_read), owners)
+
+    # Per-account detection, now including the stays of shared plates
+    violation, _ = detect(keyed)
+    print(f"Violations with every owner attributed = {int(violation.sum())}")
+
+    report = shared_plate_overlaps(
+        keyed, owners, int(sys.argv[1]) if len(sys.argv) > 1 else MIN_OVERLAPS
+    )
+    print(f"Linked account pairs reported = {len(report)}")
+
+    os.makedirs(path_of_write, exist_ok=True)
+    report.to_excel(path_of_write + "Shared Plate Report.xlsx", index=False)
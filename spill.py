@@ -0,0 +1,156 @@
+from typing import List, Optional, Tuple  # Used for static typing to reduce errors
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from detection import detect  # Greedy overlap detection over keyed transactions
+from external_sort import (
+    RUN_COLUMNS,
+    RUN_ROWS,
+    keyed_chunks,
+)  # Chunked reading of keyed transactions
+
+
+# ===================================================================================
+# MODULE PURPOSE: Group transactions by user through hash-partitioned spill files
+# ===================================================================================
+
+# Section 2 of Catch.py groups every transaction under its user in memory. As an
+# alternative to a global (external) sort, the transactions can be spilled to N files
+# on disk by a hash of their (resolved) user key. All the transactions of a user land
+# in the same file, so every partition can be loaded, sorted and checked on its own:
+# peak memory is the size of one partition, and the partitions are natural units of
+# work for parallel execution.
+#
+# The hash is `pd.util.hash_pandas_object`, which is vectorized and, unlike Python's
+# `hash()`, gives the same value in every process and every run.
+
+
+# Default number of spill files
+PARTITIONS: int = 16
+
+
+def partition_of(user_keys: pd.Series, partitions: int) -> np.ndarray:
+    """Returns the spill partition (0 to partitions - 1) of every user key."""
+    hashes = pd.util.hash_pandas_object(user_keys.astype(str), index=False)
+    return (hashes.to_numpy() % np.uint64(partitions)).astype("int64")
+
+
+def spill_transactions(
+    transactions_path: str,
+    owners: pd.Series,
+    spill_dir: str,
+    partitions: int = PARTITIONS,
+    chunk_rows: int = RUN_ROWS,
+) -> List[str]:
+    """Writes the keyed transactions of an export into hash-partitioned files.
+
+    Args:
+        transactions_path: Path to the UTF-16 transaction export.
+        owners: The plate to user key mapping, from `registry.plate_owners` or
+            `identity.resolve_identities`.
+        spill_dir: Directory receiving the partition files.
+        partitions: Number of partition files.
+        chunk_rows: Number of rows of the export held in memory at once.
+
+    Returns:
+        The paths of the partition files that received transactions.
+    """
+    paths = [
+        os.path.join(spill_dir, f"partition_{number:04d}.csv")
+        for number in range(partitions)
+    ]
+    written = [False] * partitions
+
+    for keyed in keyed_chunks(transactions_path, owners, chunk_rows):
+        numbers = partition_of(keyed["User Key"], partitions)
+        for number, rows in keyed[RUN_COLUMNS].groupby(numbers, sort=False):
+            # Rows are appended in file order, which keeps ties stable later
+            rows.to_csv(
+                paths[number],
+                mode="a",
+                header=not written[number],
+                index=False,
+                encoding="utf-8",
+            )
+            written[number] = True
+
+    return [path for path, used in zip(paths, written) if used]
+
+
+def detect_partition_file(partition_path: str) -> pd.DataFrame:
+    """Loads one partition, sorts it and returns its violating transactions."""
+    partition = pd.read_csv(
+        partition_path, encoding="utf-8", dtype={"User Key": str}, low_memory=False
+    )
+    violation, _ = detect(partition)
+    return partition[violation.to_numpy()]
+
+
+def spill_detect(
+    transactions_path: str,
+    owners: pd.Series,
+    partitions: int = PARTITIONS,
+    workers: int = 1,
+    spill_dir: Optional[str] = None,
+) -> Tuple[pd.DataFrame, int]:
+    """Groups an export through spill files and checks every partition.
+
+    Args:
+        transactions_path: Path to the UTF-16 transaction export.
+        owners: The plate to user key mapping.
+        partitions: Number of partition files.
+        workers: Number of processes checking partitions in parallel.
+        spill_dir: Directory for the spill files; a temporary directory by
+            default. The files are removed afterwards.
+
+    Returns:
+        The violating transactions of every partition, and the number of
+        partition files used.
+    """
+    with tempfile.TemporaryDirectory(dir=spill_dir) as temporary_dir:
+        paths = spill_transactions(transactions_path, owners, temporary_dir, partitions)
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(detect_partition_file, paths))
+        else:
+            results = [detect_partition_file(path) for path in paths]
+
+    if not results:
+        return pd.DataFrame(columns=RUN_COLUMNS), 0
+    violations = pd.concat(results, ignore_index=True)
+    return violations.sort_values("Transaction Id", ignore_index=True), len(paths)
+
+
+# ===================================================================================
+# Usage: python spill.py [partitions] [workers]
+# ===================================================================================
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from ingest import find_export, read_subscriptions
+    from registry import plate_owners
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+    os.makedirs(path_of_write, exist_ok=True)
+
+    start = time.perf_counter()
+    violations, used = spill_detect(
+        find_export(path_of_read, "transaction_data.csv"),
+        plate_owners(read_subscriptions(path_of_read)),
+        int(sys.argv[1]) if len(sys.argv) > 1 else PARTITIONS,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+    )
+    violations.to_csv(path_of_write + "Spilled Violations.csv", index=False)
+    print(
+        f"{len(violations)} violations found in {used} partitions"
+        f" in {time.perf_counter() - start:.2f}s"
+    )
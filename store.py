@@ -0,0 +1,316 @@
+from typing import List, Optional, Tuple  # Used for static typing to reduce errors
+
+import os
+import sqlite3
+
+import pandas as pd
+
+from absolute_time import (
+    calendar_minutes,
+)  # Converts time and date columns into minutes on the real calendar
+from ingest import read_subscriptions, read_transactions  # Reads the UTF-16 exports
+from registry import (
+    key_transactions,
+    plate_owners,
+    user_table,
+)  # Vectorized registry of users, plates and their transactions
+
+
+# ===================================================================================
+# MODULE PURPOSE: Optional persistent SQLite store of users, plates and transactions
+# ===================================================================================
+
+# Answering a question about the data with Catch.py means re-reading and re-processing
+# every export. This module loads the exports once into a local SQLite file so that
+# ad-hoc questions ("all violations for this email in March") are answered by an
+# indexed query in milliseconds.
+#
+# Usage:
+#   python store.py build [database]                     load data/ into the database
+#   python store.py violations EMAIL [FROM] [TO] [database]
+#       FROM/TO are dates such as 3/1/2025 and bound the visit start (inclusive)
+
+
+# Default location of the database file
+DEFAULT_DATABASE: str = "parking.sqlite3"
+
+# Stored in `PRAGMA user_version` by `load`. Bump it whenever the meaning of a stored
+# column changes, so a database built by an older version is rebuilt before use.
+# Version 2: visit_minute and leave_minute are calendar minutes (minutes since
+# 1/1/1970, see `absolute_time.calendar_minutes`) instead of the year-less scale.
+STORE_VERSION: int = 2
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS users (
+    user_key     TEXT PRIMARY KEY,
+    first        TEXT,
+    last         TEXT,
+    email        TEXT,
+    phone_number INTEGER,
+    user_id      INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS plates (
+    plate    TEXT NOT NULL,
+    user_key TEXT NOT NULL REFERENCES users (user_key),
+    PRIMARY KEY (plate, user_key)
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id           INTEGER PRIMARY KEY,
+    user_key     TEXT NOT NULL REFERENCES users (user_key),
+    plate        TEXT NOT NULL,
+    site         TEXT,
+    visit_date   TEXT,
+    visit_time   TEXT,
+    end_date     TEXT,
+    end_time     TEXT,
+    duration     REAL,
+    user_id      INTEGER,
+    visit_minute INTEGER NOT NULL,
+    leave_minute INTEGER NOT NULL,
+    violation    INTEGER NOT NULL DEFAULT 0
+);
+
+-- Walking a user's transactions in leave order (detection)
+CREATE INDEX IF NOT EXISTS transactions_user_leave
+    ON transactions (user_key, leave_minute);
+
+-- Looking up the visits of a plate in a time range
+CREATE INDEX IF NOT EXISTS transactions_plate_visit
+    ON transactions (plate, visit_minute);
+"""
+
+# Detection written as a single recursive query.
+#
+# It is the same greedy algorithm as Section 4 of Catch.py: each user's transactions
+# are walked in order of leave time, carrying the leave time of the current anchor.
+# A transaction that arrives before the anchor has left is a violation, otherwise it
+# becomes the new anchor. Every step finds the next transaction with one seek on the
+# (user_key, leave_minute) index (the rowid `id` breaks ties in insertion order).
+DETECTION_QUERY: str = """
+WITH RECURSIVE walk (id, user_key, leave_minute, anchor_leave, violation) AS (
+    SELECT t.id, t.user_key, t.leave_minute, t.leave_minute, 0
+    FROM (SELECT DISTINCT user_key FROM transactions) AS u
+    JOIN transactions AS t ON t.id = (
+        SELECT id FROM transactions
+        WHERE user_key = u.user_key
+        ORDER BY leave_minute, id
+        LIMIT 1
+    )
+
+    UNION ALL
+
+    SELECT
+        t.id,
+        t.user_key,
+        t.leave_minute,
+        CASE WHEN t.visit_minute < w.anchor_leave THEN w.anchor_leave
+             ELSE t.leave_minute END,
+        t.visit_minute < w.anchor_leave
+    FROM walk AS w
+    JOIN transactions AS t ON t.id = (
+        SELECT id FROM transactions
+        WHERE user_key = w.user_key
+          AND (leave_minute, id) > (w.leave_minute, w.id)
+        ORDER BY leave_minute, id
+        LIMIT 1
+    )
+)
+SELECT id FROM walk WHERE violation
+"""
+
+
+class TransactionStore:
+    """A local SQLite database holding users, plates and transactions.
+
+    Attributes:
+        connection (sqlite3.Connection): The open database connection.
+    """
+
+    def __init__(self, database: str = DEFAULT_DATABASE) -> None:
+        """Opens (and creates if needed) the database file."""
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        self.connection.close()
+
+    def load(
+        self,
+        enterprise_subscription_data: pd.DataFrame,
+        transaction_data: pd.DataFrame,
+    ) -> int:
+        """Replaces the content of the store with the given (filtered) exports.
+
+        Every table is bulk-inserted with `executemany` inside one transaction,
+        so a failed load leaves the previous content untouched.
+
+        Args:
+            enterprise_subscription_data: The filtered subscription data.
+            transaction_data: The filtered transaction data.
+
+        Returns:
+            The number of transactions stored.
+        """
+        owners = plate_owners(enterprise_subscription_data)
+        users = user_table(enterprise_subscription_data)
+        keyed = key_transactions(transaction_data, owners)
+
+        # Rows whose times can not be parsed can not be placed on the timeline
+        keyed = keyed.dropna(subset=["Calendar Visit Time", "Calendar Leave Time"])
+
+        # The User Id is only found in the transaction data: take the first one seen
+        first_ids = keyed.drop_duplicates("User Key").set_index("User Key")["User Id"]
+        users["User Id"] = users["User Key"].map(first_ids)
+
+        user_rows = [
+            (key, first, last, email, _to_int(phone), _to_int(user_id))
+            for key, first, last, email, phone, user_id in users[
+                ["User Key", "First", "Last", "Email", "Phone Number", "User Id"]
+            ].itertuples(index=False, name=None)
+        ]
+        plate_rows = list(owners.items())
+        transaction_rows = list(
+            zip(
+                keyed["User Key"],
+                keyed["Vehicle License Plate"],
+                keyed["Site Internal Name"],
+                keyed["Visit Start Date (local)"],
+                keyed["Visit Start Time (local)"],
+                keyed["Visit End Date (local)"],
+                keyed["Visit End Time (local)"],
+                keyed["Visit Duration (minutes)"].astype(float),
+                keyed["User Id"].map(_to_int),
+                keyed["Calendar Visit Time"].astype(int),
+                keyed["Calendar Leave Time"].astype(int),
+            )
+        )
+
+        with self.connection:
+            self.connection.execute("DELETE FROM transactions")
+            self.connection.execute("DELETE FROM plates")
+            self.connection.execute("DELETE FROM users")
+            self.connection.executemany(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)", user_rows
+            )
+            self.connection.executemany("INSERT INTO plates VALUES (?, ?)", plate_rows)
+            self.connection.executemany(
+                "INSERT INTO transactions (user_key, plate, site, visit_date,"
+                " visit_time, end_date, end_time, duration, user_id, visit_minute,"
+                " leave_minute) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                transaction_rows,
+            )
+            self.connection.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        return len(transaction_rows)
+
+    def detect_violations(self) -> int:
+        """Runs the detection query and stores the result in `violation`.
+
+        Returns:
+            The number of transactions flagged as a violation.
+        """
+        with self.connection:
+            violators = self.connection.execute(DETECTION_QUERY).fetchall()
+            self.connection.execute("UPDATE transactions SET violation = 0")
+            self.connection.executemany(
+                "UPDATE transactions SET violation = 1 WHERE id = ?", violators
+            )
+        return len(violators)
+
+    def violations(
+        self,
+        user_key: str,
+        start_minute: Optional[int] = None,
+        end_minute: Optional[int] = None,
+    ) -> List[Tuple]:
+        """Lists the flagged transactions of one user.
+
+        Args:
+            user_key: The user's email (or plate for users without an email).
+            start_minute: Only visits starting at or after this calendar minute.
+            end_minute: Only visits starting before this calendar minute.
+
+        Returns:
+            (plate, site, visit date, visit time, end date, end time) tuples
+            in order of visit.
+
+        Raises:
+            ValueError: If the database was not built by this version of `load`.
+        """
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != STORE_VERSION:
+            raise ValueError(
+                "The database was built by another version: run python store.py build"
+            )
+        query = (
+            "SELECT plate, site, visit_date, visit_time, end_date, end_time"
+            " FROM transactions WHERE user_key = ? AND violation"
+        )
+        parameters: List = [user_key]
+        if start_minute is not None:
+            query += " AND visit_minute >= ?"
+            parameters.append(start_minute)
+        if end_minute is not None:
+            query += " AND visit_minute < ?"
+            parameters.append(end_minute)
+        query += " ORDER BY visit_minute"
+        return self.connection.execute(query, parameters).fetchall()
+
+
+def _to_int(value) -> Optional[int]:
+    """Converts a (possibly missing) pandas value into an int or None."""
+    return None if pd.isna(value) else int(value)
+
+
+def _day_bounds(first_date: str, last_date: str) -> Tuple[int, int]:
+    """Converts an inclusive date range into [start, end) calendar minutes."""
+    start, end = calendar_minutes(
+        pd.Series(["12:00 AM", "12:00 AM"]), pd.Series([first_date, last_date])
+    )
+    if pd.isna(start) or pd.isna(end):
+        raise ValueError(f"Invalid date range: {first_date} to {last_date}")
+    return int(start), int(end) + 1440
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+
+    if command == "build":
+        database = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_DATABASE
+        path_of_read = os.getcwd() + "/data/"
+
+        start = time.perf_counter()
+        store = TransactionStore(database)
+        stored = store.load(
+            read_subscriptions(path_of_read), read_transactions(path_of_read)
+        )
+        flagged = store.detect_violations()
+        store.close()
+        print(
+            f"Stored {stored} transactions ({flagged} violations) in {database}"
+            f" in {time.perf_counter() - start:.2f}s"
+        )
+
+    elif command == "violations":
+        email = sys.argv[2]
+        bounds = _day_bounds(sys.argv[3], sys.argv[4]) if len(sys.argv) > 4 else None
+        database = sys.argv[5] if len(sys.argv) > 5 else DEFAULT_DATABASE
+
+        store = TransactionStore(database)
+        start = time.perf_counter()
+        rows = store.violations(email, *bounds) if bounds else store.violations(email)
+        elapsed = time.perf_counter() - start
+        store.close()
+
+        for row in rows:
+            print(" | ".join(str(value) for value in row))
+        print(f"{len(rows)} violations found in {elapsed * 1000:.1f}ms")
+
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
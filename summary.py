@@ -0,0 +1,117 @@
+from typing import List, Optional  # Used for static typing to reduce errors
+
+import os
+
+import pandas as pd
+
+from columnar import (
+    read_columnar,
+    write_columnar,
+)  # Parquet when pyarrow is installed, otherwise compressed numpy arrays
+from detection import overlap_minutes  # Overlap of each violation with its anchor
+
+
+# ===================================================================================
+# MODULE PURPOSE: Pre-aggregate the flagged transactions into a daily summary cube
+# ===================================================================================
+
+# Management reports (violations per day, per user, per site) used to be built by hand
+# from "Final Report.xlsx". After detection, one groupby reduces the transactions to a
+# small table keyed by (user, day, site) holding:
+#   Visits              number of transactions
+#   Parked Minutes      total duration of the transactions
+#   Violations          number of violating transactions
+#   Overlap Minutes     total minutes the violations overlap their anchor
+#
+# Both durations are differences of the calendar times (see `calendar_minutes` in
+# absolute_time.py). The minute scale of `abs_time` makes every month 31 days long,
+# so a stay over the end of February would count three extra days.
+#
+# The cube is stored in a columnar format (see columnar.py) so dashboards and monthly
+# rollups only read the columns they need.
+
+
+# Key and value columns of the summary cube
+SUMMARY_KEYS: List[str] = ["User Key", "Day", "Site"]
+SUMMARY_VALUES: List[str] = [
+    "Visits",
+    "Parked Minutes",
+    "Violations",
+    "Overlap Minutes",
+]
+
+# File name of the cube in the output directory (without the extension)
+SUMMARY_NAME: str = "Daily Summary"
+
+
+def daily_summary(
+    keyed: pd.DataFrame, violation: pd.Series, overlap: Optional[pd.Series] = None
+) -> pd.DataFrame:
+    """Aggregates flagged transactions by (user, day, site).
+
+    The day is the local date the visit started.
+
+    Args:
+        keyed: Transactions with the "User Key", "Site Internal Name",
+            "Visit Start Date (local)", "Calendar Visit Time" and
+            "Calendar Leave Time" columns.
+        violation: The violation flags aligned with `keyed`.
+        overlap: The overlap of every violation with its anchor, aligned with
+            `keyed`. Give it when some anchors are not in `keyed` (e.g. only a
+            date range is summarized); by default it is computed from `keyed`
+            with `detection.overlap_minutes`.
+
+    Returns:
+        One row per (user, day, site) with the `SUMMARY_VALUES` columns.
+    """
+    flagged = violation.fillna(False).astype(bool)
+    frame = pd.DataFrame(
+        {
+            "User Key": keyed["User Key"].astype(str),
+            "Day": pd.to_datetime(
+                keyed["Visit Start Date (local)"], format="%m/%d/%Y", errors="coerce"
+            ),
+            "Site": keyed["Site Internal Name"].astype(str),
+            "Visits": 1,
+            "Parked Minutes": (
+                keyed["Calendar Leave Time"] - keyed["Calendar Visit Time"]
+            ).fillna(0),
+            "Violations": flagged.astype("int64"),
+            "Overlap Minutes": (
+                overlap_minutes(keyed, flagged) if overlap is None else overlap
+            ),
+        }
+    )
+    return frame.groupby(SUMMARY_KEYS, as_index=False, sort=True)[SUMMARY_VALUES].sum()
+
+
+def write_summary(cube: pd.DataFrame, path_of_write: str) -> str:
+    """Writes the summary cube in a columnar format and returns its path."""
+    return write_columnar(cube, os.path.join(path_of_write, SUMMARY_NAME))
+
+
+def read_summary(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Reads a summary cube written by `write_summary`, optionally only some columns."""
+    return read_columnar(path, columns)
+
+
+# ===================================================================================
+# Usage: python summary.py   (writes output/Daily Summary.parquet or .npz)
+# ===================================================================================
+if __name__ == "__main__":
+    from detection import detect
+    from registry import read_keyed
+
+    path = os.getcwd()
+    path_of_read = path + "/data/"
+    path_of_write = path + "/output/"
+    os.makedirs(path_of_write, exist_ok=True)
+
+    keyed = read_keyed(path_of_read)
+    violation, _ = detect(keyed)
+    summary_path = write_summary(daily_summary(keyed, violation), path_of_write)
+
+    cube = read_summary(summary_path)
+    print(f"{len(keyed)} transactions summarized into {len(cube)} rows")
+    print(f"Written to {summary_path} ({os.path.getsize(summary_path) / 1e3:.1f} kB)")
+    print(cube.groupby("Site")[SUMMARY_VALUES].sum().to_string())
@@ -0,0 +1,45 @@
+from typing import Callable, List, Tuple  # Used for static typing to reduce errors
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The modules live at the top of the repository, next to Catch.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from absolute_time import (  # noqa: E402
+    add_absolute_times,
+    add_calendar_times,
+)  # Adds the minute scales the detection works on
+
+# A stay as (user key, plate, visit start "M/D/YYYY H:MM AM", visit end, duration)
+Stay = Tuple[str, str, str, str, int]
+
+
+@pytest.fixture
+def transactions() -> Callable[[List[Stay]], pd.DataFrame]:
+    """Builds keyed transactions (with both minute scales) from a list of stays."""
+
+    def build(stays: List[Stay]) -> pd.DataFrame:
+        rows = []
+        for key, plate, start, end, duration in stays:
+            start_date, start_time = start.split(" ", 1)
+            end_date, end_time = end.split(" ", 1)
+            rows.append(
+                {
+                    "User Key": key,
+                    "Vehicle License Plate": plate,
+                    "Visit Start Date (local)": start_date,
+                    "Visit Start Time (local)": start_time,
+                    "Visit End Date (local)": end_date,
+                    "Visit End Time (local)": end_time,
+                    "Visit Duration (minutes)": duration,
+                    "Site Internal Name": "Kellogg Square Garage (Minneapolis",
+                }
+            )
+        frame = pd.DataFrame(rows).assign(**{"Transaction Id": range(len(rows))})
+        return add_calendar_times(add_absolute_times(frame))
+
+    return build
@@ -0,0 +1,72 @@
+import pytest
+
+from checkpoint import STAGES, Checkpoints
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    paths = []
+    for name in ["transaction_data.csv", "enterprise_subscription_data.csv"]:
+        path = tmp_path / name
+        path.write_text("header\nrow\n")
+        paths.append(str(path))
+    return paths
+
+
+def checkpoints(tmp_path, inputs, grace=0):
+    return Checkpoints(
+        str(tmp_path / ".checkpoints"),
+        inputs,
+        {"ingest": {"from": None}, "detection": {"grace": grace}},
+    )
+
+
+def test_round_trip_and_resume(tmp_path, inputs):
+    saved = checkpoints(tmp_path, inputs)
+    assert saved.resume() == (0, {})
+
+    saved.save("ingest", {"rows": 1})
+    saved.save("registry", {"rows": 1, "plates": ["P1"]})
+    assert saved.load("ingest") == {"rows": 1}
+    assert saved.load("grouping") is None
+    assert checkpoints(tmp_path, inputs).resume() == (2, {"rows": 1, "plates": ["P1"]})
+
+
+def test_options_only_change_their_stage_and_the_later_ones(tmp_path, inputs):
+    before = checkpoints(tmp_path, inputs, grace=0)
+    after = checkpoints(tmp_path, inputs, grace=15)
+    for stage in STAGES:
+        assert (before.key(stage) == after.key(stage)) == (stage != "detection")
+
+    before.save("grouping", {"stage": "grouping"})
+    before.save("detection", {"stage": "detection"})
+    assert after.resume() == (3, {"stage": "grouping"})
+
+
+def test_a_new_export_invalidates_every_stage(tmp_path, inputs):
+    before = checkpoints(tmp_path, inputs)
+    before.save("ingest", {"rows": 1})
+
+    with open(inputs[0], "a") as export:
+        export.write("another row\n")
+    after = checkpoints(tmp_path, inputs)
+    assert all(before.key(stage) != after.key(stage) for stage in STAGES)
+    assert after.resume() == (0, {})
+
+
+def test_saving_removes_stale_checkpoints_of_the_stage(tmp_path, inputs):
+    checkpoints(tmp_path, inputs, grace=0).save("detection", {})
+    checkpoints(tmp_path, inputs, grace=15).save("detection", {})
+    checkpoints(tmp_path, inputs).save("ingest", {})
+
+    names = sorted(path.name for path in (tmp_path / ".checkpoints").iterdir())
+    assert [name.split(".")[0] for name in names] == ["detection", "ingest"]
+    assert not any(name.endswith(".partial") for name in names)
+
+
+def test_unreadable_checkpoints_are_ignored(tmp_path, inputs):
+    saved = checkpoints(tmp_path, inputs)
+    saved.save("ingest", {"rows": 1})
+    with open(saved._path("ingest"), "wb") as truncated:
+        truncated.write(b"\x80")
+    assert saved.load("ingest") is None
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from columnar import read_columnar, write_columnar
+from dataset import TransactionDataset, in_window
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "transaction_data.csv"
+    path.write_text("header\n")
+    return str(path)
+
+
+@pytest.fixture
+def rows():
+    # Out of date order, so a read has to restore the order of the export
+    return pd.DataFrame(
+        {
+            "Vehicle License Plate": ["P1", "P2", "P3", "P4", "P5"],
+            "Visit Start Date (local)": [
+                "3/2/2025",
+                "2/27/2025",
+                None,
+                "3/1/2025",
+                "4/1/2025",
+            ],
+            "Visit Duration (minutes)": [60, 120, 30, 45, 90],
+        }
+    )
+
+
+def test_build_and_read_everything(tmp_path, export, rows):
+    dataset = TransactionDataset(str(tmp_path / ".dataset"), export)
+    assert not dataset.is_current()
+    dataset.build(rows)
+    assert sorted(dataset.manifest["partitions"]) == [
+        "2025-02",
+        "2025-03",
+        "2025-04",
+        "unknown",
+    ]
+
+    reopened = TransactionDataset(str(tmp_path / ".dataset"), export)
+    assert reopened.is_current()
+    # Rows without a start date are only read without a range
+    pd.testing.assert_frame_equal(
+        reopened.read(), rows.drop(index=2).reset_index(drop=True), check_dtype=False
+    )
+
+
+def test_a_range_reads_only_its_months_in_export_order(tmp_path, export, rows):
+    dataset = TransactionDataset(str(tmp_path / ".dataset"), export)
+    dataset.build(rows)
+    start, end = pd.Timestamp("2025-02-28"), pd.Timestamp("2025-03-31")
+
+    assert dataset.months(start, end) == ["2025-02", "2025-03"]
+    selected = dataset.read(start, end)
+    assert selected["Vehicle License Plate"].tolist() == ["P1", "P4"]
+    assert selected.index.tolist() == [0, 1]
+    assert in_window(rows["Visit Start Date (local)"], start, end).tolist() == [
+        True,
+        False,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_a_changed_export_is_not_current(tmp_path, export, rows):
+    TransactionDataset(str(tmp_path / ".dataset"), export).build(rows)
+    with open(export, "a") as changed:
+        changed.write("row\n")
+    assert not TransactionDataset(str(tmp_path / ".dataset"), export).is_current()
+
+
+def test_columnar_round_trip_keeps_missing_values(tmp_path):
+    frame = pd.DataFrame(
+        {
+            "Text": ["a", None, "c"],
+            "Number": [1.5, np.nan, 3.0],
+            "Count": [1, 2, 3],
+        }
+    )
+    path = write_columnar(frame, str(tmp_path / "frame"))
+    read = read_columnar(path)
+    pd.testing.assert_frame_equal(read, frame, check_dtype=False)
+    assert read["Text"].isna().tolist() == [False, True, False]
+    assert read_columnar(path, ["Count"]).columns.tolist() == ["Count"]
@@ -0,0 +1,112 @@
+import pandas as pd
+
+from detection import (
+    attach_evidence,
+    detect,
+    detect_partition,
+    detect_partitioned,
+    grace_sweep,
+    overlap_minutes,
+    partition_labels,
+)
+
+
+def test_second_car_parked_during_a_stay_is_flagged(transactions):
+    keyed = transactions(
+        [
+            ("a@x.com", "P1", "3/1/2025 1:00 PM", "3/1/2025 3:00 PM", 120),
+            ("a@x.com", "P2", "3/1/2025 2:00 PM", "3/1/2025 4:00 PM", 120),
+            ("a@x.com", "P2", "3/1/2025 5:00 PM", "3/1/2025 6:00 PM", 60),
+        ]
+    )
+    violation, carry = detect(keyed)
+    assert violation.tolist() == [False, True, False]
+    assert carry == {"a@x.com": keyed["Calendar Leave Time"].iloc[2]}
+
+
+def test_users_are_independent(transactions):
+    keyed = transactions(
+        [
+            ("a@x.com", "P1", "3/1/2025 1:00 PM", "3/1/2025 3:00 PM", 120),
+            ("b@x.com", "P2", "3/1/2025 2:00 PM", "3/1/2025 4:00 PM", 120),
+        ]
+    )
+    violation, _ = detect(keyed)
+    assert not violation.any()
+
+
+def test_grace_tolerates_short_overlaps(transactions):
+    keyed = transactions(
+        [
+            ("a@x.com", "P1", "3/1/2025 1:00 PM", "3/1/2025 3:00 PM", 120),
+            ("a@x.com", "P2", "3/1/2025 2:50 PM", "3/1/2025 4:00 PM", 70),
+        ]
+    )
+    assert detect(keyed)[0].tolist() == [False, True]
+    assert detect(keyed, grace=15)[0].tolist() == [False, False]
+    assert grace_sweep(keyed, [0, 15])["Violations"].tolist() == [1, 0]
+
+
+def test_stays_of_different_years_do_not_overlap(transactions):
+    # Same day and time of the year: only the year tells them apart
+    keyed = transactions(
+        [
+            ("a@x.com", "P1", "3/1/2024 1:00 PM", "3/1/2024 3:00 PM", 120),
+            ("a@x.com", "P2", "3/1/2025 2:00 PM", "3/1/2025 4:00 PM", 120),
+        ]
+    )
+    assert not detect(keyed)[0].any()
+
+
+def test_overlap_across_new_year_is_flagged(transactions):
+    keyed = transactions(
+        [
+            ("a@x.com", "P1", "12/31/2024 10:00 PM", "1/1/2025 2:00 AM", 240),
+            ("a@x.com", "P2", "1/1/2025 1:00 AM", "1/1/2025 3:00 AM", 120),
+        ]
+    )
+    violation, _ = detect(keyed)
+    assert violation.tolist() == [False, True]
+    assert overlap_minutes(keyed, violation).tolist() == [0.0, 60.0]
+
+
+def test_evidence_names_the_anchor(transactions):
+    keyed = transactions(
+        [
+            ("a@x.com", "P1", "3/1/2025 1:00 PM", "3/1/2025 5:00 PM", 240),
+            ("a@x.com", "P2", "3/1/2025 2:00 PM", "3/1/2025 6:00 PM", 240),
+            ("a@x.com", "P3", "3/1/2025 4:30 PM", "3/1/2025 7:00 PM", 150),
+        ]
+    )
+    violation, _ = detect(keyed)
+    evidence = attach_evidence(keyed, violation)
+    assert evidence["Anchor Id"].tolist()[1:] == [0.0, 0.0]
+    assert evidence["Anchor Plate"].tolist()[1:] == ["P1", "P1"]
+    assert evidence.loc[2, "Anchor Visit End"] == "3/1/2025 5:00 PM"
+    assert pd.isna(evidence.loc[0, "Anchor Plate"])
+
+
+def test_partitioned_detection_matches_the_whole_history(transactions):
+    keyed = transactions(
+        [
+            ("a@x.com", "P1", "1/31/2025 8:00 PM", "2/1/2025 9:00 AM", 780),
+            ("a@x.com", "P2", "2/1/2025 8:00 AM", "2/1/2025 10:00 AM", 120),
+            ("a@x.com", "P1", "2/28/2025 11:00 PM", "3/1/2025 1:00 AM", 120),
+            ("a@x.com", "P2", "3/1/2025 12:30 AM", "3/1/2025 2:00 AM", 90),
+            ("b@x.com", "P3", "12/31/2024 11:00 PM", "1/1/2025 1:00 AM", 120),
+        ]
+    )
+    whole, _ = detect(keyed)
+    for period in ["month", "week"]:
+        partitioned, states = detect_partitioned(keyed, period)
+        assert partitioned.equals(whole)
+
+    # A partition recomputed from the state entering it gives the same flags
+    _, states = detect_partitioned(keyed, "month")
+    march = keyed[partition_labels(keyed, "month") == 2025 * 12 + 2]
+    violation, carry_next, changed = detect_partition(
+        march, states["2025-02"], states["2025-03"]
+    )
+    assert violation.tolist() == whole[march.index].tolist() == [False, True]
+    assert carry_next == states["2025-03"]
+    assert not changed
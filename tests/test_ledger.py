@@ -0,0 +1,79 @@
+import numpy as np
+
+from ledger import IDENTITY_COLUMNS, ViolationLedger
+
+DAY = np.datetime64("2025-03-02")
+
+
+def violations(transactions, duration=120):
+    return transactions(
+        [
+            ("a@x.com", "P1", "3/1/2025 1:30 PM", "3/1/2025 3:30 PM", duration),
+            ("b@x.com", "P2", "3/1/2025 2:00 PM", "3/1/2025 4:00 PM", 120),
+        ]
+    )
+
+
+def test_a_new_ledger_reports_everything(tmp_path, transactions):
+    ledger = ViolationLedger(str(tmp_path / "ledger.npz"))
+    new, changed, retracted = ledger.compare(violations(transactions))
+    assert len(new) == 2 and changed.empty and retracted.empty
+
+
+def test_new_changed_and_retracted(tmp_path, transactions):
+    path = str(tmp_path / "ledger.npz")
+    ViolationLedger(path).update(violations(transactions), today=DAY)
+
+    ledger = ViolationLedger(path)
+    assert len(ledger) == 2
+    current = violations(transactions, duration=125).iloc[[0]]
+    new, changed, retracted = ledger.compare(current)
+    assert new.empty
+    assert changed["User Key"].tolist() == ["a@x.com"]
+    assert retracted["User Key"].tolist() == ["b@x.com"]
+    assert retracted["Vehicle License Plate"].tolist() == ["P2"]
+    assert retracted["First Reported"].tolist() == [DAY]
+
+
+def test_spelling_does_not_change_the_hashes(tmp_path, transactions):
+    path = str(tmp_path / "ledger.npz")
+    ViolationLedger(path).update(violations(transactions), today=DAY)
+
+    # Another run parsed the durations as floats and kept the leading zeros
+    respelled = violations(transactions).astype({"Visit Duration (minutes)": float})
+    respelled["Visit Start Date (local)"] = "03/01/2025"
+    respelled["Visit Start Time (local)"] = ["01:30 PM", "02:00 PM"]
+    assert respelled["Visit Duration (minutes)"].astype(str).iloc[0] == "120.0"
+
+    new, changed, retracted = ViolationLedger(path).compare(respelled)
+    assert new.empty and changed.empty and retracted.empty
+
+
+def test_update_keeps_the_first_reported_day(tmp_path, transactions):
+    path = str(tmp_path / "ledger.npz")
+    ViolationLedger(path).update(violations(transactions).iloc[[0]], today=DAY)
+    ViolationLedger(path).update(
+        violations(transactions), today=np.datetime64("2025-03-09")
+    )
+
+    ledger = ViolationLedger(path)
+    first = dict(zip(ledger.identities["User Key"], ledger.first_reported))
+    assert first == {"a@x.com": DAY, "b@x.com": np.datetime64("2025-03-09")}
+
+
+def test_version_1_ledgers_are_hashed_again(tmp_path, transactions):
+    path = str(tmp_path / "ledger.npz")
+    identities = violations(transactions)[IDENTITY_COLUMNS].astype(str).to_numpy()
+    np.savez_compressed(
+        path,
+        keys=np.array([2, 1], dtype="uint64"),
+        details=np.array([7, 7], dtype="uint64"),
+        first_reported=np.array([DAY, DAY]),
+        identities=identities.astype("U"),
+    )
+
+    ledger = ViolationLedger(path)
+    assert np.all(np.diff(ledger.keys.astype(object)) > 0)
+    new, changed, retracted = ledger.compare(violations(transactions, duration=125))
+    # The details of version 1 are unknown, so nothing is reported as changed
+    assert new.empty and changed.empty and retracted.empty
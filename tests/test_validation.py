@@ -0,0 +1,71 @@
+import pandas as pd
+
+from validation import validate_transactions
+
+
+def export(*stays):
+    """Builds raw export rows from (start "M/D/YYYY H:MM AM", end, duration)."""
+    rows = []
+    for start, end, duration in stays:
+        start_date, start_time = start.split(" ", 1)
+        end_date, end_time = end.split(" ", 1) if end else (None, None)
+        rows.append(
+            {
+                "Vehicle License Plate": "P1",
+                "Visit Start Date (local)": start_date,
+                "Visit Start Time (local)": start_time,
+                "Visit End Date (local)": end_date,
+                "Visit End Time (local)": end_time,
+                "Visit Duration (minutes)": duration,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def reasons(*stays):
+    _, quarantined = validate_transactions(export(*stays))
+    return quarantined["Reason"].to_dict()
+
+
+def test_a_stay_over_new_year_is_valid():
+    valid, quarantined = validate_transactions(
+        export(("12/31/2024 10:00 PM", "1/1/2025 2:00 AM", 240))
+    )
+    assert len(valid) == 1 and quarantined.empty
+
+
+def test_malformed_starts_are_quarantined():
+    assert reasons(
+        ("3/1/2025 13:30 PM", "3/1/2025 3:00 PM", 90),
+        ("2/30/2025 1:00 PM", "3/1/2025 3:00 PM", 120),
+        ("3/1/2025 1:75 PM", "3/1/2025 3:00 PM", 120),
+    ) == {0: "BAD_START", 1: "BAD_START", 2: "BAD_START"}
+
+
+def test_ends_are_checked():
+    assert reasons(
+        ("3/1/2025 1:00 PM", None, 120),
+        ("3/1/2025 1:00 PM", "3/1/2025 25:00 PM", 120),
+        ("3/1/2025 1:00 PM", "3/1/2025 12:00 PM", 60),
+    ) == {0: "MISSING_END", 1: "BAD_END", 2: "END_BEFORE_START"}
+
+
+def test_duration_tolerance():
+    stays = [
+        ("3/1/2025 1:00 PM", "3/1/2025 3:00 PM", 122),
+        ("3/1/2025 1:00 PM", "3/1/2025 3:00 PM", 125),
+    ]
+    assert reasons(*stays) == {1: "DURATION_MISMATCH"}
+    valid, quarantined = validate_transactions(export(*stays), tolerance=5)
+    assert len(valid) == 2 and quarantined.empty
+
+
+def test_valid_rows_get_a_fresh_index():
+    valid, quarantined = validate_transactions(
+        export(
+            ("3/1/2025 1:00 PM", None, 120),
+            ("3/1/2025 1:00 PM", "3/1/2025 3:00 PM", 120),
+        )
+    )
+    assert valid.index.tolist() == [0]
+    assert quarantined.index.tolist() == [0]
@@ -0,0 +1,112 @@
+from typing import Tuple  # Used for static typing to reduce errors
+
+import numpy as np
+import pandas as pd
+
+from absolute_time import (
+    add_absolute_times,
+    add_calendar_times,
+)  # Vectorized conversion of time and date columns into the two minute scales
+
+
+# ===================================================================================
+# MODULE PURPOSE: Check every transaction in bulk and quarantine the bad ones
+# ===================================================================================
+
+# `abs_time` raises on any malformed time string, so a single bad row used to abort a
+# whole run. Instead, every row is checked up front with whole-column operations. Rows
+# that fail a check are moved to a quarantine file with a reason code and the run
+# continues with the remaining rows.
+#
+# Reason codes (a row can have several, separated by ";"):
+#   BAD_START          the visit start date/time can not be parsed
+#   MISSING_END        there is no visit end date/time (the car may still be inside)
+#   BAD_END            the visit end date/time can not be parsed
+#   END_BEFORE_START   the visit ends before it starts
+#   DURATION_MISMATCH  the duration computed from the times disagrees with
+#                      "Visit Duration (minutes)" by more than the tolerance
+#
+# Order and durations are checked on the calendar times (see `calendar_minutes`), which
+# include the year: a stay over New Year is valid and its duration is exact.
+
+
+# Minutes the computed duration may differ from "Visit Duration (minutes)"
+DURATION_TOLERANCE: float = 2.0
+
+
+def validate_transactions(
+    transaction_data: pd.DataFrame, tolerance: float = DURATION_TOLERANCE
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Splits the transactions into valid rows and quarantined rows.
+
+    The times are checked with the same parser the pipeline uses (see
+    `abs_minutes` and `calendar_minutes`).
+
+    Args:
+        transaction_data: The filtered transaction data.
+        tolerance: Minutes the computed duration may differ from the exported one.
+
+    Returns:
+        The valid rows (with a fresh 0-based index), and the quarantined rows
+        with an additional "Reason" column (keeping their original index).
+    """
+    timed = add_calendar_times(add_absolute_times(transaction_data))
+
+    missing_end = (
+        transaction_data["Visit End Date (local)"].isna()
+        | transaction_data["Visit End Time (local)"].isna()
+    )
+    bad_start = (
+        timed["Absolute Visit Time"].isna() | timed["Calendar Visit Time"].isna()
+    )
+    bad_end = ~missing_end & (
+        timed["Absolute Leave Time"].isna() | timed["Calendar Leave Time"].isna()
+    )
+
+    # Only meaningful when both ends could be parsed (NaN comparisons are False)
+    minutes = timed["Calendar Leave Time"] - timed["Calendar Visit Time"]
+    end_before_start = minutes < 0
+    exported = pd.to_numeric(
+        transaction_data["Visit Duration (minutes)"], errors="coerce"
+    )
+    duration_mismatch = (minutes >= 0) & ((minutes - exported).abs() > tolerance)
+
+    checks = {
+        "BAD_START": bad_start,
+        "MISSING_END": missing_end,
+        "BAD_END": bad_end,
+        "END_BEFORE_START": end_before_start,
+        "DURATION_MISMATCH": duration_mismatch,
+    }
+
+    # Build the ";"-separated reason of every row without a python loop over rows
+    reasons = pd.Series("", index=transaction_data.index, dtype="object")
+    for code, failed in checks.items():
+        failed = failed.fillna(False).to_numpy(dtype=bool)
+        reasons = reasons.where(
+            ~failed, reasons + np.where(reasons == "", "", ";") + code
+        )
+
+    bad = (reasons != "").to_numpy()
+    quarantined = transaction_data[bad].assign(Reason=reasons[bad])
+    valid = transaction_data[~bad].reset_index(drop=True)
+    return valid, quarantined
+
+
+# ===================================================================================
+# Usage: python validation.py   (writes output/Quarantine.csv)
+# ===================================================================================
+if __name__ == "__main__":
+    import os
+
+    from ingest import read_transactions
+
+    path = os.getcwd()
+    path_of_write = path + "/output/"
+    valid, quarantined = validate_transactions(read_transactions(path + "/data/"))
+
+    os.makedirs(path_of_write, exist_ok=True)
+    quarantined.to_csv(path_of_write + "Quarantine.csv", index=False)
+    print(f"Valid transactions = {len(valid)}")
+    print(f"Quarantined transactions = {len(quarantined)}")
+    print(quarantined["Reason"].str.split(";").explode().value_counts().to_string())
@@ -0,0 +1,257 @@
+from typing import Dict, Set  # Used for static typing to reduce errors
+
+import os
+import time
+
+import pandas as pd
+
+from detection import detect  # Greedy overlap detection over keyed transactions
+from ingest import (
+    CACHE_DIR_NAME,
+    TRANSACTION_COLUMNS,
+    file_fingerprint,
+    filter_subscriptions,
+    filter_transactions,
+    is_export,
+    read_export,
+)  # Helpers that read the UTF-16 exports into filtered data frames
+from registry import (
+    key_transactions,
+    plate_owners,
+)  # Vectorized registry of users, plates and their transactions
+
+
+# ===================================================================================
+# MODULE PURPOSE: Long-running daemon that processes exports as they land in data/
+# ===================================================================================
+
+# Rerunning Catch.py for every new export pays the full start-up and indexing cost.
+# The daemon instead polls the data directory and keeps everything resident:
+# - the plate index (which user owns each plate), rebuilt only when a subscription
+#   export changes
+# - the keyed transactions of every user, tagged with the file they came from
+# - the violation flags of every user
+#
+# Only files whose fingerprint changed are read. Only the users that appear in those
+# files are re-checked, and the violation report is rewritten right after.
+#
+# Files named `enterprise_subscription*` are subscription exports; every other export in
+# the directory is a transaction export. Exports may be compressed like the ones
+# `ingest.find_export` accepts (`*.csv`, `*.csv.gz`, `*.csv.xz`, `*.csv.zip`, `*.zip`).
+#
+# Usage: python watch.py [data directory] [output directory] [poll interval seconds]
+
+
+# Default number of seconds between two scans of the data directory
+POLL_INTERVAL: float = 2.0
+
+# Name of the report rewritten after every change
+REPORT_NAME: str = "Violations.csv"
+
+
+class WatchFolder:
+    """Watches a data directory and keeps the violation report up to date.
+
+    Attributes:
+        data_dir (str): The directory that is polled for exports.
+        output_dir (str): The directory the report is written to.
+        fingerprints (Dict[str, str]): Fingerprint of every ingested file.
+        owners (pd.Series): The plate index, mapping plates to user keys.
+        transactions (Dict[str, pd.DataFrame]): Filtered transactions per file.
+        users (Dict[str, pd.DataFrame]): Keyed transactions per user key, with
+            their "Violation" flags.
+    """
+
+    def __init__(self, data_dir: str, output_dir: str) -> None:
+        """Creates an empty daemon state; nothing is read until the first poll."""
+        self.data_dir = data_dir
+        self.output_dir = output_dir
+        self.fingerprints: Dict[str, str] = {}
+        self.owners: pd.Series = pd.Series(dtype="object")
+        self.transactions: Dict[str, pd.DataFrame] = {}
+        self.users: Dict[str, pd.DataFrame] = {}
+
+        # Files seen once with this fingerprint; ingested when it is seen again,
+        # so that an export which is still being copied is not read half-written.
+        self._pending: Dict[str, str] = {}
+
+    def poll_once(self) -> bool:
+        """Scans the data directory once and ingests new or changed files.
+
+        Returns:
+            True if anything changed and the report was rewritten.
+        """
+        current: Dict[str, str] = {}
+        for name in sorted(os.listdir(self.data_dir)):
+            file_path = os.path.join(self.data_dir, name)
+            if is_export(name) and os.path.isfile(file_path):
+                current[file_path] = file_fingerprint(file_path)
+
+        # Keep only the files that changed and have stopped changing
+        ready: Dict[str, str] = {}
+        for file_path, fingerprint in current.items():
+            if self.fingerprints.get(file_path) == fingerprint:
+                continue
+            if self._pending.get(file_path) == fingerprint:
+                ready[file_path] = fingerprint
+            else:
+                self._pending[file_path] = fingerprint
+        removed: Set[str] = set(self.fingerprints) - set(current)
+
+        if not ready and not removed:
+            return False
+
+        subscriptions_changed = False
+        touched_files: Set[str] = set(removed)
+        for file_path in removed:
+            del self.fingerprints[file_path]
+            if self._is_subscription(file_path):
+                subscriptions_changed = True
+            else:
+                self.transactions.pop(file_path, None)
+
+        for file_path, fingerprint in ready.items():
+            del self._pending[file_path]
+            self.fingerprints[file_path] = fingerprint
+            if self._is_subscription(file_path):
+                subscriptions_changed = True
+            else:
+                self.transactions[file_path] = filter_transactions(
+                    read_export(
+                        file_path,
+                        usecols=TRANSACTION_COLUMNS,
+                        cache_dir=os.path.join(self.data_dir, CACHE_DIR_NAME),
+                    )
+                )
+                touched_files.add(file_path)
+
+        if subscriptions_changed:
+            # A new registry can move any plate to another user: rebuild everything
+            self._load_subscriptions()
+            self._rebuild_users(set(self.transactions), everyone=True)
+        else:
+            self._rebuild_users(touched_files, everyone=False)
+
+        self._write_report()
+        return True
+
+    def run(self, interval: float = POLL_INTERVAL) -> None:
+        """Polls the data directory until interrupted with Ctrl+C."""
+        print(f"Watching {self.data_dir} (every {interval}s, Ctrl+C to stop)")
+        try:
+            while True:
+                start = time.perf_counter()
+                if self.poll_once():
+                    flagged = sum(
+                        int(t["Violation"].sum()) for t in self.users.values()
+                    )
+                    print(
+                        f"Report updated in {time.perf_counter() - start:.2f}s:"
+                        f" {len(self.users)} users, {flagged} violations"
+                    )
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+
+    def _is_subscription(self, file_path: str) -> bool:
+        """Tells subscription exports apart from transaction exports."""
+        return os.path.basename(file_path).startswith("enterprise_subscription")
+
+    def _load_subscriptions(self) -> None:
+        """Rebuilds the plate index from every subscription export present."""
+        frames = [
+            filter_subscriptions(
+                read_export(
+                    file_path, cache_dir=os.path.join(self.data_dir, CACHE_DIR_NAME)
+                )
+            )
+            for file_path in sorted(self.fingerprints)
+            if self._is_subscription(file_path)
+        ]
+        if frames:
+            self.owners = plate_owners(pd.concat(frames, ignore_index=True))
+        else:
+            self.owners = pd.Series(dtype="object")
+
+    def _rebuild_users(self, files: Set[str], everyone: bool) -> None:
+        """Re-keys the given files and re-runs detection for the users in them.
+
+        Args:
+            files: The transaction files whose rows changed (added or removed).
+            everyone: Drop all resident per-user state first (the plate index
+                changed, so previous keys can not be trusted).
+        """
+        if everyone:
+            affected = set(self.users)
+            self.users = {}
+        else:
+            # Users that had rows in the changed files lose those rows
+            affected = set()
+            for key, frame in self.users.items():
+                if frame["Source File"].isin(files).any():
+                    affected.add(key)
+                    self.users[key] = frame[~frame["Source File"].isin(files)]
+
+        # Key the new content of the changed files
+        new_rows = []
+        for file_path in files:
+            if file_path in self.transactions and not self.owners.empty:
+                keyed = key_transactions(self.transactions[file_path], self.owners)
+                new_rows.append(keyed.assign(**{"Source File": file_path}))
+
+        if new_rows:
+            keyed = pd.concat(new_rows, ignore_index=True)
+            for key, frame in keyed.groupby("User Key", sort=False):
+                affected.add(str(key))
+                if key in self.users:
+                    frame = pd.concat([self.users[key], frame], ignore_index=True)
+                self.users[str(key)] = frame
+
+        # Re-run detection for the affected users only
+        for key in affected:
+            frame = self.users.get(key)
+            if frame is None:
+                continue
+            if frame.empty:
+                del self.users[key]
+                continue
+            frame = frame.reset_index(drop=True)
+            violation, _ = detect(frame)
+            self.users[key] = frame.assign(Violation=violation)
+
+    def _write_report(self) -> None:
+        """Writes every flagged transaction to the report (atomically)."""
+        columns = [
+            "User Key",
+            "Vehicle License Plate",
+            "Site Internal Name",
+            "Visit Start Date (local)",
+            "Visit Start Time (local)",
+            "Visit End Date (local)",
+            "Visit End Time (local)",
+            "Visit Duration (minutes)",
+            "User Id",
+            "Source File",
+        ]
+        flagged = [frame[frame["Violation"]] for frame in self.users.values()]
+        report = (
+            pd.concat(flagged, ignore_index=True)[columns]
+            if flagged
+            else pd.DataFrame(columns=columns)
+        )
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_path = os.path.join(self.output_dir, REPORT_NAME)
+        report.to_csv(report_path + ".partial", index=False)
+        os.replace(report_path + ".partial", report_path)
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = os.getcwd()
+    watcher = WatchFolder(
+        sys.argv[1] if len(sys.argv) > 1 else path + "/data/",
+        sys.argv[2] if len(sys.argv) > 2 else path + "/output/",
+    )
+    watcher.run(float(sys.argv[3]) if len(sys.argv) > 3 else POLL_INTERVAL)